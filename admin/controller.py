@@ -0,0 +1,123 @@
+from fastapi import APIRouter
+from fastapi import HTTPException, Depends, Response, BackgroundTasks
+from user import utils as user_utils
+from office import utils as office_utils
+from config import security
+from helpers import upload_helper
+from jobs import utils as jobs_utils
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.config import get_db
+from config.config import pool_waits, replica_pool_waits
+from config.database import engine, replica_engine, pool_status
+import json
+
+router = APIRouter()
+
+
+@router.get('/db-pool')
+async def db_pool(user = Depends(security.get_authenticated_user)):
+    try:
+        if office_utils.role_name(user) not in ['admin', 'hr']:
+            raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
+
+        stats = pool_status(engine)
+        stats['waits'] = pool_waits.summary()
+        if replica_engine is not None:
+            stats['replica'] = pool_status(replica_engine)
+            stats['replica']['waits'] = replica_pool_waits.summary()
+
+        return Response(status_code=200, content=json.dumps(stats))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+
+@router.get('/caches')
+async def caches(user = Depends(security.get_authenticated_user)):
+    try:
+        if office_utils.role_name(user) not in ['admin', 'hr']:
+            raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
+
+        stats = {'users': user_utils.user_cache.stats(),
+                 'tokens': security.token_cache.stats(),
+                 'offices': office_utils.registry_stats()}
+
+        return Response(status_code=200, content=json.dumps(stats))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+
+@router.delete('/caches/tokens')
+async def purge_tokens(user = Depends(security.get_authenticated_user)):
+    try:
+        if office_utils.role_name(user) not in ['admin', 'hr']:
+            raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
+
+        security.purge_token()
+
+        return Response(status_code=200, content=json.dumps({'message':'Token cache cleared'}))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+
+@router.post('/storage/reap')
+async def reap_storage(background_tasks: BackgroundTasks, user = Depends(security.get_authenticated_user)):
+    try:
+        if office_utils.role_name(user) not in ['admin', 'hr']:
+            raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
+
+        running = upload_helper.reaper_lock.locked()
+        if not running:
+            background_tasks.add_task(upload_helper.reap_in_background)
+
+        return Response(status_code=202, content=json.dumps({'message':'Cleanup already running' if running else 'Cleanup started'}))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+
+@router.get('/storage/reap')
+async def storage_reap_report(user = Depends(security.get_authenticated_user)):
+    try:
+        if office_utils.role_name(user) not in ['admin', 'hr']:
+            raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
+
+        return Response(status_code=200, content=json.dumps({'running': upload_helper.reaper_lock.locked(),
+                                                             'last': upload_helper.last_reap}))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+
+@router.get('/jobs')
+async def job_queue(db: AsyncSession = Depends(get_db), user = Depends(security.get_authenticated_user)):
+    try:
+        if office_utils.role_name(user) not in ['admin', 'hr']:
+            raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
+
+        return Response(status_code=200, content=json.dumps(await jobs_utils.get_stats(db=db)))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+
+@router.post('/jobs/dead/{job_id}/retry')
+async def retry_dead_job(job_id: int, db: AsyncSession = Depends(get_db), user = Depends(security.get_authenticated_user)):
+    try:
+        if office_utils.role_name(user) not in ['admin', 'hr']:
+            raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
+
+        await jobs_utils.retry_dead(db=db, job_id=job_id)
+
+        return Response(status_code=200, content=json.dumps({'message':'Job queued again'}))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+
+@router.delete('/jobs/dead/{job_id}')
+async def drop_dead_job(job_id: int, db: AsyncSession = Depends(get_db), user = Depends(security.get_authenticated_user)):
+    try:
+        if office_utils.role_name(user) not in ['admin', 'hr']:
+            raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
+
+        await jobs_utils.drop_dead(db=db, job_id=job_id)
+
+        return Response(status_code=200, content=json.dumps({'message':'Job dropped'}))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
@@ -0,0 +1,128 @@
+"""Inbox and report latency against the database in DB_URI.
+
+Run it on a scratch database before and after `alembic upgrade head` to compare:
+
+    DB_URI=postgresql://... python benchmarks/inbox_and_reports.py --seed 100000
+    DB_URI=postgresql://... alembic stamp head
+    DB_URI=postgresql://... alembic downgrade base
+    DB_URI=postgresql://... python benchmarks/inbox_and_reports.py
+    DB_URI=postgresql://... alembic upgrade head
+    DB_URI=postgresql://... python benchmarks/inbox_and_reports.py
+
+--seed creates the tables (already keyed and indexed, hence the stamp before the
+downgrade) and fills them with synthetic staff and forms, never point it at a
+database holding real data.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, insert, func
+from sqlalchemy.orm import selectinload
+from config.database import Base, engine, SessionLocal
+from office.model import Office
+from user.model import User
+from message import model
+from message import utils as message_utils
+
+FORMS = {
+    model.Message: (model.message_recipients_association, 'message_id'),
+    model.EarlyClosure: (model.early_closure_recipients_association, 'early_closure_id'),
+}
+
+
+async def seed(forms: int, users: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    now = datetime.now()
+    async with SessionLocal() as db:
+        office_id = (await db.execute(insert(Office).values(name=f'bench-{now.timestamp()}', created_at=now, updated_at=now)
+                                      .returning(Office.id))).scalar()
+        user_ids = (await db.execute(insert(User).returning(User.id),
+                                     [{'first_name': 'bench', 'last_name': str(i), 'email': f'bench-{now.timestamp()}-{i}@example.com',
+                                       'password': 'x', 'role_id': office_id, 'created_at': now, 'updated_at': now}
+                                      for i in range(users)])).scalars().all()
+
+        for item, (association, parent) in FORMS.items():
+            for start in range(0, forms, 5000):
+                rows = []
+                for _ in range(min(5000, forms - start)):
+                    # spread over two years so a one week report is selective
+                    created_at = now - timedelta(minutes=random.randint(0, 2 * 365 * 24 * 60))
+                    row = {'sender_id': random.choice(user_ids), 'created_at': created_at, 'updated_at': created_at}
+                    if item is model.Message:
+                        row.update(label='bench', title='bench', status='pending')
+                    else:
+                        row.update(teacher_signature='bench')
+                    rows.append(row)
+                ids = (await db.execute(insert(item).returning(item.id, item.sender_id, item.created_at), rows)).all()
+                recipients = {id: random.sample(user_ids, 3) for id, _, _ in ids}
+                await db.execute(insert(association),
+                                 [{parent: id, 'recipient_id': recipient, 'created_at': now, 'updated_at': now}
+                                  for id, _, _ in ids for recipient in recipients[id]])
+                kind = message_utils.MAILBOX_KINDS[item]
+                await db.execute(insert(model.MailboxEntry),
+                                 [{'user_id': sender_id, 'box': 'outbox', 'kind': kind, 'ref_id': id, 'created_at': created_at, 'status': 'sent'}
+                                  for id, sender_id, created_at in ids] +
+                                 [{'user_id': recipient, 'box': 'inbox', 'kind': kind, 'ref_id': id, 'created_at': created_at, 'status': 'pending'}
+                                  for id, _, created_at in ids for recipient in recipients[id]])
+        await db.commit()
+    print(f'seeded {forms} messages and {forms} early closures across {users} users')
+
+
+async def timed(runs: int, query):
+    samples = []
+    for _ in range(runs):
+        async with SessionLocal() as db:
+            started = time.perf_counter()
+            await query(db)
+            samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000, samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000
+
+
+async def main(args):
+    if args.seed:
+        await seed(args.seed, args.users)
+
+    async with SessionLocal() as db:
+        # the busiest recipient, so the inbox has something to page through
+        user_id = args.user_id or (await db.execute(
+            select(model.message_recipients_association.c.recipient_id)
+            .group_by(model.message_recipients_association.c.recipient_id)
+            .order_by(func.count().desc()).limit(1))).scalar()
+
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=7)
+
+    async def inbox(db):
+        await message_utils.get_mailbox(db=db, user_id=user_id, box='inbox')
+
+    async def outbox(db):
+        await message_utils.get_mailbox(db=db, user_id=user_id, box='outbox')
+
+    async def report(db):
+        query = select(model.Message).options(selectinload(model.Message.recipients)).where(model.Message.created_at >= start_date, model.Message.created_at <= end_date)
+        (await db.execute(query)).scalars().all()
+
+    for name, query in (('inbox', inbox), ('outbox', outbox), ('one week report', report)):
+        p50, p95 = await timed(args.runs, query)
+        print(f'{name:<16} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms')
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help='insert this many messages and early closures first')
+    parser.add_argument('--users', type=int, default=500, help='staff to spread the seeded forms over')
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--user-id', type=int, default=None, help='whose inbox to read, the busiest recipient by default')
+    asyncio.run(main(parser.parse_args()))
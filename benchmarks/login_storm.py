@@ -0,0 +1,104 @@
+"""Logins per second, and how much a login storm slows every other request.
+
+Runs the app in process against the database in DB_URI, creates --users staff
+with a known password, then fires --concurrency parallel logins for --seconds
+while one client requests GET / every 10ms and records its latency:
+
+    DB_URI=postgresql://... python benchmarks/login_storm.py
+    DB_URI=postgresql://... HASH_POOL=process python benchmarks/login_storm.py
+    DB_URI=postgresql://... python benchmarks/login_storm.py --inline
+
+--inline verifies passwords on the event loop, the way login used to.
+Creates its own users, never point it at a database holding real data.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import insert, select
+from main import app
+from config import security
+from config.database import Base, engine, SessionLocal
+from office.model import Office
+from user.model import User
+
+PASSWORD = 'login-storm'
+
+
+async def seed(users: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    stamp = datetime.now().timestamp()
+    hashed = security.hash_string(PASSWORD)
+    async with SessionLocal() as db:
+        office_id = (await db.execute(select(Office.id).where(Office.name == 'staff'))).scalar()
+        if office_id is None:
+            office_id = (await db.execute(insert(Office).values(name='staff').returning(Office.id))).scalar()
+        emails = [f'storm-{stamp}-{i}@example.com' for i in range(users)]
+        await db.execute(insert(User), [{'first_name': 'storm', 'last_name': str(i), 'email': email, 'phone': f'storm-{stamp}-{i}',
+                                         'password': hashed, 'role_id': office_id} for i, email in enumerate(emails)])
+        await db.commit()
+    return emails
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000 if samples else 0.0
+
+
+async def main(args):
+    if args.inline:
+        async def verify_inline(plain_text, hashed_password):
+            return security.verify_and_update_hash(plain_text, hashed_password)
+        security.verify_password = verify_inline
+
+    emails = await seed(args.users)
+    transport = httpx.ASGITransport(app=app)
+    deadline = time.perf_counter() + args.seconds
+    logins, probes = [], []
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def storm(worker):
+            i = worker
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.post('/user/login/', json={'email': emails[i % len(emails)], 'password': PASSWORD})
+                response.raise_for_status()
+                logins.append(time.perf_counter() - started)
+                i += args.concurrency
+
+        async def probe():
+            # one request every 10ms, timed from when it was due so time spent
+            # waiting for a blocked event loop counts too
+            due = time.perf_counter()
+            while due < deadline:
+                await asyncio.sleep(max(0, due - time.perf_counter()))
+                (await client.get('/')).raise_for_status()
+                probes.append(time.perf_counter() - due)
+                due += 0.01
+
+        started = time.perf_counter()
+        await asyncio.gather(probe(), *(storm(worker) for worker in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    mode = 'inline' if args.inline else f'{security.HASH_POOL} pool x{security.HASH_WORKERS}'
+    print(f'{mode}, {security.PASSWORD_HASH_ROUNDS} rounds, {args.concurrency} concurrent logins for {elapsed:.1f}s')
+    print(f'logins/sec        {len(logins) / elapsed:8.1f}   login p50 {percentile(logins, 0.5):8.2f} ms   p99 {percentile(logins, 0.99):8.2f} ms')
+    print(f'other requests    {len(probes):8d}   p50 {percentile(probes, 0.5):8.2f} ms   p99 {percentile(probes, 0.99):8.2f} ms')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--inline', action='store_true', help='verify on the event loop, for comparison')
+    asyncio.run(main(parser.parse_args()))
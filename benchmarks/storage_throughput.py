@@ -0,0 +1,81 @@
+"""Upload throughput of the storage drivers, fed the way /messages/upload-document/
+feeds them: from a spooled temporary file, several uploads at once.
+
+    python benchmarks/storage_throughput.py --driver local
+    SPACE_NAME=... SPACE_ENDPOINT=... SPACE_KEY=... SPACE_SECRET=... \\
+        python benchmarks/storage_throughput.py --driver s3
+
+Point the s3 run at a scratch bucket, the uploaded objects are deleted afterwards.
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.storage import LocalStorage, S3Storage
+
+
+def spooled(size: int):
+    # what starlette's UploadFile holds: in memory up to 1MB, then on disk
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    chunk = os.urandom(1024 * 1024)
+    for start in range(0, size, len(chunk)):
+        spool.write(chunk[:min(len(chunk), size - start)])
+    spool.seek(0)
+    return spool
+
+
+async def main(args):
+    if args.driver == 'local':
+        root = tempfile.mkdtemp(prefix='storage-bench-')
+        storage = LocalStorage(root=root, base_url='/bench')
+    else:
+        storage = S3Storage()
+
+    size = int(args.size_mb * 1024 * 1024)
+    run = uuid.uuid4().hex[:8]
+    keys = [f'bench-{run}/{i}' for i in range(args.files)]
+    files = [spooled(size) for _ in keys]
+
+    # ticks of a 1ms timer while uploading, a blocked event loop shows up as missed ticks
+    ticks = 0
+    done = asyncio.Event()
+    async def ticker():
+        nonlocal ticks
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            ticks += 1
+
+    semaphore = asyncio.Semaphore(args.parallel)
+    async def upload(key, fileobj):
+        async with semaphore:
+            await storage.put(key, fileobj, content_type='application/octet-stream')
+
+    timer = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(key, fileobj) for key, fileobj in zip(keys, files)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await timer
+
+    total_mb = size * len(keys) / 1024 / 1024
+    print(f'{args.driver}: {len(keys)} x {args.size_mb} MB, {args.parallel} at a time')
+    print(f'{total_mb / elapsed:8.1f} MB/s   {elapsed:6.2f} s   event loop ticks {ticks} of ~{int(elapsed * 1000)}')
+
+    await storage.delete(keys)
+    for fileobj in files:
+        fileobj.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--driver', choices=('local', 's3'), default='local')
+    parser.add_argument('--files', type=int, default=16)
+    parser.add_argument('--size-mb', type=float, default=20)
+    parser.add_argument('--parallel', type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""Repeat-heavy upload workload through do_upload, the way /messages/upload-document/
+stores documents, compared with writing every upload as a new object.
+
+    DB_URI=postgresql://... STORAGE_BACKEND=local STORAGE_LOCAL_ROOT=/tmp/bench-uploads \\
+        python benchmarks/upload_dedup.py
+    DB_URI=postgresql://... SPACE_NAME=... SPACE_ENDPOINT=... SPACE_KEY=... SPACE_SECRET=... \\
+        python benchmarks/upload_dedup.py
+
+--distinct files are each sent --repeat times, like one PDF shared with several
+offices. Adds rows to stored_objects, never point it at a database holding real data.
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.datastructures import UploadFile, Headers
+import main  # noqa: F401, imports every model so the mappers resolve
+from config.database import engine, SessionLocal
+from helpers.storage import get_storage
+from helpers.upload_helper import do_upload, upload_key
+from message.model import StoredObject
+
+
+def upload_file(content: bytes):
+    # what the form parser hands the endpoint: in memory up to 1MB, then on disk
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spool.write(content)
+    spool.seek(0)
+    return UploadFile(spool, filename='bench.pdf', headers=Headers({'content-type': 'application/pdf'}))
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(StoredObject.__table__.create, checkfirst=True)
+
+    size = int(args.size_mb * 1024 * 1024)
+    # random per run so the first send of each file really is new
+    contents = [os.urandom(size) for _ in range(args.distinct)]
+    sends = contents * args.repeat
+    random.shuffle(sends)
+    storage = get_storage()
+
+    started = time.perf_counter()
+    plain_keys = []
+    for content in sends:
+        key = upload_key('bench.pdf', f'bench-{uuid.uuid4().hex[:8]}')
+        await storage.put(key, upload_file(content).file, content_type='application/pdf')
+        plain_keys.append(key)
+    plain = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for content in sends:
+        async with SessionLocal() as db:
+            await do_upload(db, upload_file(content))
+            await db.commit()
+    deduplicated = time.perf_counter() - started
+
+    total_mb = size * len(sends) / 1024 / 1024
+    stored_mb = size * args.distinct / 1024 / 1024
+    print(f'{len(sends)} uploads of {args.size_mb} MB, {args.distinct} distinct files')
+    print(f'new object each time   {plain * 1000 / len(sends):8.2f} ms/upload   {total_mb:8.1f} MB stored')
+    print(f'content addressed      {deduplicated * 1000 / len(sends):8.2f} ms/upload   {stored_mb:8.1f} MB stored')
+
+    await storage.delete(plain_keys)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--distinct', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--size-mb', type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -1,9 +1,130 @@
-from config.database import SessionLocal
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from config.database import SessionLocal, ReadSessionLocal, replica_engine
 
+# how long a client's reads stay on the primary after it wrote something,
+# long enough to cover replication lag
+READ_AFTER_WRITE_SECONDS = float(os.environ.get("DB_READ_AFTER_WRITE_SECONDS", 5))
 
-def get_db():
-    db = SessionLocal()
+
+class PoolWaits:
+    # how long requests waited for a pooled connection, over the last `window` checkouts
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.timeouts = 0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def summary(self):
+        recent = sorted(self.samples)
+        if not recent:
+            return {'checkouts': self.count, 'timeouts': self.timeouts}
+
+        return {'checkouts': self.count,
+                'timeouts': self.timeouts,
+                'avg_ms': round(sum(recent) / len(recent) * 1000, 3),
+                'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 3),
+                'max_ms': round(self.max * 1000, 3)}
+
+
+pool_waits = PoolWaits()
+replica_pool_waits = PoolWaits()
+
+# user id of the writer -> time of their last write, kept per worker; keyed by
+# user rather than token so every session of the same user sees its own writes
+last_writes = {}
+
+
+@event.listens_for(Session, 'after_flush')
+def _flagged_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _flagged_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+def request_user_id(request: Request):
+    # id in the request's bearer token, None without a valid one. The session is picked
+    # before the endpoint's auth dependency runs, so the token is checked here as well
+    # (served from security.token_cache once verified); security imports this module
+    from config import security
+
+    token = request.headers.get('authorization')
+    if not token:
+        return None
     try:
+        return security.verify_access_token(token, ValueError('invalid token')).id
+    except Exception:
+        return None
+
+
+def record_write(request: Request):
+    writer = request_user_id(request)
+    if writer is None:
+        return
+
+    now = time.monotonic()
+    if len(last_writes) > 1024:
+        for key, at in list(last_writes.items()):
+            if now - at > READ_AFTER_WRITE_SECONDS:
+                del last_writes[key]
+    last_writes[writer] = now
+
+
+def wrote_recently(request: Request):
+    writer = request_user_id(request)
+    at = last_writes.get(writer) if writer is not None else None
+    return at is not None and time.monotonic() - at < READ_AFTER_WRITE_SECONDS
+
+
+async def checkout(db, waits: PoolWaits):
+    started = time.perf_counter()
+    try:
+        await db.connection()
+    except PoolTimeoutError:
+        waits.timeouts += 1
+        raise
+    waits.record(time.perf_counter() - started)
+
+
+async def get_db(request: Request):
+    async with SessionLocal() as db:
+        await checkout(db, pool_waits)
+
+        yield db
+
+        if db.info.get('wrote'):
+            record_write(request)
+
+
+@asynccontextmanager
+async def read_session(request: Request):
+    # read-only work goes to the replica, except right after the same client wrote
+    if replica_engine is None or wrote_recently(request):
+        async with SessionLocal() as db:
+            await checkout(db, pool_waits)
+            yield db
+        return
+
+    async with ReadSessionLocal() as db:
+        await checkout(db, replica_pool_waits)
+        yield db
+
+
+async def get_read_db(request: Request):
+    async with read_session(request) as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -1,15 +1,77 @@
 import os
+from uuid import uuid4
 from dotenv import load_dotenv, find_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
 
 load_dotenv(find_dotenv())
 
 SQLALCHEMY_DATABASE_URL = os.environ.get("DB_URI")
+# optional read replica for the read-only endpoints, same pool settings as the primary
+SQLALCHEMY_REPLICA_URL = os.environ.get("DB_REPLICA_URI")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# pool settings, sized per worker process
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+# 'session' (default), 'transaction' when behind pgbouncer/supavisor in transaction mode,
+# or 'null' to open a fresh connection per checkout and leave pooling to the external pooler
+DB_POOL_MODE = os.environ.get("DB_POOL_MODE", "session").lower()
 
-Base = declarative_base()
+
+def async_url(url: str):
+    # DB_URI is shared with alembic (psycopg2), the app itself talks to postgres through asyncpg
+    url = make_url(url)
+    if url.drivername in ('postgresql', 'postgresql+psycopg2'):
+        url = url.set(drivername='postgresql+asyncpg')
+    return url
+
+
+def engine_options():
+    if DB_POOL_MODE == 'null':
+        options = {'poolclass': NullPool}
+    else:
+        options = {'pool_size': DB_POOL_SIZE,
+                   'max_overflow': DB_MAX_OVERFLOW,
+                   'pool_timeout': DB_POOL_TIMEOUT,
+                   'pool_recycle': DB_POOL_RECYCLE}
+    options['pool_pre_ping'] = DB_POOL_PRE_PING
+
+    if DB_POOL_MODE in ('transaction', 'null'):
+        # a transaction pooler hands each transaction to any server connection,
+        # so named prepared statements can't be cached between them
+        options['connect_args'] = {'statement_cache_size': 0,
+                                   'prepared_statement_cache_size': 0,
+                                   'prepared_statement_name_func': lambda: f'__asyncpg_{uuid4()}__'}
+    return options
+
+
+def pool_status(engine):
+    pool = engine.pool
+    if isinstance(pool, NullPool):
+        return {'mode': DB_POOL_MODE, 'pooled': False}
+
+    return {'mode': DB_POOL_MODE,
+            'pooled': True,
+            'size': pool.size(),
+            'max_overflow': DB_MAX_OVERFLOW,
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'timeout': DB_POOL_TIMEOUT,
+            'recycle': DB_POOL_RECYCLE,
+            'pre_ping': DB_POOL_PRE_PING}
+
+
+engine = create_async_engine(async_url(SQLALCHEMY_DATABASE_URL), **engine_options())
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+replica_engine = create_async_engine(async_url(SQLALCHEMY_REPLICA_URL), **engine_options()) if SQLALCHEMY_REPLICA_URL else None
+ReadSessionLocal = async_sessionmaker(bind=replica_engine or engine, autoflush=False, expire_on_commit=False)
+
+Base = declarative_base(cls=AsyncAttrs)
@@ -1,26 +1,89 @@
 import os
-from passlib.hash import pbkdf2_sha256
+import asyncio
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from passlib.context import CryptContext
 from jose import jwt, JWTError
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from user import schema
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, status, HTTPException
-from config.config import get_db
+from config.config import get_db, get_read_db
 from user import utils
+from helpers.cache import TTLCache
 
 SECRET_KEY = os.environ.get("SECRET_KEY")
 ACCESS_TOKEN_EXPIRE_MINUTES = os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES")
+# refresh tokens trade for new access tokens without the password, each is used once
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", 7))
+
+# pbkdf2 rounds for new hashes, stored hashes with fewer are upgraded at the next login
+PASSWORD_HASH_ROUNDS = int(os.environ.get("PASSWORD_HASH_ROUNDS", 29000))
+# hashing runs off the event loop on a pool of HASH_WORKERS threads (hashlib releases
+# the GIL for pbkdf2) or processes
+HASH_POOL = os.environ.get("HASH_POOL", "thread").lower()
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", os.cpu_count() or 1))
+# verified token claims kept per worker until the token expires, 0 turns the cache off
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 4096))
+# browsers' EventSource can't set headers, so GET /messages/events also takes a
+# stream token in the url; it only opens event streams and only for this long,
+# what ends up in access logs is of no use afterwards
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.environ.get("STREAM_TOKEN_EXPIRE_SECONDS", 60))
+STREAM_TOKEN_SCOPE = 'events'
+
+password_context = CryptContext(schemes=['pbkdf2_sha256'],
+                                pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+                                pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS)
 
 oauthSchema = OAuth2PasswordBearer(tokenUrl='user/login')
+# clients that can set headers open event streams with their access token
+optionalOauthSchema = OAuth2PasswordBearer(tokenUrl='user/login', auto_error=False)
+
+_hash_pool = None
+
+# sha256 of the token -> its TokenData, each entry expires with the token's exp
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=int(ACCESS_TOKEN_EXPIRE_MINUTES or 60) * 60)
 
 def hash_string(plain_text: str) -> str:
-    return pbkdf2_sha256.hash(plain_text)
+    return password_context.hash(plain_text)
 
 
 def verify_hash(plain_text, hashed_password):
-    return pbkdf2_sha256.verify(plain_text, hashed_password)
+    return password_context.verify(plain_text, hashed_password)
+
+
+def verify_and_update_hash(plain_text, hashed_password):
+    # (matches, new hash when the stored one was made with outdated settings else None)
+    return password_context.verify_and_update(plain_text, hashed_password)
+
+
+def hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        if HASH_POOL == 'process':
+            _hash_pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        else:
+            _hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='hash')
+    return _hash_pool
+
+
+async def run_hashing(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(hash_pool(), function, *args)
+
+
+async def hash_password(plain_text: str) -> str:
+    return await run_hashing(hash_string, plain_text)
+
+
+async def hash_strings(plain_texts: list) -> list:
+    # a batch is spread over the whole pool
+    return await asyncio.gather(*(hash_password(plain_text) for plain_text in plain_texts))
+
+
+async def verify_password(plain_text, hashed_password):
+    return await run_hashing(verify_and_update_hash, plain_text, hashed_password)
 
 
 def generate_access_token(data: dict):
@@ -32,16 +95,43 @@ def generate_access_token(data: dict):
 
 
 
+def generate_stream_token(user_id):
+    expire = datetime.now(timezone.utc) + timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    return jwt.encode({'user_id': user_id, 'scope': STREAM_TOKEN_SCOPE, 'exp': expire}, SECRET_KEY)
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.replace('Bearer ','').encode()).hexdigest()
+
+
+def purge_token(token: str = None):
+    # drops one token's cached claims, or every token's when none is given
+    # (e.g. after SECRET_KEY changes)
+    if token is None:
+        token_cache.clear()
+    else:
+        token_cache.pop(token_key(token))
+
+
 def verify_access_token(token: str, exception):
+    key = token_key(token)
+    token_data = token_cache.get(key)
+    if token_data is not None:
+        return token_data
+
     try:
         token = token.replace('Bearer ','')
         payload = jwt.decode(token, SECRET_KEY)
         id: str = payload.get('user_id')
-        if id is None:
+        # scoped tokens (stream tokens) are not access tokens
+        if id is None or payload.get('scope') is not None:
             raise exception
         token_data = schema.TokenData(id=id)
     except JWTError:
         raise exception
+
+    if payload.get('exp') is not None:
+        token_cache.set(key, token_data, expires_at=payload['exp'])
     return token_data
 
 
@@ -49,3 +139,39 @@ def get_current_user(token: str = Depends(oauthSchema)):
     exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"could not verify cred", headers={"WWW-Authenticate": "Bearer"})
     token_data = verify_access_token(token, exception)
     return token_data
+
+
+def verify_stream_token(token: str, exception):
+    try:
+        payload = jwt.decode(token, SECRET_KEY)
+    except JWTError:
+        raise exception
+    if payload.get('scope') != STREAM_TOKEN_SCOPE or payload.get('user_id') is None:
+        raise exception
+    return schema.TokenData(id=payload['user_id'])
+
+
+def get_stream_user(token: str = Depends(optionalOauthSchema), stream_token: str = None):
+    # token claims only, a stream must not hold a database connection while it is open;
+    # an access token in the Authorization header, or a stream token in the url
+    exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"could not verify cred", headers={"WWW-Authenticate": "Bearer"})
+    if token:
+        return verify_access_token(token, exception)
+    if stream_token:
+        return verify_stream_token(stream_token, exception)
+    raise exception
+
+
+async def get_authenticated_user(token_data = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    user = await utils.get_cached_user(db=db, user_id=token_data.id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"could not verify cred", headers={"WWW-Authenticate": "Bearer"})
+    return user
+
+
+async def get_authenticated_reader(token_data = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    # same as get_authenticated_user, bound to the session of a read-only endpoint
+    user = await utils.get_cached_user(db=db, user_id=token_data.id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"could not verify cred", headers={"WWW-Authenticate": "Bearer"})
+    return user
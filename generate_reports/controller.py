@@ -1,10 +1,14 @@
 from fastapi import APIRouter
-from fastapi import HTTPException, Depends, Response
+from fastapi import HTTPException, Depends, Response, Request
+from fastapi.responses import StreamingResponse
 from generate_reports import utils, schema
 from user import utils as user_utils
+from office import utils as office_utils
 from config import security
-from sqlalchemy.orm import Session
-from config.database import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.config import get_read_db
 import json
 from datetime import datetime
 from message.model import Message, EarlyClosure, StudyLeave, Evaluation
@@ -12,22 +16,14 @@ from typing import List
 
 router = APIRouter()
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.post('/messages')
 async def generate_report(report_request: schema.RequestReport,
-                           db: Session = Depends(get_db), 
-                           current_user_id = Depends(security.get_current_user)):
+                           request: Request,
+                           db: AsyncSession = Depends(get_read_db), 
+                           user = Depends(security.get_authenticated_reader)):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-
-        if (user.role.name == 'hr') or (user.role.name == 'admin'):
+        if (office_utils.role_name(user) == 'hr') or (office_utils.role_name(user) == 'admin'):
 
             if report_request.date_range:
                 start_date = datetime.strptime(report_request.date_range.split(':')[0], '%Y-%m-%d')
@@ -35,7 +31,12 @@ async def generate_report(report_request: schema.RequestReport,
             else:
                 raise HTTPException(status_code=400, detail=json.dumps({'message':'Date Range is needed'}))
 
-            messages = db.query(Message).filter(Message.created_at >= start_date, Message.created_at <= end_date).all()
+            media_type = utils.stream_format(request)
+            if media_type:
+                return StreamingResponse(utils.stream_report(request, Message, start_date, end_date, media_type), media_type=media_type)
+
+            query = select(Message).options(selectinload(Message.recipients)).where(Message.created_at >= start_date, Message.created_at <= end_date)
+            messages = (await db.execute(query)).scalars().all()
             return Response(content=json.dumps([schema.MessageBase.to_dict(message=message).model_dump() for message in messages]))
         else:
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized to view report. Must be hr or admin'}))
@@ -45,12 +46,11 @@ async def generate_report(report_request: schema.RequestReport,
     
 @router.post('/early-closures')
 async def generate_report(report_request: schema.RequestReport,
-                           db: Session = Depends(get_db), 
-                           current_user_id = Depends(security.get_current_user)):
+                           request: Request,
+                           db: AsyncSession = Depends(get_read_db), 
+                           user = Depends(security.get_authenticated_reader)):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-
-        if (user.role.name == 'hr') or (user.role.name == 'admin'):
+        if (office_utils.role_name(user) == 'hr') or (office_utils.role_name(user) == 'admin'):
 
             if report_request.date_range:
                 start_date = datetime.strptime(report_request.date_range.split(':')[0], '%Y-%m-%d')
@@ -58,7 +58,12 @@ async def generate_report(report_request: schema.RequestReport,
             else:
                 raise HTTPException(status_code=400, detail=json.dumps({'message':'Date Range is needed'}))
 
-            messages = db.query(EarlyClosure).filter(EarlyClosure.created_at >= start_date, EarlyClosure.created_at <= end_date).all()
+            media_type = utils.stream_format(request)
+            if media_type:
+                return StreamingResponse(utils.stream_report(request, EarlyClosure, start_date, end_date, media_type), media_type=media_type)
+
+            query = select(EarlyClosure).options(selectinload(EarlyClosure.recipients)).where(EarlyClosure.created_at >= start_date, EarlyClosure.created_at <= end_date)
+            messages = (await db.execute(query)).scalars().all()
             return Response(content=json.dumps([schema.EarlyClosureBase.to_dict(early_closure=message).model_dump() for message in messages]))
         else:
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized to view report. Must be hr or admin'}))
@@ -68,12 +73,11 @@ async def generate_report(report_request: schema.RequestReport,
 
 @router.post('/study-leaves')
 async def generate_report(report_request: schema.RequestReport,
-                           db: Session = Depends(get_db), 
-                           current_user_id = Depends(security.get_current_user)):
+                           request: Request,
+                           db: AsyncSession = Depends(get_read_db), 
+                           user = Depends(security.get_authenticated_reader)):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-
-        if (user.role.name == 'hr') or (user.role.name == 'admin'):
+        if (office_utils.role_name(user) == 'hr') or (office_utils.role_name(user) == 'admin'):
 
             if report_request.date_range:
                 start_date = datetime.strptime(report_request.date_range.split(':')[0], '%Y-%m-%d')
@@ -81,7 +85,12 @@ async def generate_report(report_request: schema.RequestReport,
             else:
                 raise HTTPException(status_code=400, detail=json.dumps({'message':'Date Range is needed'}))
 
-            messages = db.query(StudyLeave).filter(StudyLeave.created_at >= start_date, StudyLeave.created_at <= end_date).all()
+            media_type = utils.stream_format(request)
+            if media_type:
+                return StreamingResponse(utils.stream_report(request, StudyLeave, start_date, end_date, media_type), media_type=media_type)
+
+            query = select(StudyLeave).options(selectinload(StudyLeave.recipients)).where(StudyLeave.created_at >= start_date, StudyLeave.created_at <= end_date)
+            messages = (await db.execute(query)).scalars().all()
             return Response(content=json.dumps([schema.StudyLeaveBase.to_dict(study_leave=message).model_dump() for message in messages]))
         else:
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized to view report. Must be hr or admin'}))
@@ -91,12 +100,11 @@ async def generate_report(report_request: schema.RequestReport,
 
 @router.post('/evaluations')
 async def generate_report(report_request: schema.RequestReport,
-                           db: Session = Depends(get_db), 
-                           current_user_id = Depends(security.get_current_user)):
+                           request: Request,
+                           db: AsyncSession = Depends(get_read_db), 
+                           user = Depends(security.get_authenticated_reader)):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-
-        if (user.role.name == 'hr') or (user.role.name == 'admin'):
+        if (office_utils.role_name(user) == 'hr') or (office_utils.role_name(user) == 'admin'):
 
             if report_request.date_range:
                 start_date = datetime.strptime(report_request.date_range.split(':')[0], '%Y-%m-%d')
@@ -104,10 +112,38 @@ async def generate_report(report_request: schema.RequestReport,
             else:
                 raise HTTPException(status_code=400, detail=json.dumps({'message':'Date Range is needed'}))
 
-            messages = db.query(Evaluation).filter(Evaluation.created_at >= start_date, Evaluation.created_at <= end_date).all()
+            media_type = utils.stream_format(request)
+            if media_type:
+                return StreamingResponse(utils.stream_report(request, Evaluation, start_date, end_date, media_type), media_type=media_type)
+
+            query = select(Evaluation).options(selectinload(Evaluation.recipients)).where(Evaluation.created_at >= start_date, Evaluation.created_at <= end_date)
+            messages = (await db.execute(query)).scalars().all()
             return Response(content=json.dumps([schema.EvaluationBase.to_dict(evaluation=message).model_dump() for message in messages]))
         else:
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized to view report. Must be hr or admin'}))
 
     except Exception as e:
-        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+@router.post('/summary/{report}')
+async def generate_summary(report: str,
+                           summary_request: schema.RequestSummary,
+                           db: AsyncSession = Depends(get_read_db), 
+                           user = Depends(security.get_authenticated_reader)):
+    try:
+        if (office_utils.role_name(user) == 'hr') or (office_utils.role_name(user) == 'admin'):
+
+            if summary_request.date_range:
+                start_date = datetime.strptime(summary_request.date_range.split(':')[0], '%Y-%m-%d')
+                end_date = datetime.strptime(summary_request.date_range.split(':')[1]+' 23:59:59', '%Y-%m-%d %H:%M:%S')
+            else:
+                raise HTTPException(status_code=400, detail=json.dumps({'message':'Date Range is needed'}))
+
+            summary = await utils.get_summary(db=db, report=report, start_date=start_date, end_date=end_date,
+                                              bucket=summary_request.bucket, group_by=summary_request.group_by)
+            return Response(content=json.dumps(summary))
+        else:
+            raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized to view report. Must be hr or admin'}))
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
@@ -2,12 +2,21 @@ from typing import Optional, List
 from pydantic import BaseModel
 from message.model import Message as MMessage
 from message.model import Comment as MComment
+from message.model import Evaluation as MEvaluation
+from message.model import EarlyClosure as MEarlyClosure
+from message.model import StudyLeave as MStudyLeave
+from helpers.serializers import ModelSerializer
 from sqlalchemy.orm import Session
 from user import utils as user_utils
 
 class RequestReport(BaseModel):
     date_range: str
 
+class RequestSummary(BaseModel):
+    date_range: str
+    bucket: Optional[str] = None
+    group_by: List[str] = []
+
 # class ReturnReportMessage(BaseModel):
 #     created_at: str
 #     sender: str
@@ -265,3 +274,14 @@ class StudyLeaveBase(BaseModel):
             director_signature=study_leave.director_signature,
             recipients=recipients
         )
+
+
+### STREAMED REPORTS ###
+
+# same columns as the *Base models above, read straight off the selected rows
+REPORT_SERIALIZERS = {
+    MMessage: ModelSerializer(MMessage, include=MessageBase.model_fields),
+    MEvaluation: ModelSerializer(MEvaluation, include=EvaluationBase.model_fields),
+    MEarlyClosure: ModelSerializer(MEarlyClosure, include=EarlyClosureBase.model_fields),
+    MStudyLeave: ModelSerializer(MStudyLeave, include=StudyLeaveBase.model_fields),
+}
@@ -0,0 +1,123 @@
+import os
+import csv
+import io
+import json
+from datetime import datetime
+from fastapi import Request
+from sqlalchemy import select, func, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.config import read_session
+from generate_reports import schema
+from message.model import Message, EarlyClosure, StudyLeave, Evaluation
+from user.model import User
+from office.model import Office
+
+# rows fetched per round trip from the server-side cursor of a streamed report
+REPORT_STREAM_BATCH = int(os.environ.get('REPORT_STREAM_BATCH', 1000))
+
+NDJSON = 'application/x-ndjson'
+CSV = 'text/csv'
+
+
+def stream_format(request: Request):
+    # the report is streamed when the client asks for ndjson or csv, plain json otherwise
+    accept = request.headers.get('accept', '')
+    for media_type in (NDJSON, CSV):
+        if media_type in accept:
+            return media_type
+    return None
+
+async def stream_report(request: Request, item, start_date: datetime, end_date: datetime, media_type: str):
+    # runs after the endpoint returned, so it opens its own session instead of using the request's one
+    serializer = schema.REPORT_SERIALIZERS[item]
+    query = (select(*serializer.columns)
+             .where(item.created_at >= start_date, item.created_at <= end_date)
+             .order_by(item.created_at, item.id)
+             .execution_options(yield_per=REPORT_STREAM_BATCH))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if media_type == CSV:
+        writer.writerow(serializer.keys)
+        yield buffer.getvalue()
+
+    async with read_session(request) as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            if media_type == CSV:
+                writer.writerows(serializer.from_row(row).values() for row in rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(serializer.from_row(row)))
+                    buffer.write('\n')
+            yield buffer.getvalue()
+
+
+### SUMMARIES ###
+
+SUMMARY_REPORTS = {'messages': Message,
+                   'early-closures': EarlyClosure,
+                   'study-leaves': StudyLeave,
+                   'evaluations': Evaluation}
+
+# the column each form keeps its outcome in, evaluations have none
+STATUS_COLUMNS = {Message: Message.status,
+                  EarlyClosure: EarlyClosure.permission,
+                  StudyLeave: StudyLeave.approval_status}
+
+SUMMARY_BUCKETS = ('day', 'week', 'month')
+SUMMARY_GROUPS = ('office', 'status', 'sender')
+
+async def get_summary(db: AsyncSession, report: str, start_date: datetime, end_date: datetime, bucket: str = None, group_by: list = ()):
+    # counts computed by postgres, one row per (bucket, office, status, sender) that has any
+    try:
+        item = SUMMARY_REPORTS.get(report)
+        if item is None:
+            raise ValueError(f'unknown report {report}, expected one of {", ".join(SUMMARY_REPORTS)}')
+        if bucket is not None and bucket not in SUMMARY_BUCKETS:
+            raise ValueError(f'unknown bucket {bucket}, expected one of {", ".join(SUMMARY_BUCKETS)}')
+        for group in group_by:
+            if group not in SUMMARY_GROUPS:
+                raise ValueError(f'unknown grouping {group}, expected any of {", ".join(SUMMARY_GROUPS)}')
+        if 'status' in group_by and item not in STATUS_COLUMNS:
+            raise ValueError(f'{report} have no status to group by')
+
+        columns = []
+        if bucket:
+            # the unit is inlined so the select and group by use the very same expression
+            columns.append(func.date_trunc(literal_column(f"'{bucket}'"), item.created_at).label('bucket'))
+        if 'office' in group_by:
+            columns.append(Office.name.label('office'))
+        if 'status' in group_by:
+            columns.append(STATUS_COLUMNS[item].label('status'))
+        if 'sender' in group_by:
+            columns += [User.id.label('sender_id'), User.first_name, User.last_name]
+
+        query = select(*columns, func.count(item.id).label('count')).select_from(item)
+        if 'office' in group_by or 'sender' in group_by:
+            query = query.join(User, User.id == item.sender_id)
+        if 'office' in group_by:
+            query = query.outerjoin(Office, Office.id == User.role_id)
+        query = (query.where(item.created_at >= start_date, item.created_at <= end_date)
+                 .group_by(*columns)
+                 .order_by(*columns))
+
+        summary = []
+        for row in (await db.execute(query)).mappings():
+            entry = {}
+            if bucket:
+                entry['bucket'] = row['bucket'].date().isoformat()
+            if 'office' in group_by:
+                entry['office'] = row['office']
+            if 'status' in group_by:
+                entry['status'] = row['status']
+            if 'sender' in group_by:
+                entry['sender_id'] = row['sender_id']
+                entry['sender'] = f"{row['first_name']} {row['last_name']}"
+            entry['count'] = row['count']
+            summary.append(entry)
+        return summary
+    except Exception as e:
+        raise e
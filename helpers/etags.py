@@ -0,0 +1,21 @@
+import hashlib
+
+# conditional GET: a list endpoint hashes the versions its payload depends on
+# into an ETag, and answers a matching If-None-Match with 304 before loading anything
+
+
+def etag(*parts) -> str:
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest() + '"'
+
+
+def etag_header(tag: str, headers: dict = None):
+    return {**(headers or {}), 'ETag': tag}
+
+
+def not_modified(request, tag: str) -> bool:
+    # If-None-Match may list several tags, weak ones included, or be *
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(',')]
+    return '*' in candidates or any(candidate.removeprefix('W/') == tag for candidate in candidates)
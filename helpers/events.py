@@ -0,0 +1,138 @@
+import os
+import json
+import asyncio
+from sqlalchemy import select, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.database import SQLALCHEMY_DATABASE_URL
+
+# mailbox events go out with NOTIFY on this channel and reach every worker
+# listening on it, whichever worker handled the write
+EVENTS_CHANNEL = 'mailbox_events'
+# LISTEN needs a session of its own that stays open, behind a transaction
+# pooler point this at the database directly; NOTIFY goes through DB_URI
+EVENTS_DB_URI = os.environ.get('EVENTS_DB_URI') or SQLALCHEMY_DATABASE_URL
+# a comment line every this many seconds keeps proxies from closing idle streams
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 20))
+# events held for one slow client before it is told to resync instead
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+# a NOTIFY payload is limited to 8000 bytes, larger fan-outs are split
+NOTIFY_USERS_PER_EVENT = 500
+
+
+async def publish(db: AsyncSession, user_ids, event: dict):
+    # sent by postgres when the caller's transaction commits, dropped if it rolls back
+    try:
+        user_ids = sorted(set(user_ids))
+        for start in range(0, len(user_ids), NOTIFY_USERS_PER_EVENT):
+            payload = json.dumps({'users': user_ids[start:start + NOTIFY_USERS_PER_EVENT], 'event': event})
+            await db.execute(select(func.pg_notify(EVENTS_CHANNEL, payload)))
+    except Exception as e:
+        raise e
+
+
+def listen_dsn():
+    # asyncpg takes a plain postgresql:// url
+    return make_url(EVENTS_DB_URI).set(drivername='postgresql').render_as_string(hide_password=False)
+
+
+class EventHub:
+    # the streams open in this worker, by user; one LISTEN connection feeds them all,
+    # opened with the first stream and reopened whenever it drops
+
+    def __init__(self):
+        self.subscribers = {}
+        self._task = None
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    def _deliver(self, queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # the client fell behind, what it missed is replaced by one resync
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({'type': 'resync'})
+
+    def dispatch(self, payload: str):
+        message = json.loads(payload)
+        for user_id in message['users']:
+            for queue in self.subscribers.get(user_id, ()):
+                self._deliver(queue, message['event'])
+
+    def resync_all(self):
+        for queues in self.subscribers.values():
+            for queue in queues:
+                self._deliver(queue, {'type': 'resync'})
+
+    async def _listen(self):
+        import asyncpg
+
+        delay = 1
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(listen_dsn())
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(EVENTS_CHANNEL, lambda _connection, _pid, _channel, payload: self.dispatch(payload))
+                # anything published before LISTEN took effect was missed
+                self.resync_all()
+                delay = 1
+                await closed.wait()
+            except asyncio.CancelledError:
+                if connection is not None:
+                    await connection.close()
+                raise
+            except Exception:
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+hub = EventHub()
+
+
+def format_event(event: dict):
+    # one server-sent event, named after its type
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream(user_id):
+    # what GET /messages/events sends: the events of one user as they happen,
+    # starting with 'ready' so a client (re)connecting knows to refetch once
+    queue = hub.subscribe(user_id)
+    try:
+        yield format_event({'type': 'ready'})
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        hub.unsubscribe(user_id, queue)
@@ -0,0 +1,36 @@
+import os
+import asyncio
+import smtplib
+from email.message import EmailMessage
+
+# notifications are also emailed when SMTP_HOST is set, otherwise they are in-app only
+SMTP_HOST = os.environ.get('SMTP_HOST')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_USER = os.environ.get('SMTP_USER')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_FROM = os.environ.get('SMTP_FROM') or SMTP_USER
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', 'true').lower() == 'true'
+SMTP_TIMEOUT_SECONDS = float(os.environ.get('SMTP_TIMEOUT_SECONDS', 30))
+
+
+def enabled():
+    return bool(SMTP_HOST)
+
+
+def _send(to: str, subject: str, text: str):
+    message = EmailMessage()
+    message['From'] = SMTP_FROM
+    message['To'] = to
+    message['Subject'] = subject
+    message.set_content(text)
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS) as server:
+        if SMTP_STARTTLS:
+            server.starttls()
+        if SMTP_USER:
+            server.login(SMTP_USER, SMTP_PASSWORD)
+        server.send_message(message)
+
+
+async def send_email(to: str, subject: str, text: str):
+    # smtplib blocks, it runs on a worker thread
+    await asyncio.to_thread(_send, to, subject, text)
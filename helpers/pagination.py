@@ -0,0 +1,47 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# list endpoints return their cursor for the next page in this header
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def next_cursor_header(cursor):
+    return {NEXT_CURSOR_HEADER: cursor} if cursor else None
+
+
+def encode_cursor(positions: dict):
+    # positions: section name -> (created_at, id) of the last row already returned
+    if not positions:
+        return None
+    raw = {name: [created_at.isoformat(), id] for name, (created_at, id) in positions.items()}
+    return base64.urlsafe_b64encode(json.dumps(raw).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    if not cursor:
+        return {}
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {name: (datetime.fromisoformat(created_at), int(id)) for name, (created_at, id) in raw.items()}
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+def keyset(query, item, after, limit: int):
+    # newest first on (created_at, id); one extra row tells whether another page exists
+    if after is not None:
+        query = query.where(tuple_(item.created_at, item.id) < tuple_(*after))
+    return query.order_by(item.created_at.desc(), item.id.desc()).limit(limit + 1)
+
+
+def split_page(rows, limit: int):
+    # rows fetched through keyset() -> (this page, position to continue from or None)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].created_at, rows[-1].id)
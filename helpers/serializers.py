@@ -0,0 +1,37 @@
+from sqlalchemy import inspect, Date, DateTime, Time
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+class ModelSerializer:
+    """Turns rows of one model into plain dicts.
+
+    The column list is read from the mapper once and compiled into two small
+    functions, one reading an ORM instance and one reading a row selected with
+    `select(*serializer.columns)`. Date and time columns come out as ISO strings.
+    """
+
+    def __init__(self, model, exclude=(), include=None):
+        attrs = [attr for attr in inspect(model).column_attrs
+                 if attr.key not in exclude and (include is None or attr.key in include)]
+        self.keys = [attr.key for attr in attrs]
+        self.columns = [getattr(model, attr.key) for attr in attrs]
+
+        from_object, from_row = [], []
+        for i, attr in enumerate(attrs):
+            temporal = isinstance(attr.columns[0].type, (Date, DateTime, Time))
+            from_object.append(f"{attr.key!r}: " + (f"_iso(obj.{attr.key})" if temporal else f"obj.{attr.key}"))
+            from_row.append(f"{attr.key!r}: " + (f"_iso(row[{i}])" if temporal else f"row[{i}]"))
+
+        source = (f"def from_object(obj):\n    return {{{', '.join(from_object)}}}\n"
+                  f"def from_row(row):\n    return {{{', '.join(from_row)}}}\n")
+        namespace = {'_iso': _iso}
+        exec(compile(source, f'<serializer {model.__name__}>', 'exec'), namespace)
+        self.from_object = namespace['from_object']
+        self.from_row = namespace['from_row']
+
+    def __call__(self, obj):
+        return self.from_object(obj)
+
@@ -0,0 +1,223 @@
+import os
+import shutil
+import asyncio
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+# 's3' for the DigitalOcean space (or any S3 compatible store) configured by the
+# SPACE_* variables, 'local' to keep uploads on this machine's disk
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 's3').lower()
+STORAGE_LOCAL_ROOT = os.environ.get('STORAGE_LOCAL_ROOT', 'uploads')
+# where the app serves STORAGE_LOCAL_ROOT from, see main.py
+STORAGE_LOCAL_URL = os.environ.get('STORAGE_LOCAL_URL', '/uploads')
+# multipart uploads: parts of this size, this many in flight at once
+STORAGE_PART_SIZE_MB = int(os.environ.get('STORAGE_PART_SIZE_MB', 8))
+STORAGE_UPLOAD_CONCURRENCY = int(os.environ.get('STORAGE_UPLOAD_CONCURRENCY', 8))
+
+
+class Storage(ABC):
+    # every method that touches the backend is async and keeps blocking I/O off the event loop
+
+    # whether presign_put is available, i.e. clients can upload to the backend directly
+    supports_presign = False
+
+    @abstractmethod
+    async def put(self, key: str, fileobj, content_type: str = None):
+        # fileobj is read from its current position to the end
+        ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def head(self, key: str):
+        # {'size': bytes, 'content_type': ...} of a stored object, None when there is none
+        ...
+
+    @abstractmethod
+    async def delete(self, keys: list):
+        ...
+
+    async def presign_put(self, key: str, content_type: str, size: int, expires_in: int):
+        # (url, headers) a client can PUT exactly `size` bytes of `content_type` to,
+        # without the file passing through the API; only when supports_presign
+        raise NotImplementedError(f'{type(self).__name__} does not support direct uploads')
+
+    @abstractmethod
+    def list(self, prefix: str = ''):
+        # async iterator over pages of {'key', 'size', 'last_modified'}, last_modified in UTC
+        ...
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        ...
+
+    def key(self, url: str):
+        # inverse of url(), None for anything not stored here
+        base = self.url('')
+        if url and url.startswith(base) and len(url) > len(base):
+            return url[len(base):]
+        return None
+
+
+class S3Storage(Storage):
+    # boto3 is synchronous, transfers run on a worker thread and the transfer
+    # manager uploads the parts of large files concurrently, reading them
+    # straight from the file object
+    MAX_DELETE_BATCH = 1000
+    supports_presign = True
+
+    def __init__(self, bucket: str = None):
+        self.bucket = bucket or os.environ.get('SPACE_NAME')
+        self._client = None
+        self._transfer_config = None
+
+    @property
+    def client(self):
+        # built on first use rather than at import, so importing the app needs no credentials
+        if self._client is None:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+
+            self._client = boto3.session.Session().client(
+                's3',
+                region_name=os.environ.get('SPACE_REGION'),
+                endpoint_url=os.environ.get('SPACE_ENDPOINT'),
+                aws_access_key_id=os.environ.get('SPACE_KEY'),
+                aws_secret_access_key=os.environ.get('SPACE_SECRET'))
+            self._transfer_config = TransferConfig(multipart_threshold=STORAGE_PART_SIZE_MB * 1024 * 1024,
+                                                   multipart_chunksize=STORAGE_PART_SIZE_MB * 1024 * 1024,
+                                                   max_concurrency=STORAGE_UPLOAD_CONCURRENCY)
+        return self._client
+
+    async def put(self, key: str, fileobj, content_type: str = None):
+        extra_args = {'ACL': 'public-read'}
+        if content_type:
+            extra_args['ContentType'] = content_type
+        client = self.client
+        await asyncio.to_thread(client.upload_fileobj, fileobj, self.bucket, key,
+                                ExtraArgs=extra_args, Config=self._transfer_config)
+
+    async def exists(self, key: str) -> bool:
+        return await self.head(key) is not None
+
+    async def head(self, key: str):
+        from botocore.exceptions import ClientError
+
+        try:
+            response = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=key)
+            return {'size': response['ContentLength'], 'content_type': response.get('ContentType')}
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise e
+
+    async def presign_put(self, key: str, content_type: str, size: int, expires_in: int):
+        # type, length and acl are part of the signature, the client has to send them as given
+        url = await asyncio.to_thread(self.client.generate_presigned_url, 'put_object',
+                                      Params={'Bucket': self.bucket,
+                                              'Key': key,
+                                              'ContentType': content_type,
+                                              'ContentLength': size,
+                                              'ACL': 'public-read'},
+                                      ExpiresIn=expires_in)
+        return url, {'Content-Type': content_type, 'x-amz-acl': 'public-read'}
+
+    async def delete(self, keys: list):
+        for start in range(0, len(keys), self.MAX_DELETE_BATCH):
+            batch = keys[start:start + self.MAX_DELETE_BATCH]
+            await asyncio.to_thread(self.client.delete_objects, Bucket=self.bucket,
+                                    Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+
+    async def list(self, prefix: str = ''):
+        # one page (up to 1000 keys) per request, each fetched on a worker thread
+        pages = iter(self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix))
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                return
+            yield [{'key': item['Key'], 'size': item['Size'], 'last_modified': item['LastModified']}
+                   for item in page.get('Contents', [])]
+
+    def url(self, key: str) -> str:
+        return f"{os.environ.get('SPACE_EDGE_ENDPOINT')}/{self.bucket}/{key}"
+
+
+class LocalStorage(Storage):
+    # files under one directory, for tests and single node installs
+
+    def __init__(self, root: str = STORAGE_LOCAL_ROOT, base_url: str = STORAGE_LOCAL_URL):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f'Invalid storage key {key}')
+        return path
+
+    def _write(self, path: str, fileobj):
+        # written next to the target and renamed, so readers never see half a file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as out:
+            shutil.copyfileobj(fileobj, out, 1024 * 1024)
+        os.replace(out.name, path)
+
+    async def put(self, key: str, fileobj, content_type: str = None):
+        await asyncio.to_thread(self._write, self.path(key), fileobj)
+
+    async def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    async def head(self, key: str):
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        return {'size': os.path.getsize(path), 'content_type': None}
+
+    def _remove(self, paths: list):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def delete(self, keys: list):
+        await asyncio.to_thread(self._remove, [self.path(key) for key in keys])
+
+    def _walk(self, prefix: str):
+        found = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    stat = os.stat(path)
+                    found.append({'key': key, 'size': stat.st_size,
+                                  'last_modified': datetime.fromtimestamp(stat.st_mtime, timezone.utc)})
+        return found
+
+    async def list(self, prefix: str = ''):
+        found = await asyncio.to_thread(self._walk, prefix)
+        for start in range(0, len(found), 1000):
+            yield found[start:start + 1000]
+
+    def url(self, key: str) -> str:
+        return f'{self.base_url}/{key}'
+
+
+_storage = None
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == 'local':
+            _storage = LocalStorage()
+        elif STORAGE_BACKEND == 's3':
+            _storage = S3Storage()
+        else:
+            raise ValueError(f'Unknown STORAGE_BACKEND {STORAGE_BACKEND}, expected s3 or local')
+    return _storage
@@ -1,29 +1,206 @@
-import boto3
 import os
+import re
 import random
 import string
+import asyncio
+import hashlib
+import mimetypes
+from sqlalchemy import select, delete, func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
+from config.database import SessionLocal
+from helpers.storage import get_storage
+from message.model import StoredObject
+from message.utils import UPLOAD_TARGETS
 
-session = boto3.session.Session()
-client = session.client(
-    's3',
-    region_name=os.environ.get('SPACE_REGION'),
-    endpoint_url=os.environ.get('SPACE_ENDPOINT'),
-    aws_access_key_id=os.environ.get('SPACE_KEY'),
-    aws_secret_access_key=os.environ.get('SPACE_SECRET'))
+# content addressed uploads live under this prefix, named after their sha256
+CONTENT_PREFIX = 'objects/'
+HASH_CHUNK_SIZE = 1024 * 1024
 
-def do_upload(file_to_upload, sender_email):
+# limits on files clients upload straight to storage (see presign_upload)
+UPLOAD_MAX_MB = float(os.environ.get('UPLOAD_MAX_MB', 20))
+UPLOAD_CONTENT_TYPES = [content_type.strip() for content_type in
+                        os.environ.get('UPLOAD_CONTENT_TYPES', 'application/pdf,image/png,image/jpeg').split(',') if content_type.strip()]
+UPLOAD_URL_EXPIRE_SECONDS = int(os.environ.get('UPLOAD_URL_EXPIRE_SECONDS', 900))
+
+# orphan cleanup: objects younger than the grace period are never touched (uploads
+# whose form is not committed yet, presigned ones not confirmed yet), deletes are
+# sent in batches of up to REAP_BATCH keys at no more than REAP_RATE keys a second
+REAP_GRACE_MINUTES = int(os.environ.get('STORAGE_REAP_GRACE_MINUTES', 60))
+REAP_BATCH = int(os.environ.get('STORAGE_REAP_BATCH', 1000))
+REAP_RATE = float(os.environ.get('STORAGE_REAP_RATE', 1000))
+# 0 reaps only when asked to (user deletes, /admin/storage/reap)
+REAP_INTERVAL_MINUTES = int(os.environ.get('STORAGE_REAP_INTERVAL_MINUTES', 0))
+
+def upload_key(filename, owner_id):
+    # random prefix, then the uploader's user id, then the client's file name without any path
+    prefix = "".join(random.choice(string.ascii_lowercase + string.digits) for _ in range(10))
+    return prefix + '-' + str(owner_id) + '-' + os.path.basename(filename or 'file')
+
+def is_upload_key(key):
+    # what do_upload and presign_upload name objects, anything else in the bucket is left alone
+    return key.startswith(CONTENT_PREFIX) or re.fullmatch(r'[a-z0-9]{10}-[^/]+-[^/]+', key) is not None
+
+def is_own_upload(key, owner_id):
+    # the id is all digits and ends at the first '-', so one user's id never matches
+    # the start of another's (an email could: a@b.com and a@b.com-x.org)
+    prefix, _, rest = key.partition('-')
+    owner, _, _ = rest.partition('-')
+    return len(prefix) == 10 and owner == str(owner_id) and '/' not in key
+
+def hash_file(fileobj):
+    # sha256 and size of fileobj from its current position, which is restored afterwards
+    start = fileobj.tell()
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(start)
+    return digest.hexdigest(), size
+
+def content_key(sha256, content_type):
+    # the extension keeps the local driver's static files serving the right type
+    return CONTENT_PREFIX + sha256 + (mimetypes.guess_extension(content_type or '') or '')
+
+async def do_upload(db: AsyncSession, file_to_upload):
+    # the same bytes are stored once: a file already in stored_objects is only
+    # touched, which restarts its grace period, and the transfer is skipped. The
+    # row is committed with the caller's transaction, and until then it stays
+    # locked, so a concurrent upload of the same bytes waits for this one to
+    # finish and the reaper cannot remove the object under it
+    try:
+        sha256, size = await asyncio.to_thread(hash_file, file_to_upload.file)
+        key = content_key(sha256, file_to_upload.content_type)
+        # xmax is 0 on a row this statement inserted, set on one it updated
+        inserted = (await db.execute(insert(StoredObject)
+                                     .values(key=key, sha256=sha256, size=size, content_type=file_to_upload.content_type)
+                                     .on_conflict_do_update(index_elements=[StoredObject.key], set_={'updated_at': func.now()})
+                                     .returning(literal_column('xmax = 0')))).scalar()
+        storage = get_storage()
+        if inserted:
+            # new (or reaped since it was last uploaded), send the bytes
+            await storage.put(key, file_to_upload.file, content_type=file_to_upload.content_type)
+        return storage.url(key)
+    except Exception as e:
+        raise e
+
+async def presign_upload(filename, content_type, size, owner_id):
+    # a url the client PUTs the file to itself, the bytes never pass through the API
+    try:
+        storage = get_storage()
+        if not storage.supports_presign:
+            raise ValueError('Direct uploads are not available, send the file to /messages/upload-document/')
+        if content_type not in UPLOAD_CONTENT_TYPES:
+            raise ValueError(f'Content type {content_type} not allowed, expected one of {", ".join(UPLOAD_CONTENT_TYPES)}')
+        if size <= 0 or size > UPLOAD_MAX_MB * 1024 * 1024:
+            raise ValueError(f'File must be between 1 byte and {UPLOAD_MAX_MB:g}MB')
+        key = upload_key(filename, owner_id)
+        upload_url, headers = await storage.presign_put(key, content_type, size, UPLOAD_URL_EXPIRE_SECONDS)
+        return {'key': key, 'upload_url': upload_url, 'headers': headers, 'expires_in': UPLOAD_URL_EXPIRE_SECONDS}
+    except Exception as e:
+        raise e
+
+async def check_upload(key, owner_id):
+    # once the client says it is done: the object has to exist, belong to the
+    # caller and still be within the limits; one that is not gets deleted.
+    # returns the url the forms store
     try:
-        # create file name
-        name = "".join(random.choice(string.ascii_lowercase + string.digits) for _ in range(10)) + '-' + sender_email + '-' + file_to_upload.filename 
-        # upload file
-        client.upload_fileobj(file_to_upload.file, os.environ.get('SPACE_NAME'), name, ExtraArgs={'ACL': 'public-read'})
-        return f"{os.environ.get('SPACE_EDGE_ENDPOINT')}/{os.environ.get('SPACE_NAME')}/{name}"
+        if not is_own_upload(key, owner_id):
+            raise ValueError('Unknown upload')
+        storage = get_storage()
+        stored = await storage.head(key)
+        if stored is None:
+            raise ValueError('File has not been uploaded')
+        if stored['size'] > UPLOAD_MAX_MB * 1024 * 1024 or stored['content_type'] not in UPLOAD_CONTENT_TYPES:
+            await storage.delete([key])
+            raise ValueError('Uploaded file is over the size limit or of a type not allowed')
+        return storage.url(key)
     except Exception as e:
         raise e
 
-def remove_upload(file_to_remove):
+async def referenced_keys(db: AsyncSession, storage):
+    # every key a message document or form signature points at
     try:
-        client.delete_object(Bucket=os.environ.get('SPACE_NAME'), Key=file_to_remove)
-        return True
+        keys = set()
+        for item, fields in UPLOAD_TARGETS.values():
+            result = await db.stream(select(*(getattr(item, field) for field in fields)).execution_options(yield_per=REAP_BATCH))
+            async for row in result:
+                keys.update(key for key in map(storage.key, row) if key)
+        return keys
     except Exception as e:
-        raise e
\ No newline at end of file
+        raise e
+
+async def reap_batch(db: AsyncSession, storage, batch):
+    # content addressed objects uploaded again within the grace period keep their row, and the
+    # rows removed here stay locked until the objects are gone, so an upload of
+    # the same bytes either lands before (and the row is kept) or re-sends them after
+    try:
+        keys = [item['key'] for item in batch]
+        content_keys = [key for key in keys if key.startswith(CONTENT_PREFIX)]
+        if content_keys:
+            await db.execute(delete(StoredObject)
+                             .where(StoredObject.key.in_(content_keys), StoredObject.updated_at < func.now() - timedelta(minutes=REAP_GRACE_MINUTES)))
+            kept = set((await db.execute(select(StoredObject.key).where(StoredObject.key.in_(content_keys)))).scalars())
+            batch = [item for item in batch if item['key'] not in kept]
+        if batch:
+            await storage.delete([item['key'] for item in batch])
+        await db.commit()
+        return batch
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+async def reap_orphans(db: AsyncSession):
+    # deletes stored objects nothing refers to any more and reports what it reclaimed
+    try:
+        storage = get_storage()
+        report = {'started_at': datetime.now(timezone.utc).isoformat(), 'scanned': 0, 'deleted': 0, 'deleted_bytes': 0}
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=REAP_GRACE_MINUTES)
+        referenced = await referenced_keys(db=db, storage=storage)
+        await db.commit()
+        report['referenced'] = len(referenced)
+
+        async def reap(batch):
+            deleted = await reap_batch(db=db, storage=storage, batch=batch)
+            report['deleted'] += len(deleted)
+            report['deleted_bytes'] += sum(item['size'] for item in deleted)
+
+        orphans = []
+        async for page in storage.list():
+            report['scanned'] += len(page)
+            orphans.extend(item for item in page if is_upload_key(item['key'])
+                           and item['key'] not in referenced and item['last_modified'] < cutoff)
+            while len(orphans) >= REAP_BATCH:
+                await reap(orphans[:REAP_BATCH])
+                orphans = orphans[REAP_BATCH:]
+                await asyncio.sleep(REAP_BATCH / REAP_RATE)
+        if orphans:
+            await reap(orphans)
+
+        report['finished_at'] = datetime.now(timezone.utc).isoformat()
+        return report
+    except Exception as e:
+        raise e
+
+reaper_lock = asyncio.Lock()
+# report of the last pass in this process, shown at /admin/storage/reap
+last_reap = {}
+
+async def reap_in_background():
+    # one pass per process at a time, a pass asked for while one runs is dropped
+    global last_reap
+    if reaper_lock.locked():
+        return
+    async with reaper_lock:
+        try:
+            async with SessionLocal() as db:
+                last_reap = await reap_orphans(db=db)
+        except Exception as e:
+            last_reap = {'error': str(e), 'finished_at': datetime.now(timezone.utc).isoformat()}
+
+async def reap_periodically():
+    while True:
+        await asyncio.sleep(REAP_INTERVAL_MINUTES * 60)
+        await reap_in_background()
@@ -0,0 +1,35 @@
+from sqlalchemy import String, Column, DateTime, Integer, BigInteger, Text, JSON, Index, func
+
+from config.database import Base
+
+class Job(Base):
+    # follow-up work queued in the same transaction as the write it belongs to;
+    # a worker holds a job until locked_until, one that dies on it lets it go again
+    __tablename__ = 'jobs'
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    run_at = Column(DateTime, nullable=False, default=func.now())
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        # workers pick the jobs that are due, oldest first
+        Index('ix_jobs_due', 'run_at', 'id'),
+    )
+
+class DeadJob(Base):
+    # jobs that failed max_attempts times, kept until someone retries or drops them
+    __tablename__ = 'dead_jobs'
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    failed_at = Column(DateTime, nullable=False, default=func.now())
@@ -0,0 +1,188 @@
+import os
+import random
+import asyncio
+import logging
+from datetime import timedelta
+from sqlalchemy import select, update, delete, literal, or_, case, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.database import SessionLocal
+from jobs.model import Job, DeadJob
+from user.model import User
+from helpers import events, mailer, upload_helper
+
+# job workers per process; every process can run them, a job goes to one worker only
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# how often an idle worker looks for due jobs
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1))
+# a worker has this long to finish a job before it is given to another one
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+# kinds that need longer than that; a reaper pass lists the whole bucket
+JOB_TIMEOUTS = {
+    'reap_uploads': int(os.environ.get('JOB_REAP_TIMEOUT_SECONDS', 3600)),
+}
+# failed jobs are retried after JOB_RETRY_BASE_SECONDS, doubling each time up to
+# JOB_RETRY_MAX_SECONDS; after JOB_MAX_ATTEMPTS they move to dead_jobs
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_BASE_SECONDS = float(os.environ.get('JOB_RETRY_BASE_SECONDS', 10))
+JOB_RETRY_MAX_SECONDS = float(os.environ.get('JOB_RETRY_MAX_SECONDS', 3600))
+
+logger = logging.getLogger(__name__)
+
+async def enqueue(db: AsyncSession, kind: str, payload: dict = None, delay_seconds: float = 0, max_attempts: int = None):
+    # part of the caller's transaction: the job exists if and only if the write it follows commits
+    try:
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f'Unknown job {kind}')
+        await db.execute(insert(Job).values(kind=kind, payload=payload or {},
+                                            run_at=func.now() + timedelta(seconds=delay_seconds),
+                                            max_attempts=max_attempts or JOB_MAX_ATTEMPTS))
+    except Exception as e:
+        raise e
+
+async def notify(db: AsyncSession, user_ids, subject: str, text: str):
+    # one job per user, so one bad address doesn't hold up the others
+    try:
+        for user_id in sorted(set(user_ids)):
+            await enqueue(db=db, kind='notify_user', payload={'user_id': user_id, 'subject': subject, 'text': text})
+    except Exception as e:
+        raise e
+
+async def notify_user(db: AsyncSession, user_id, subject: str, text: str):
+    # in app (GET /messages/events) and, when configured, by email
+    user = await db.get(User, user_id)
+    if user is None:
+        return
+    await events.publish(db=db, user_ids=[user_id], event={'type': 'notification', 'subject': subject, 'text': text})
+    if mailer.enabled():
+        await mailer.send_email(to=user.email, subject=subject, text=text)
+
+async def reap_uploads(db: AsyncSession):
+    # waits for a pass already running, it may have listed the references before the delete
+    async with upload_helper.reaper_lock:
+        upload_helper.last_reap = await upload_helper.reap_orphans(db=db)
+
+JOB_HANDLERS = {
+    'notify_user': notify_user,
+    'reap_uploads': reap_uploads,
+}
+
+def job_timeout(kind: str):
+    return JOB_TIMEOUTS.get(kind, JOB_LEASE_SECONDS)
+
+def retry_delay(attempts: int):
+    # exponential backoff with jitter, so jobs that failed together don't retry together
+    delay = min(JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), JOB_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1)
+
+async def claim(db: AsyncSession, limit: int = 1):
+    # the oldest due jobs nobody holds; skip locked lets workers claim side by side.
+    # each is leased for as long as its kind may run
+    try:
+        lease = case(*((Job.kind == kind, timedelta(seconds=seconds)) for kind, seconds in JOB_TIMEOUTS.items()),
+                     else_=timedelta(seconds=JOB_LEASE_SECONDS))
+        due = (select(Job.id)
+               .where(Job.run_at <= func.now(), or_(Job.locked_until.is_(None), Job.locked_until < func.now()))
+               .order_by(Job.run_at, Job.id)
+               .limit(limit)
+               .with_for_update(skip_locked=True))
+        jobs = (await db.execute(update(Job)
+                                 .where(Job.id.in_(due))
+                                 .values(attempts=Job.attempts + 1, locked_until=func.now() + lease)
+                                 .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts))).all()
+        await db.commit()
+        return jobs
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+async def fail(db: AsyncSession, job, error: str):
+    # retry later, or give up and keep it in dead_jobs
+    try:
+        if job.attempts >= job.max_attempts:
+            await db.execute(insert(DeadJob)
+                             .from_select(['id', 'kind', 'payload', 'attempts', 'last_error', 'created_at'],
+                                          select(Job.id, Job.kind, Job.payload, Job.attempts, literal(error), Job.created_at)
+                                          .where(Job.id == job.id)))
+            await db.execute(delete(Job).where(Job.id == job.id))
+        else:
+            await db.execute(update(Job)
+                             .where(Job.id == job.id)
+                             .values(run_at=func.now() + timedelta(seconds=retry_delay(job.attempts)),
+                                     locked_until=None, last_error=error))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+async def run(job):
+    # the handler's writes and the job's removal commit together
+    async with SessionLocal() as db:
+        try:
+            if job.attempts > job.max_attempts:
+                raise RuntimeError('Worker lease expired on every attempt')
+            await asyncio.wait_for(JOB_HANDLERS[job.kind](db=db, **job.payload), job_timeout(job.kind))
+            await db.execute(delete(Job).where(Job.id == job.id))
+            await db.commit()
+            return True
+        except Exception as e:
+            await db.rollback()
+            await fail(db=db, job=job, error=f'{type(e).__name__}: {e}')
+            return False
+
+async def work():
+    # one worker: claim a due job, run it, and poll again only when there are none
+    while True:
+        try:
+            async with SessionLocal() as db:
+                jobs = await claim(db=db)
+            for job in jobs:
+                await run(job)
+        except Exception:
+            # e.g. the database is unreachable, try again after a poll interval
+            logger.exception('Job worker failed, retrying in %s seconds', JOB_POLL_SECONDS)
+            jobs = []
+        if not jobs:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+async def get_stats(db: AsyncSession, dead_limit: int = 50):
+    try:
+        queued, due, running = (await db.execute(select(
+            func.count(Job.id),
+            func.count(Job.id).filter(Job.run_at <= func.now(), or_(Job.locked_until.is_(None), Job.locked_until < func.now())),
+            func.count(Job.id).filter(Job.locked_until >= func.now())))).one()
+        dead = (await db.execute(select(func.count(DeadJob.id)))).scalar()
+        recent = (await db.execute(select(DeadJob).order_by(DeadJob.failed_at.desc(), DeadJob.id.desc()).limit(dead_limit))).scalars().all()
+        return {'queued': queued, 'due': due, 'running': running, 'dead': dead,
+                'dead_jobs': [{'id': job.id, 'kind': job.kind, 'payload': job.payload, 'attempts': job.attempts,
+                               'last_error': job.last_error, 'created_at': job.created_at.isoformat(),
+                               'failed_at': job.failed_at.isoformat()} for job in recent]}
+    except Exception as e:
+        raise e
+
+async def retry_dead(db: AsyncSession, job_id):
+    # back in the queue with a fresh set of attempts
+    try:
+        moved = (await db.execute(insert(Job)
+                                  .from_select(['id', 'kind', 'payload', 'attempts', 'max_attempts', 'last_error', 'created_at', 'run_at'],
+                                               select(DeadJob.id, DeadJob.kind, DeadJob.payload, literal(0), literal(JOB_MAX_ATTEMPTS),
+                                                      DeadJob.last_error, DeadJob.created_at, func.now())
+                                               .where(DeadJob.id == job_id))
+                                  .returning(Job.id))).scalar()
+        if moved is None:
+            raise ValueError('Dead job not found')
+        await db.execute(delete(DeadJob).where(DeadJob.id == job_id))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+async def drop_dead(db: AsyncSession, job_id):
+    try:
+        dropped = (await db.execute(delete(DeadJob).where(DeadJob.id == job_id).returning(DeadJob.id))).scalar()
+        if dropped is None:
+            raise ValueError('Dead job not found')
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
@@ -1,11 +1,18 @@
+import asyncio
 from fastapi import FastAPI
-from config.database import Base, engine
+from config.database import Base, engine, SessionLocal
 import user.model
 from user.controller import router as user_router
 from message.controller import  router as message_router
 from office.controller import router as office_router
 from generate_reports.controller import router as report_router
+from admin.controller import router as admin_router
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from helpers import storage, upload_helper, events
+from jobs import utils as jobs_utils
+from office import utils as office_utils
+from helpers.pagination import NEXT_CURSOR_HEADER
 
 
 app = FastAPI()
@@ -22,15 +29,50 @@ app.add_middleware(CORSMiddleware,
                    allow_origins=origins,
                    allow_credentials=True,
                    allow_methods=['*'],
-                   allow_headers=['*'])
+                   allow_headers=['*'],
+                   expose_headers=[NEXT_CURSOR_HEADER, 'ETag'])
 
 app.include_router(user_router, prefix='/user')
 app.include_router(message_router, prefix='/messages')
 app.include_router(office_router, prefix='/offices')
 app.include_router(report_router, prefix='/generate-report')
+app.include_router(admin_router, prefix='/admin')
 
+if storage.STORAGE_BACKEND == 'local':
+    # uploads kept on this machine are served by the app itself
+    app.mount(storage.STORAGE_LOCAL_URL, StaticFiles(directory=storage.get_storage().root), name='uploads')
 
-Base.metadata.create_all(bind=engine)
+
+@app.on_event('startup')
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+@app.on_event('startup')
+async def load_office_registry():
+    async with SessionLocal() as db:
+        await office_utils.load_offices(db=db)
+
+@app.on_event('startup')
+async def start_storage_reaper():
+    # with several workers or instances, enable it on one of them
+    if upload_helper.REAP_INTERVAL_MINUTES > 0:
+        app.state.storage_reaper = asyncio.create_task(upload_helper.reap_periodically())
+
+@app.on_event('startup')
+async def start_job_workers():
+    app.state.job_workers = [asyncio.create_task(jobs_utils.work()) for _ in range(jobs_utils.JOB_WORKERS)]
+
+@app.on_event('shutdown')
+async def stop_job_workers():
+    # a job cut off here is picked up again once its lease runs out
+    for worker in getattr(app.state, 'job_workers', []):
+        worker.cancel()
+    await asyncio.gather(*getattr(app.state, 'job_workers', []), return_exceptions=True)
+
+@app.on_event('shutdown')
+async def stop_event_listener():
+    await events.hub.close()
 
 @app.get('/')
 async def home():
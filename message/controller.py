@@ -1,26 +1,22 @@
 from fastapi import APIRouter
-from fastapi import HTTPException, Depends, Response
+from fastapi import HTTPException, Depends, Response, Request
+from fastapi.responses import StreamingResponse
 from user import utils as user_utils
-from user import schema as user_schema
+from office import utils as office_utils
 from message import utils, schema, model
 from config import security
-from sqlalchemy.orm import Session
-from config.database import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.config import get_db, get_read_db
 import json
-from helpers.upload_helper import do_upload
+from helpers.upload_helper import do_upload, presign_upload, check_upload
+from helpers import pagination, etags, events
+from jobs import utils as jobs_utils
 
-from fastapi import Form, UploadFile
+from fastapi import Form, UploadFile, Query
 from typing import Annotated, List, Optional
 
 router = APIRouter()
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.post('/upload-document/')
 async def upload_document(
@@ -29,16 +25,14 @@ async def upload_document(
                           recipients: Annotated[List[str], Form()],
                           text: Annotated[str, Form()]=None,
                           document: Optional[UploadFile]=None, 
-                          db: Session = Depends(get_db), 
-                          current_user_id = Depends(security.get_current_user)
+                          db: AsyncSession = Depends(get_db), 
+                          user = Depends(security.get_authenticated_user)
                           ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        print(current_user_id.id)
-        
+        doc_url = None
         if document is not None:
             #upload document first
-            doc_url = do_upload(document, user.email)
+            doc_url = await do_upload(db, document)
 
         #store details in db
         message_data = {'sender_id':user.id,
@@ -50,83 +44,65 @@ async def upload_document(
                         'status':'doc_upload'}
         message_schema = schema.CreateMessage(**message_data)
 
-        db_message = utils.create_message(message=message_schema, recipients=recipients[0].split(','), db=db)
+        db_message, unknown_recipients = await utils.create_message(message=message_schema, recipients=recipients[0].split(','), db=db)
+
+        return Response(status_code=200, content=json.dumps({'message':'Document sent successfully',
+                                                             'unknown_recipients': unknown_recipients}))
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
 
-        #TODO: send notification to recipient ...
-        return Response(status_code=200, content=json.dumps({'message':'Document sent successfully'}))
+# direct uploads: presign, PUT the file to the returned url with the returned
+# headers, then confirm to attach it to a message or form
+@router.post('/uploads/presign')
+async def presign_document_upload(upload: schema.PresignUpload,
+                                  user = Depends(security.get_authenticated_user)):
+    try:
+        presigned = await presign_upload(filename=upload.filename, content_type=upload.content_type,
+                                         size=upload.size, owner_id=user.id)
+        return Response(status_code=200, content=json.dumps(presigned))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
 
+@router.post('/uploads/confirm')
+async def confirm_document_upload(upload: schema.ConfirmUpload,
+                                  db: AsyncSession = Depends(get_db),
+                                  user = Depends(security.get_authenticated_user)):
+    try:
+        url = await check_upload(key=upload.key, owner_id=user.id)
+        await utils.attach_upload(db=db, target=upload.target, item_id=upload.id, field=upload.field, url=url,
+                                  user_id=user.id, role=office_utils.role_name(user))
+        return Response(status_code=200, content=json.dumps({'message':'Upload saved successfully', upload.field: url}))
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
 
 @router.get('/outbox/')
-async def get_messages(db: Session = Depends(get_db), current_user_id = Depends(security.get_current_user)):
+async def get_messages(request: Request,
+                       limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+                       cursor: Optional[str] = None,
+                       db: AsyncSession = Depends(get_read_db), user = Depends(security.get_authenticated_reader)):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
+        # names of senders and recipients come from the directory
+        tag = etags.etag('outbox', user.id, await utils.get_mailbox_version(db=db, user_id=user.id),
+                         await user_utils.get_directory_version(db=db), limit, cursor)
+        if etags.not_modified(request, tag):
+            return Response(status_code=304, headers=etags.etag_header(tag))
+
+        sections, next_cursor, _ = await utils.get_mailbox(db=db, user_id=user.id, box='outbox', cursor=cursor, limit=limit)
 
         #messages
-        messages = user.sent_messages
-        return_messsages = [schema.ReturnMessage.to_dict(msg=msg, comments=msg.comments, db=db).model_dump() for msg in messages]
+        messages = sections['messages']
+        return_messsages = [schema.ReturnMessage.to_dict(msg=msg, comments=msg.comments).model_dump() for msg in messages]
 
         #early closures
-        early_closures = user.sent_early_closures
-        return_early_closures = []
-        for ec in early_closures:
-            cmts = ec.comments
-            ec = ec.__dict__
-            del ec['_sa_instance_state']
-            ec['created_at'] = ec['created_at'].isoformat()
-            ec['updated_at'] = ec['updated_at'].isoformat()
-            ec['comments'] = []
-            for c in cmts:
-                c = c.__dict__
-                del c['_sa_instance_state'], c['evaluation_id'], c['message_id'], c['study_leave_id']
-                c['created_at'] = c['created_at'].isoformat()
-                c['updated_at'] = c['updated_at'].isoformat()
-                ec['comments'].append(c)
-            return_early_closures.append(ec)
+        return_early_closures = [schema.form_to_dict(ec) for ec in sections['early_closures']]
 
         #study leaves
-        study_leaves = user.sent_study_leaves
-        return_study_leaves = []
-        for sl in study_leaves:
-            cmts = sl.comments
-            sl = sl.__dict__
-            del sl['_sa_instance_state']
-            sl['created_at'] = sl['created_at'].isoformat()
-            sl['updated_at'] = sl['updated_at'].isoformat()
-            sl['comments'] = []
-            for c in cmts:
-                c = c.__dict__
-                del c['_sa_instance_state'], c['evaluation_id'], c['message_id'], c['early_closure_id']
-                c['created_at'] = c['created_at'].isoformat()
-                c['updated_at'] = c['updated_at'].isoformat()
-                sl['comments'].append(c)
-            return_study_leaves.append(sl)
+        return_study_leaves = [schema.form_to_dict(sl) for sl in sections['study_leaves']]
 
         #evaluations
-        evaluations = user.sent_evaluations
-        return_evaluations = []
-        for e in evaluations:
-            grade = e.grade.__dict__
-            del grade['_sa_instance_state']
-            del grade['created_at']
-            del grade['updated_at']
-
-            cmts = e.comments
-            e = e.__dict__
-            del e['_sa_instance_state']
-            e['created_at'] = e['created_at'].isoformat()
-            e['updated_at'] = e['updated_at'].isoformat()
-            e['grade'] = grade
-            e['comments'] = []
-            for c in cmts:
-                c = c.__dict__
-                del c['_sa_instance_state'], c['study_leave_id'], c['message_id'], c['early_closure_id']
-                c['created_at'] = c['created_at'].isoformat()
-                c['updated_at'] = c['updated_at'].isoformat()
-                e['comments'].append(c)
-            return_evaluations.append(e)
-        
+        return_evaluations = [schema.form_to_dict(e) for e in sections['evaluations']]
+
         return_dict = {
             'messages':return_messsages,
             'study_leaves':return_study_leaves,
@@ -134,79 +110,54 @@ async def get_messages(db: Session = Depends(get_db), current_user_id = Depends(
             'evaluations': return_evaluations
         }
 
-        return Response(status_code=200, content=json.dumps(return_dict))
+        return Response(status_code=200, content=json.dumps(return_dict), headers=etags.etag_header(tag, pagination.next_cursor_header(next_cursor)))
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
 
+# a token for GET /messages/events?stream_token=, for clients that can't send the
+# Authorization header there (EventSource); it only opens streams and expires
+# quickly, so fetch a new one for each (re)connect
+@router.post('/events/token')
+async def mailbox_events_token(token_data = Depends(security.get_current_user)):
+    return Response(status_code=200, content=json.dumps({'stream_token': security.generate_stream_token(token_data.id),
+                                                         'expires_in': security.STREAM_TOKEN_EXPIRE_SECONDS}))
+
+# new items and changes to the caller's mailbox as server-sent events: new_item
+# and item_updated name the section (kind) and id, mailbox_updated and resync
+# mean refetch, notification carries a subject and text to show; the inbox,
+# outbox and /counters only need reading when one arrives
+@router.get('/events')
+async def mailbox_events(token_data = Depends(security.get_stream_user)):
+    return StreamingResponse(events.stream(token_data.id), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @router.get('/inbox/')
-async def get_messages(db: Session = Depends(get_db), current_user_id = Depends(security.get_current_user)):
+async def get_messages(request: Request,
+                       limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+                       cursor: Optional[str] = None,
+                       db: AsyncSession = Depends(get_read_db), user = Depends(security.get_authenticated_reader)):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
+        # names of senders and recipients come from the directory
+        tag = etags.etag('inbox', user.id, await utils.get_mailbox_version(db=db, user_id=user.id),
+                         await user_utils.get_directory_version(db=db), limit, cursor)
+        if etags.not_modified(request, tag):
+            return Response(status_code=304, headers=etags.etag_header(tag))
+
+        sections, next_cursor, read = await utils.get_mailbox(db=db, user_id=user.id, box='inbox', cursor=cursor, limit=limit)
 
         #messages
-        messages = user.received_messages
-        return_messsages = [schema.ReturnMessage.to_dict(msg=msg, comments=msg.comments, db=db).model_dump() for msg in messages]
+        messages = sections['messages']
+        return_messsages = [schema.ReturnMessage.to_dict(msg=msg, comments=msg.comments).model_dump() for msg in messages]
 
         #early closures
-        early_closures = user.received_early_closures
-        return_early_closures = []
-        for ec in early_closures:
-            cmts = ec.comments
-            ec = ec.__dict__
-            del ec['_sa_instance_state']
-            ec['created_at'] = ec['created_at'].isoformat()
-            ec['updated_at'] = ec['updated_at'].isoformat()
-            ec['comments'] = []
-            for c in cmts:
-                c = c.__dict__
-                del c['_sa_instance_state'], c['evaluation_id'], c['message_id'], c['study_leave_id']
-                c['created_at'] = c['created_at'].isoformat()
-                c['updated_at'] = c['updated_at'].isoformat()
-                ec['comments'].append(c)
-            return_early_closures.append(ec)
+        return_early_closures = [schema.form_to_dict(ec) for ec in sections['early_closures']]
 
         #study leaves
-        study_leaves = user.received_study_leaves
-        return_study_leaves = []
-        for sl in study_leaves:
-            cmts = sl.comments
-            sl = sl.__dict__
-            del sl['_sa_instance_state']
-            sl['created_at'] = sl['created_at'].isoformat()
-            sl['updated_at'] = sl['updated_at'].isoformat()
-            sl['comments'] = []
-            for c in cmts:
-                c = c.__dict__
-                del c['_sa_instance_state'], c['evaluation_id'], c['message_id'], c['early_closure_id']
-                c['created_at'] = c['created_at'].isoformat()
-                c['updated_at'] = c['updated_at'].isoformat()
-                sl['comments'].append(c)
-            return_study_leaves.append(sl)
+        return_study_leaves = [schema.form_to_dict(sl) for sl in sections['study_leaves']]
 
         #evaluations
-        evaluations = user.received_evaluations
-        return_evaluations = []
-        for e in evaluations:
-            grade = e.grade.__dict__
-            del grade['_sa_instance_state']
-            del grade['created_at']
-            del grade['updated_at']
-
-            cmts = e.comments
-            e = e.__dict__
-            del e['_sa_instance_state']
-            e['created_at'] = e['created_at'].isoformat()
-            e['updated_at'] = e['updated_at'].isoformat()
-            e['grade'] = grade
-            e['comments'] = []
-            for c in cmts:
-                c = c.__dict__
-                del c['_sa_instance_state'], c['study_leave_id'], c['message_id'], c['early_closure_id']
-                c['created_at'] = c['created_at'].isoformat()
-                c['updated_at'] = c['updated_at'].isoformat()
-                e['comments'].append(c)
-            return_evaluations.append(e)
-        
+        return_evaluations = [schema.form_to_dict(e) for e in sections['evaluations']]
+
         return_dict = {
             'messages':return_messsages,
             'study_leaves':return_study_leaves,
@@ -214,22 +165,41 @@ async def get_messages(db: Session = Depends(get_db), current_user_id = Depends(
             'evaluations': return_evaluations
         }
 
-        return Response(status_code=200, content=json.dumps(return_dict))
+        #read state
+        for name, returned in return_dict.items():
+            for item, data in zip(sections[name], returned):
+                data['read'] = (name, item.id) in read
+
+        return Response(status_code=200, content=json.dumps(return_dict), headers=etags.etag_header(tag, pagination.next_cursor_header(next_cursor)))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+@router.get('/counters')
+async def get_counters(db: AsyncSession = Depends(get_read_db), user = Depends(security.get_authenticated_reader)):
+    try:
+        counters = await utils.get_counters(db=db, user_id=user.id)
+        return Response(status_code=200, content=json.dumps(counters))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+@router.put('/mark-read/{kind}/{item_id}')
+async def mark_read(kind: str, item_id: int,
+                    db: AsyncSession = Depends(get_db), user = Depends(security.get_authenticated_user)):
+    try:
+        await utils.mark_read(db=db, user_id=user.id, kind=kind, item_id=item_id)
+        return Response(status_code=200, content=json.dumps({'message':'Marked as read'}))
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
 
 #comment on a message
 @router.post('/comment/')
 async def comment(comment: schema.CreateComment,
-                  db: Session = Depends(get_db), 
-                  current_user_id = Depends(security.get_current_user)):
+                  db: AsyncSession = Depends(get_db), 
+                  user = Depends(security.get_authenticated_user)):
     
     try:
-        user = user_utils.get_user(user_id=current_user_id.id, db=db)
-        
-        db_comment = utils.create_comment(db=db, comment=comment, sender_id=user.id)
+        db_comment = await utils.create_comment(db=db, comment=comment, sender_id=user.id)
 
-        #TODO: send notification to recipient ...
         return Response(status_code=200, content=json.dumps({'message':'Comment sent successfully'}))
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
@@ -240,17 +210,15 @@ async def comment(comment: schema.CreateComment,
 @router.post('/perform-evaluation')
 async def perform_evaluation(
     evaluation: schema.EvaluationCreate,
-    db: Session = Depends(get_db), 
-    current_user_id = Depends(security.get_current_user)
+    db: AsyncSession = Depends(get_db), 
+    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'admin':
+        if office_utils.role_name(user) != 'admin':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be head of section'}))
         
-        db_evaluation = utils.create_evaluation_with_grade(db=db, evaluation=evaluation, sender=user.id)       
+        db_evaluation = await utils.create_evaluation_with_grade(db=db, evaluation=evaluation, sender=user.id)       
 
-        #TODO: send notification to admin and hr ...
         return Response(status_code=200, content=json.dumps({'message':'Evaluation Submitted Successfully'}))
 
     except Exception as e:
@@ -260,18 +228,16 @@ async def perform_evaluation(
 async def respond_evaluation_hos(
     evaluation_id: int,
     response: schema.EvaluationHeadTeacherResponse,
-    db:Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)    
+    db:AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)    
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'hos':
+        if office_utils.role_name(user) != 'hos':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be head of section'}))
         
         # Update Early Closure record with HOS response
-        utils.update_evaluation_hos_response(db=db, evaluation_id=evaluation_id, response_data=response, user=user)
+        await utils.update_evaluation_hos_response(db=db, evaluation_id=evaluation_id, response_data=response, user=user)
 
-        # TODO: Send notification to HR
         return Response(status_code=200, content=json.dumps({'message':'HOS Response Submitted Successfully'}))
 
     except Exception as e:
@@ -281,18 +247,16 @@ async def respond_evaluation_hos(
 async def respond_evaluation_hr(
     evaluation_id: int,
     response: schema.EvaluationHRResponse,
-    db:Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)    
+    db:AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)    
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'hr':
+        if office_utils.role_name(user) != 'hr':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be hr'}))
         
         # Update Early Closure record with HOS response
-        utils.update_evaluation_hr_response(db=db, evaluation_id=evaluation_id, response_data=response, user=user)
+        await utils.update_evaluation_hr_response(db=db, evaluation_id=evaluation_id, response_data=response, user=user)
 
-        # TODO: Send notification to HR
         return Response(status_code=200, content=json.dumps({'message':'HR Response Submitted Successfully'}))
 
     except Exception as e:
@@ -302,18 +266,16 @@ async def respond_evaluation_hr(
 async def respond_evaluation_director(
     evaluation_id: int,
     response: schema.EvaluationDirectorResponse,
-    db:Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)    
+    db:AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)    
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'admin':
+        if office_utils.role_name(user) != 'admin':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be director admin'}))
         
         # Update Early Closure record with HOS response
-        utils.update_evaluation_director_response(db=db, evaluation_id=evaluation_id, response_data=response, user=user)
+        await utils.update_evaluation_director_response(db=db, evaluation_id=evaluation_id, response_data=response, user=user)
 
-        # TODO: Send notification to HR
         return Response(status_code=200, content=json.dumps({'message':'Director Response Submitted Successfully'}))
 
     except Exception as e:
@@ -321,47 +283,19 @@ async def respond_evaluation_director(
 
 @router.get('/evaluations')
 async def get_evaluations(
-    db: Session = Depends(get_db), 
-    current_user_id = Depends(security.get_current_user)
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db), 
+    user = Depends(security.get_authenticated_reader)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name not in ['hr', 'admin']:
+        if office_utils.role_name(user) not in ['hr', 'admin']:
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be hr or admin'}))
         
-        evaluations = utils.get_all_evaluations(db=db)
-        return_evaluations = list()
-
-        for eval in evaluations:
-            cmts = eval.comments
-            recipients = eval.recipients
-            grade = eval.grade.__dict__
-            del grade['_sa_instance_state']
-            del grade['created_at']
-            del grade['updated_at']
-
-            eval_dict = eval.__dict__
-            del eval_dict['_sa_instance_state']
-            eval_dict['created_at'] = eval_dict['created_at'].isoformat()
-            eval_dict['updated_at'] = eval_dict['updated_at'].isoformat()
-            eval_dict['grade'] = grade
-            eval_dict['comments'] = []
-            
-            for c in cmts:
-                c = c.__dict__
-                del c['_sa_instance_state'], c['early_closure_id'], c['message_id'], c['study_leave_id']
-                c['created_at'] = c['created_at'].isoformat()
-                c['updated_at'] = c['updated_at'].isoformat()
-                eval_dict['comments'].append(c)
-            
-            eval_dict['recipients'] = []
-            for r in recipients:
-                r = user_schema.User.to_dict(db_item=user).model_dump()
-                eval_dict['recipients'].append(r)
+        evaluations, next_cursor = await utils.get_all_evaluations(db=db, cursor=cursor, limit=limit)
+        return_evaluations = [schema.form_to_dict(item, with_recipients=True) for item in evaluations]
 
-            return_evaluations.append(eval_dict)
-        
-        return Response(status_code=200, content=json.dumps(return_evaluations))
+        return Response(status_code=200, content=json.dumps(return_evaluations), headers=pagination.next_cursor_header(next_cursor))
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
@@ -371,18 +305,16 @@ async def get_evaluations(
 @router.post('/submit-early-closure')
 async def submit_early_closure(
     early_closure_data: schema.EarlyClosureCreate,
-    db: Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'staff':
+        if office_utils.role_name(user) != 'staff':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be a teacher'}))
 
         # Create Early Closure record in the database
-        db_early_closure = utils.create_early_closure(db=db, early_closure_data=early_closure_data, sender=user.id)
+        db_early_closure = await utils.create_early_closure(db=db, early_closure_data=early_closure_data, sender=user.id)
 
-        # TODO: Send notification to HOS
         return Response(status_code=200, content=json.dumps({'message':'Early Closure Submitted Successfully'}))
     
     except Exception as e:
@@ -392,18 +324,16 @@ async def submit_early_closure(
 async def respond_early_closure_hos(
     early_closure_id: int,
     response_data: schema.EarlyClosureHOSResponse,
-    db: Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'hos':
+        if office_utils.role_name(user) != 'hos':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be head of section'}))
         
         # Update Early Closure record with HOS response
-        utils.update_early_closure_hos_response(db=db, early_closure_id=early_closure_id, response_data=response_data, user=user)
+        await utils.update_early_closure_hos_response(db=db, early_closure_id=early_closure_id, response_data=response_data, user=user)
 
-        # TODO: Send notification to HR
         return Response(status_code=200, content=json.dumps({'message':'HOS Response Submitted Successfully'}))
 
     except Exception as e:
@@ -413,18 +343,16 @@ async def respond_early_closure_hos(
 async def respond_early_closure_hr(
     early_closure_id: int,
     response_data: schema.EarlyClosureHRResponse,
-    db: Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'hr':
+        if office_utils.role_name(user) != 'hr':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be HR'}))
 
         # Update Early Closure record with HR response
-        utils.update_early_closure_hr_response(db=db, early_closure_id=early_closure_id, response_data=response_data, user=user)
+        await utils.update_early_closure_hr_response(db=db, early_closure_id=early_closure_id, response_data=response_data, user=user)
 
-        # TODO: Send notification to Director
         return Response(status_code=200, content=json.dumps({'message':'HR Response Submitted Successfully'}))
 
     except Exception as e:
@@ -434,18 +362,16 @@ async def respond_early_closure_hr(
 async def respond_early_closure_director(
     early_closure_id: int,
     response_data: schema.EarlyClosureDirectorResponse,
-    db: Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'admin':
+        if office_utils.role_name(user) != 'admin':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Director'}))
 
         # Update Early Closure record with Director response
-        utils.update_early_closure_director_response(db=db, early_closure_id=early_closure_id, response_data=response_data, user=user)
+        await utils.update_early_closure_director_response(db=db, early_closure_id=early_closure_id, response_data=response_data, user=user)
 
-        # TODO: Notify user or take any other necessary action
         return Response(status_code=200, content=json.dumps({'message':'Director Response Submitted Successfully'}))
 
     except Exception as e:
@@ -453,39 +379,18 @@ async def respond_early_closure_director(
     
 @router.get('/early-closure')
 async def get_all_early_closures(
-    db: Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)):
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    user = Depends(security.get_authenticated_reader)):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-
-        if user.role.name not in ['hr', 'admin']:
+        if office_utils.role_name(user) not in ['hr', 'admin']:
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be hr or admin'}))
             
-        early_closures = utils.get_all_early_closures(db=db)
-        return_messsages = []
-
-        for lr in early_closures:
-            cmts = lr.comments
-            recipients = lr.recipients
-            lr = lr.__dict__
-            del lr['_sa_instance_state']
-            lr['created_at'] = lr['created_at'].isoformat()
-            lr['updated_at'] = lr['updated_at'].isoformat()
-            lr['comments'] = []
-            for c in cmts:
-                c = c.__dict__
-                del c['_sa_instance_state'], c['evaluation_id'], c['message_id'], c['study_leave_id']
-                c['created_at'] = c['created_at'].isoformat()
-                c['updated_at'] = c['updated_at'].isoformat()
-                lr['comments'].append(c)
-            lr['recipients'] = []
-            for r in recipients:
-                r = user_schema.User.to_dict(db_item=user).model_dump()
-                lr['recipients'].append(r)
-            
-            return_messsages.append(lr)
+        early_closures, next_cursor = await utils.get_all_early_closures(db=db, cursor=cursor, limit=limit)
+        return_messsages = [schema.form_to_dict(item, with_recipients=True) for item in early_closures]
 
-        return Response(status_code=200, content=json.dumps(return_messsages))
+        return Response(status_code=200, content=json.dumps(return_messsages), headers=pagination.next_cursor_header(next_cursor))
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
@@ -496,18 +401,16 @@ async def get_all_early_closures(
 @router.post('/submit-study-leave')
 async def submit_study_leave(
     study_leave_data: schema.StudyLeaveApplicant,
-    db: Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'staff':
+        if office_utils.role_name(user) != 'staff':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be a staff'}))
 
         # Create Study Leave record in the database
-        db_study_leave = utils.create_study_leave(db=db, study_leave_data=study_leave_data, sender=user.id)
+        db_study_leave = await utils.create_study_leave(db=db, study_leave_data=study_leave_data, sender=user.id)
 
-        # TODO: Send notification to Head Teacher
         return Response(status_code=200, content=json.dumps({'message':'Study Leave Application Submitted Successfully'}))
     
     except Exception as e:
@@ -517,18 +420,16 @@ async def submit_study_leave(
 async def respond_study_leave_head_teacher(
     study_leave_id: int,
     response_data: schema.StudyLeaveHeadTeacher,
-    db: Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'hos':
+        if office_utils.role_name(user) != 'hos':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be a head teacher'}))
         
         # Update Study Leave record with Head Teacher's response
-        utils.update_study_leave_head_teacher_response(db=db, study_leave_id=study_leave_id, response_data=response_data, user=user)
+        await utils.update_study_leave_head_teacher_response(db=db, study_leave_id=study_leave_id, response_data=response_data, user=user)
 
-        # TODO: Send notification to HR
         return Response(status_code=200, content=json.dumps({'message':'Head Teacher Response Submitted Successfully'}))
 
     except Exception as e:
@@ -538,18 +439,16 @@ async def respond_study_leave_head_teacher(
 async def respond_study_leave_accountant(
     study_leave_id: int,
     response_data: schema.StudyLeaveAccountant,
-    db: Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'admin':
+        if office_utils.role_name(user) != 'admin':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be an accountant'}))
 
         # Update Study Leave record with Accountant's response
-        utils.update_study_leave_accountant_response(db=db, study_leave_id=study_leave_id, response_data=response_data, user=user)
+        await utils.update_study_leave_accountant_response(db=db, study_leave_id=study_leave_id, response_data=response_data, user=user)
 
-        # TODO: Send notification to HR
         return Response(status_code=200, content=json.dumps({'message':'Accountant Response Submitted Successfully'}))
 
     except Exception as e:
@@ -559,18 +458,16 @@ async def respond_study_leave_accountant(
 async def respond_study_leave_hr(
     study_leave_id: int,
     response_data: schema.StudyLeaveHR,
-    db: Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'hr':
+        if office_utils.role_name(user) != 'hr':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be HR'}))
 
         # Update Study Leave record with HR's response
-        utils.update_study_leave_hr_response(db=db, study_leave_id=study_leave_id, response_data=response_data, user=user)
+        await utils.update_study_leave_hr_response(db=db, study_leave_id=study_leave_id, response_data=response_data, user=user)
 
-        # TODO: Send notification to Director
         return Response(status_code=200, content=json.dumps({'message':'HR Response Submitted Successfully'}))
 
     except Exception as e:
@@ -580,56 +477,34 @@ async def respond_study_leave_hr(
 async def respond_study_leave_director(
     study_leave_id: int,
     response_data: schema.StudyLeaveDirector,
-    db: Session = Depends(get_db),
-    current_user_id = Depends(security.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name != 'admin':
+        if office_utils.role_name(user) != 'admin':
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Director'}))
 
         # Update Study Leave record with Director's response
-        utils.update_study_leave_director_response(db=db, study_leave_id=study_leave_id, response_data=response_data, user=user)
+        await utils.update_study_leave_director_response(db=db, study_leave_id=study_leave_id, response_data=response_data, user=user)
 
-        # TODO: Notify user or take any other necessary action
         return Response(status_code=200, content=json.dumps({'message':'Director Response Submitted Successfully'}))
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occurred', 'error': str(e)}))
 
 @router.get('/study-leaves')
-async def view_all_leave_requests(db: Session = Depends(get_db), 
-                                  current_user_id = Depends(security.get_current_user)):
+async def view_all_leave_requests(limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+                                  cursor: Optional[str] = None,
+                                  db: AsyncSession = Depends(get_read_db), 
+                                  user = Depends(security.get_authenticated_reader)):
     try:
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-
-        if user.role.name not in ['hr', 'admin']:
+        if office_utils.role_name(user) not in ['hr', 'admin']:
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be hr or admin'}))
             
-        leave_requests = utils.get_all_leave_requests(db=db)
-        return_messsages = []
-
-        for lr in leave_requests:
-            cmts = lr.comments
-            recipients = lr.recipients
-            lr = lr.__dict__
-            del lr['_sa_instance_state']
-            lr['created_at'] = lr['created_at'].isoformat()
-            lr['updated_at'] = lr['updated_at'].isoformat()
-            lr['comments'] = []
-            for c in cmts:
-                c = c.__dict__
-                del c['_sa_instance_state'], c['evaluation_id'], c['message_id'], c['early_closure_id']
-                c['created_at'] = c['created_at'].isoformat()
-                c['updated_at'] = c['updated_at'].isoformat()
-                lr['comments'].append(c)
-            lr['recipients'] = []
-            for r in recipients:
-                r = user_schema.User.to_dict(db_item=user).model_dump()
-                lr['recipients'].append(r)
-            return_messsages.append(lr)
-
-        return Response(status_code=200, content=json.dumps(return_messsages))
+        leave_requests, next_cursor = await utils.get_all_leave_requests(db=db, cursor=cursor, limit=limit)
+        return_messsages = [schema.form_to_dict(item, with_recipients=True) for item in leave_requests]
+
+        return Response(status_code=200, content=json.dumps(return_messsages), headers=pagination.next_cursor_header(next_cursor))
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
@@ -638,26 +513,26 @@ async def view_all_leave_requests(db: Session = Depends(get_db),
 @router.post('/share-leave-request')
 async def share_leave_request_with_next_office(
     share_leave_request: schema.ShareLeaveRequest,
-    db: Session = Depends(get_db), 
-    current_user_id = Depends(security.get_current_user)):
+    db: AsyncSession = Depends(get_db), 
+    user = Depends(security.get_authenticated_user)):
     #assuming that the leave request would be forwarded to an admin or all the admin
     try:
 
-        user = user_utils.get_user(db=db, user_id=current_user_id.id)
-
-        if user.role.name != 'hos':
+        if office_utils.role_name(user) != 'hos':
             raise HTTPException(status_code=401, detail="Not authorized to share leave request. must be head of section")
         
-        db_message = utils.get_message(db=db, message_id=share_leave_request.message_id)
+        db_message = await db.get(model.Message, share_leave_request.message_id)
+        if db_message is None:
+            raise ValueError('Message not found')
         
-        for recipient in share_leave_request.recipients:
-            db_message.recipients.append(user_utils.get_user_by_email(email=recipient, db=db))
-        
-        db.commit()
-        db.refresh(db_message)
-
-        #TODO: send notification to recipient ...
-        return Response(status_code=200, content=json.dumps({'message':'Message shared successfully'}))
+        unknown_recipients, added = await utils.add_recipients(db=db, item=model.Message, item_id=db_message.id, emails=share_leave_request.recipients)
+        # only people it was not already shared with
+        await jobs_utils.notify(db=db, user_ids=added, subject='A leave request was shared with you',
+                                text=f'{user.first_name} {user.last_name} shared "{db_message.title}" with you.')
+        await db.commit()
+
+        return Response(status_code=200, content=json.dumps({'message':'Message shared successfully',
+                                                             'unknown_recipients': unknown_recipients}))
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
\ No newline at end of file
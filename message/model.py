@@ -1,4 +1,4 @@
-from sqlalchemy import String, Column, DateTime, func, Integer, ForeignKey, Table
+from sqlalchemy import String, Column, DateTime, func, Integer, BigInteger, ForeignKey, Table, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from config.database import Base
@@ -6,24 +6,26 @@ from config.database import Base
 message_recipients_association = Table(
     'message_recipients_association',
     Base.metadata,
-    Column('message_id', Integer, ForeignKey('messages.id', ondelete='CASCADE')),
-    Column('recipient_id', Integer, ForeignKey('users.id', ondelete='CASCADE')),
+    Column('message_id', Integer, ForeignKey('messages.id', ondelete='CASCADE'), primary_key=True),
+    Column('recipient_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
     Column('created_at', DateTime, nullable=False, default=func.now()),
     Column('updated_at', DateTime, nullable=False, default=func.now()),
+    # inbox lookups go from the recipient to the form
+    Index('ix_message_recipients_association_recipient', 'recipient_id', 'message_id'),
 )
 
 class Message(Base):
     __tablename__ = 'messages'
 
     id = Column(Integer, primary_key=True)
-    sender_id = Column(Integer, ForeignKey("users.id", ondelete='CASCADE'))
+    sender_id = Column(Integer, ForeignKey("users.id", ondelete='CASCADE'), index=True)
     label = Column(String, nullable=False)
     title = Column(String, nullable=False)
     text = Column(String, nullable=True)
     document = Column(String, nullable=True)
     type = Column(String)
     status = Column(String, nullable=False, default='pending')
-    created_at = Column(DateTime, nullable=False, default=func.now())
+    created_at = Column(DateTime, nullable=False, default=func.now(), index=True)
     updated_at = Column(DateTime, nullable=False, default=func.now())
     
     sender = relationship("User", back_populates="sent_messages", foreign_keys=[sender_id])
@@ -38,10 +40,10 @@ class Comment(Base):
     id = Column(Integer, primary_key=True)
     text = Column(String, nullable=False)
     
-    message_id = Column(Integer, ForeignKey("messages.id", ondelete='CASCADE'))
-    evaluation_id = Column(Integer, ForeignKey("evaluations.id", ondelete='CASCADE'))
-    early_closure_id = Column(Integer, ForeignKey("early-closures.id", ondelete='CASCADE'))
-    study_leave_id = Column(Integer, ForeignKey("study-leave.id", ondelete='CASCADE'))
+    message_id = Column(Integer, ForeignKey("messages.id", ondelete='CASCADE'), index=True)
+    evaluation_id = Column(Integer, ForeignKey("evaluations.id", ondelete='CASCADE'), index=True)
+    early_closure_id = Column(Integer, ForeignKey("early-closures.id", ondelete='CASCADE'), index=True)
+    study_leave_id = Column(Integer, ForeignKey("study-leave.id", ondelete='CASCADE'), index=True)
     type = Column(String, nullable=False, default='message')
     
     sender_id = Column(Integer, ForeignKey("users.id", ondelete='CASCADE'))
@@ -58,17 +60,19 @@ class Comment(Base):
 evaluation_recipients_association = Table(
     'evaluation_recipients_association',
     Base.metadata,
-    Column('evaluation_id', Integer, ForeignKey('evaluations.id', ondelete='CASCADE')),
-    Column('recipient_id', Integer, ForeignKey('users.id', ondelete='CASCADE')),
+    Column('evaluation_id', Integer, ForeignKey('evaluations.id', ondelete='CASCADE'), primary_key=True),
+    Column('recipient_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
     Column('created_at', DateTime, nullable=False, default=func.now()),
     Column('updated_at', DateTime, nullable=False, default=func.now()),
+    # inbox lookups go from the recipient to the form
+    Index('ix_evaluation_recipients_association_recipient', 'recipient_id', 'evaluation_id'),
 )
 
 class Evaluation(Base):
     __tablename__ = 'evaluations'
 
     id = Column(Integer, primary_key=True)
-    created_at = Column(DateTime, nullable=False, default=func.now())
+    created_at = Column(DateTime, nullable=False, default=func.now(), index=True)
     updated_at = Column(DateTime, nullable=False, default=func.now())
 
     supervisor = Column(String, nullable=False, default='no response')
@@ -92,7 +96,7 @@ class Evaluation(Base):
     #grades
     grade = relationship('Grade', uselist=False, back_populates='evaluation', cascade="all, delete-orphan")
 
-    sender_id = Column(Integer, ForeignKey("users.id", ondelete='CASCADE'))
+    sender_id = Column(Integer, ForeignKey("users.id", ondelete='CASCADE'), index=True)
     sender = relationship("User", back_populates="sent_evaluations", foreign_keys=[sender_id])
     recipients = relationship("User", back_populates="received_evaluations", secondary=evaluation_recipients_association)
     comments = relationship("Comment", back_populates="evaluation", foreign_keys="[Comment.evaluation_id]", cascade="all, delete-orphan")
@@ -142,17 +146,19 @@ class Grade(Base):
 early_closure_recipients_association = Table(
     'early_closure_recipients_association',
     Base.metadata,
-    Column('early_closure_id', Integer, ForeignKey('early-closures.id', ondelete='CASCADE')),
-    Column('recipient_id', Integer, ForeignKey('users.id', ondelete='CASCADE')),
+    Column('early_closure_id', Integer, ForeignKey('early-closures.id', ondelete='CASCADE'), primary_key=True),
+    Column('recipient_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
     Column('created_at', DateTime, nullable=False, default=func.now()),
     Column('updated_at', DateTime, nullable=False, default=func.now()),
+    # inbox lookups go from the recipient to the form
+    Index('ix_early_closure_recipients_association_recipient', 'recipient_id', 'early_closure_id'),
 )
 
 class EarlyClosure(Base):
     __tablename__ = 'early-closures'
 
     id = Column(Integer, primary_key=True)
-    created_at = Column(DateTime, nullable=False, default=func.now())
+    created_at = Column(DateTime, nullable=False, default=func.now(), index=True)
     updated_at = Column(DateTime, nullable=False, default=func.now())
 
     teacher = Column(String, nullable=False, default='no response')
@@ -181,7 +187,7 @@ class EarlyClosure(Base):
     director_signature = Column(String, nullable=False, default='no response')
     school_stamp = Column(String, nullable=False, default='no response')
 
-    sender_id = Column(Integer, ForeignKey("users.id"))
+    sender_id = Column(Integer, ForeignKey("users.id"), index=True)
     sender = relationship("User", back_populates="sent_early_closures", foreign_keys=[sender_id])
     comments = relationship("Comment", back_populates="early_closure", foreign_keys="[Comment.early_closure_id]", cascade="all, delete-orphan")
     recipients = relationship("User", back_populates="received_early_closures", secondary=early_closure_recipients_association)
@@ -189,16 +195,18 @@ class EarlyClosure(Base):
 study_leave_recipients_association = Table(
     'study_leave_recipients_association',
     Base.metadata,
-    Column('early_leave_id', Integer, ForeignKey('study-leave.id', ondelete='CASCADE')),
-    Column('recipient_id', Integer, ForeignKey('users.id', ondelete='CASCADE')),
+    Column('early_leave_id', Integer, ForeignKey('study-leave.id', ondelete='CASCADE'), primary_key=True),
+    Column('recipient_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
     Column('created_at', DateTime, nullable=False, default=func.now()),
     Column('updated_at', DateTime, nullable=False, default=func.now()),
+    # inbox lookups go from the recipient to the form
+    Index('ix_study_leave_recipients_association_recipient', 'recipient_id', 'early_leave_id'),
 )
 class StudyLeave(Base):
     __tablename__ = 'study-leave'
 
     id = Column(Integer, primary_key=True)
-    created_at = Column(DateTime, nullable=False, default=func.now())
+    created_at = Column(DateTime, nullable=False, default=func.now(), index=True)
     updated_at = Column(DateTime, nullable=False, default=func.now())
 
     #applicant info
@@ -264,7 +272,59 @@ class StudyLeave(Base):
     hr_signature = Column(String, nullable=False, default='no response')
     director_signature = Column(String, nullable=False, default='no response')
 
-    sender_id = Column(Integer, ForeignKey("users.id"))
+    sender_id = Column(Integer, ForeignKey("users.id"), index=True)
     sender = relationship("User", back_populates="sent_study_leaves", foreign_keys=[sender_id])
     comments = relationship("Comment", back_populates="study_leave", foreign_keys="[Comment.study_leave_id]", cascade="all, delete-orphan")
     recipients = relationship("User", back_populates="received_study_leaves", secondary=study_leave_recipients_association)
+
+class MailboxEntry(Base):
+    # one row per item in someone's inbox or outbox, whatever its kind, so a
+    # mailbox page is one range scan; written in the same transaction as the item
+    # and its recipients (message.utils.add_mailbox_entries)
+    __tablename__ = 'mailbox_entries'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'box', 'kind', 'ref_id', name='uq_mailbox_entries_item'),
+        # newest first per mailbox, the keyset order of helpers.pagination
+        Index('ix_mailbox_entries_page', 'user_id', 'box', 'created_at', 'id'),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    box = Column(String, nullable=False)
+    # the mailbox section the item is listed under: messages, evaluations, early_closures or study_leaves
+    kind = Column(String, nullable=False)
+    ref_id = Column(Integer, nullable=False)
+    # the item's own created_at, entries sort like the items they point at
+    created_at = Column(DateTime, nullable=False)
+    # messages: the message's status; forms: 'sent' in the outbox, and in the inbox
+    # 'pending' until this recipient has done their step, then 'responded'
+    status = Column(String, nullable=True)
+    # when the owner opened it, inbox only
+    read_at = Column(DateTime, nullable=True)
+
+class MailboxCounter(Base):
+    # badge counts per user, changed in the same transaction as the mailbox
+    # entries they count (message.utils.bump_counters): inbox messages not
+    # read yet, and forms waiting for this user's step; plus the mailbox version.
+    # the database defaults let the migrations' backfills leave columns out
+    __tablename__ = 'mailbox_counters'
+
+    user_id = Column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    unread_messages = Column(Integer, nullable=False, default=0, server_default='0')
+    pending_evaluations = Column(Integer, nullable=False, default=0, server_default='0')
+    pending_early_closures = Column(Integer, nullable=False, default=0, server_default='0')
+    pending_study_leaves = Column(Integer, nullable=False, default=0, server_default='0')
+    # bumped by every change to anything in this user's inbox or outbox (message.utils.touch_mailboxes)
+    version = Column(BigInteger, nullable=False, default=0, server_default='0')
+
+class StoredObject(Base):
+    # one row per distinct uploaded file, stored under its content hash; whether
+    # anything still uses it is up to the reaper, which checks the forms themselves
+    __tablename__ = 'stored_objects'
+
+    key = Column(String, primary_key=True)
+    sha256 = Column(String(64), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
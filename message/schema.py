@@ -3,9 +3,13 @@ from pydantic import BaseModel
 from message.model import Message as MMessage
 from message.model import Comment as MComment
 from message.model import Evaluation as MEvaluation
-from sqlalchemy.orm import Session
-from user import utils as user_utils
+from message.model import EarlyClosure as MEarlyClosure
+from message.model import StudyLeave as MStudyLeave
+from message.model import Grade as MGrade
+from user import schema as user_schema
+from helpers.serializers import ModelSerializer
 from datetime import datetime
+
 class CreateComment(BaseModel):
     text: str
     message_id: int
@@ -35,11 +39,12 @@ class ReturnMessage(BaseModel):
     updated_at: str
 
     @classmethod
-    def to_dict(cls, msg:MMessage, comments:MComment, db:Session) -> "ReturnMessage":
+    def to_dict(cls, msg:MMessage, comments:MComment) -> "ReturnMessage":
+        # expects sender, recipients and comment senders loaded (message_utils.MAILBOX_LOADS)
         recipients = [f'{r.first_name} {r.last_name}' for r in msg.recipients]
         return cls (
             message_id=msg.id, 
-            sender=f"{user_utils.get_user(db=db, user_id=msg.sender_id).first_name} {user_utils.get_user(db=db, user_id=msg.sender_id).last_name}", 
+            sender=f"{msg.sender.first_name} {msg.sender.last_name}", 
             recipients=recipients,
             label=msg.label,
             title=msg.title,
@@ -50,7 +55,7 @@ class ReturnMessage(BaseModel):
             updated_at = msg.updated_at.isoformat(),
             comments = [{'comments_id':comment.id, 
                          'text':comment.text, 
-                         'sender':f'{user_utils.get_user(db=db, user_id=comment.sender_id).first_name} {user_utils.get_user(db=db, user_id=comment.sender_id).last_name}'} 
+                         'sender':f'{comment.sender.first_name} {comment.sender.last_name}'} 
                         for comment in comments]
         )
 
@@ -63,6 +68,17 @@ class ShareLeaveRequest(BaseModel):
     recipients: List[str]
 
 
+class PresignUpload(BaseModel):
+    filename: str
+    content_type: str
+    size: int
+
+class ConfirmUpload(BaseModel):
+    key: str
+    target: str
+    id: int
+    field: str
+
 ### EVALUATION ###
 class GradeBase(BaseModel):
     completes_task_on_time: str
@@ -262,4 +278,32 @@ class StudyLeaveHR(BaseModel):
 class StudyLeaveDirector(BaseModel):
     approval_status: str
     director_date: str
-    director_signature: str
\ No newline at end of file
+    director_signature: str
+
+
+### SERIALIZERS ###
+
+# a comment only shows the foreign key of the form it belongs to
+COMMENT_PARENTS = ('message_id', 'evaluation_id', 'early_closure_id', 'study_leave_id')
+
+def comment_serializer(parent: str) -> ModelSerializer:
+    return ModelSerializer(MComment, exclude=[p for p in COMMENT_PARENTS if p != parent])
+
+FORM_SERIALIZERS = {
+    MEarlyClosure: (ModelSerializer(MEarlyClosure), comment_serializer('early_closure_id')),
+    MStudyLeave: (ModelSerializer(MStudyLeave), comment_serializer('study_leave_id')),
+    MEvaluation: (ModelSerializer(MEvaluation), comment_serializer('evaluation_id')),
+}
+
+grade_serializer = ModelSerializer(MGrade, exclude=('created_at', 'updated_at'))
+
+def form_to_dict(form, with_recipients: bool = False) -> dict:
+    # expects comments (and grade, recipients when used) loaded, see message_utils.MAILBOX_LOADS
+    serialize, serialize_comment = FORM_SERIALIZERS[type(form)]
+    data = serialize(form)
+    if isinstance(form, MEvaluation):
+        data['grade'] = grade_serializer(form.grade) if form.grade is not None else None
+    data['comments'] = [serialize_comment(comment) for comment in form.comments]
+    if with_recipients:
+        data['recipients'] = [user_schema.User.to_dict(db_item=recipient).model_dump() for recipient in form.recipients]
+    return data
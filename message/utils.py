@@ -1,10 +1,293 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, exists, update, delete, literal, func, literal_column, values, column, Integer, BigInteger
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from message import model
 from message import schema
 from typing import List
 from user import utils as user_utils
+from user.model import User
+from helpers import pagination, events
 
-def create_message(db: Session, recipients:List[str], message: schema.CreateMessage):
+# relationships each mailbox section serializes, loaded up front so a whole
+# mailbox costs a fixed number of queries however many items it holds
+MAILBOX_LOADS = {
+    model.Message: (joinedload(model.Message.sender),
+                    selectinload(model.Message.recipients),
+                    selectinload(model.Message.comments).joinedload(model.Comment.sender)),
+    model.EarlyClosure: (selectinload(model.EarlyClosure.comments),),
+    model.StudyLeave: (selectinload(model.StudyLeave.comments),),
+    model.Evaluation: (selectinload(model.Evaluation.comments),
+                       selectinload(model.Evaluation.grade)),
+}
+
+MAILBOX_SECTIONS = {
+    'messages': model.Message,
+    'study_leaves': model.StudyLeave,
+    'early_closures': model.EarlyClosure,
+    'evaluations': model.Evaluation,
+}
+# mailbox_entries.kind of each item
+MAILBOX_KINDS = {item: name for name, item in MAILBOX_SECTIONS.items()}
+
+# what a comment of each type is attached to
+COMMENT_ITEMS = {
+    'message': model.Message,
+    'study_leave': model.StudyLeave,
+    'early closure': model.EarlyClosure,
+    'evaluation': model.Evaluation,
+}
+
+# association table and its column pointing at the form
+RECIPIENT_TABLES = {
+    model.Message: (model.message_recipients_association, 'message_id'),
+    model.Evaluation: (model.evaluation_recipients_association, 'evaluation_id'),
+    model.EarlyClosure: (model.early_closure_recipients_association, 'early_closure_id'),
+    model.StudyLeave: (model.study_leave_recipients_association, 'early_leave_id'),
+}
+
+# the list endpoints also show every recipient
+LIST_LOADS = {
+    item: loads + (selectinload(item.recipients).joinedload(User.role),) for item, loads in MAILBOX_LOADS.items() if item is not model.Message
+}
+
+# the badge counter an inbox entry of each kind counts towards: messages while
+# unread, forms while waiting for the owner's step
+COUNTER_COLUMNS = {
+    'messages': 'unread_messages',
+    'evaluations': 'pending_evaluations',
+    'early_closures': 'pending_early_closures',
+    'study_leaves': 'pending_study_leaves',
+}
+
+def counts_towards_badge(kind: str, status, read_at):
+    return read_at is None if kind == 'messages' else status == 'pending'
+
+async def bump_counters(db: AsyncSession, changes):
+    # changes: (user_id, kind, +1 or -1) for inbox entries that started or
+    # stopped counting; one upsert for all of them, in user order so concurrent
+    # writers lock the rows in the same order
+    try:
+        deltas = {}
+        for user_id, kind, delta in changes:
+            row = deltas.setdefault(user_id, dict.fromkeys(COUNTER_COLUMNS.values(), 0))
+            row[COUNTER_COLUMNS[kind]] += delta
+        if not deltas:
+            return
+        columns = list(COUNTER_COLUMNS.values())
+        changed = (values(column('user_id', BigInteger), *(column(name, Integer) for name in columns), name='changed')
+                   .data([(user_id, *(row[name] for name in columns)) for user_id, row in sorted(deltas.items())]))
+        changed = select(changed).cte('changed')
+        # counts never go below 0, neither on a new row nor on one that is already there
+        statement = (insert(model.MailboxCounter)
+                     .add_cte(changed)
+                     .from_select(['user_id', *columns],
+                                  select(changed.c.user_id, *(func.greatest(changed.c[name], 0) for name in columns))
+                                  .order_by(changed.c.user_id)))
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[model.MailboxCounter.user_id],
+            set_={name: func.greatest(getattr(model.MailboxCounter, name)
+                                      + select(changed.c[name]).where(changed.c.user_id == literal_column('excluded.user_id')).scalar_subquery(), 0)
+                  for name in columns}))
+    except Exception as e:
+        raise e
+
+async def touch_mailboxes(db: AsyncSession, item, item_id):
+    # the item changed, so did every mailbox it is in: bump their versions
+    try:
+        query = (select(model.MailboxEntry.user_id, *(literal(0) for _ in COUNTER_COLUMNS), literal(1))
+                 .where(model.MailboxEntry.kind == MAILBOX_KINDS[item], model.MailboxEntry.ref_id == item_id)
+                 .distinct().order_by(model.MailboxEntry.user_id))
+        touched = (await db.execute(insert(model.MailboxCounter)
+                                    .from_select(['user_id', *COUNTER_COLUMNS.values(), 'version'], query)
+                                    .on_conflict_do_update(index_elements=[model.MailboxCounter.user_id],
+                                                           set_={'version': model.MailboxCounter.version + 1})
+                                    .returning(model.MailboxCounter.user_id))).scalars().all()
+        # and their open streams hear about it once the change commits
+        await events.publish(db=db, user_ids=touched, event={'type': 'item_updated', 'kind': MAILBOX_KINDS[item], 'id': item_id})
+    except Exception as e:
+        raise e
+
+async def touch_user_mailboxes(db: AsyncSession, user_ids):
+    try:
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        statement = insert(model.MailboxCounter).values([{'user_id': user_id, 'version': 1} for user_id in user_ids])
+        await db.execute(statement.on_conflict_do_update(index_elements=[model.MailboxCounter.user_id],
+                                                         set_={'version': model.MailboxCounter.version + 1}))
+        await events.publish(db=db, user_ids=user_ids, event={'type': 'mailbox_updated'})
+    except Exception as e:
+        raise e
+
+async def get_mailbox_version(db: AsyncSession, user_id):
+    try:
+        return (await db.execute(select(model.MailboxCounter.version).where(model.MailboxCounter.user_id == user_id))).scalar() or 0
+    except Exception as e:
+        raise e
+
+def entry_status(item, box: str):
+    # what a new mailbox entry starts as, see model.MailboxEntry.status
+    if item is model.Message:
+        return model.Message.status
+    return literal('sent' if box == 'outbox' else 'pending')
+
+async def add_mailbox_entries(db: AsyncSession, item, item_id, user_ids, box: str):
+    # one insert, the entry copies created_at (and a message's status) from the item
+    try:
+        if not user_ids:
+            return
+        query = (select(User.id, literal(box), literal(MAILBOX_KINDS[item]), item.id, item.created_at, entry_status(item, box))
+                 .where(item.id == item_id, User.id.in_(list(user_ids))))
+        added = (await db.execute(insert(model.MailboxEntry)
+                                  .from_select(['user_id', 'box', 'kind', 'ref_id', 'created_at', 'status'], query)
+                                  .on_conflict_do_nothing()
+                                  .returning(model.MailboxEntry.user_id))).scalars().all()
+        if box == 'inbox':
+            # new inbox entries are unread and pending, they all count
+            await bump_counters(db=db, changes=[(user_id, MAILBOX_KINDS[item], 1) for user_id in added])
+            await events.publish(db=db, user_ids=added, event={'type': 'new_item', 'kind': MAILBOX_KINDS[item], 'id': item_id})
+    except Exception as e:
+        raise e
+
+async def mark_responded(db: AsyncSession, item, item_id, user_id):
+    # the recipient has done their step on the form
+    try:
+        responded = (await db.execute(update(model.MailboxEntry)
+                                      .where(model.MailboxEntry.user_id == user_id, model.MailboxEntry.box == 'inbox',
+                                             model.MailboxEntry.kind == MAILBOX_KINDS[item], model.MailboxEntry.ref_id == item_id,
+                                             model.MailboxEntry.status == 'pending')
+                                      .values(status='responded')
+                                      .returning(model.MailboxEntry.user_id))).scalars().all()
+        await bump_counters(db=db, changes=[(user_id, MAILBOX_KINDS[item], -1) for user_id in responded])
+        # the step also changed the form for everyone on it
+        await touch_mailboxes(db=db, item=item, item_id=item_id)
+    except Exception as e:
+        raise e
+
+async def mark_read(db: AsyncSession, user_id, kind: str, item_id: int):
+    # the owner opened an item in their inbox; reading it again changes nothing
+    try:
+        if kind not in MAILBOX_SECTIONS:
+            raise ValueError(f'Unknown mailbox section {kind}')
+        read = (await db.execute(update(model.MailboxEntry)
+                                 .where(model.MailboxEntry.user_id == user_id, model.MailboxEntry.box == 'inbox',
+                                        model.MailboxEntry.kind == kind, model.MailboxEntry.ref_id == item_id,
+                                        model.MailboxEntry.read_at.is_(None))
+                                 .values(read_at=func.now())
+                                 .returning(model.MailboxEntry.status, model.MailboxEntry.read_at))).all()
+        # only what stopped counting: a message once read, a form not until its step is done
+        await bump_counters(db=db, changes=[(user_id, kind, -1) for status, read_at in read
+                                            if counts_towards_badge(kind, status, None) and not counts_towards_badge(kind, status, read_at)])
+        if read:
+            await touch_user_mailboxes(db=db, user_ids=[user_id])
+        await db.commit()
+        return bool(read)
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+async def get_counters(db: AsyncSession, user_id):
+    # badge counts, one primary key lookup
+    try:
+        counter = await db.get(model.MailboxCounter, user_id)
+        return {column: getattr(counter, column) if counter else 0 for column in COUNTER_COLUMNS.values()}
+    except Exception as e:
+        raise e
+
+async def remove_sent_from_mailboxes(db: AsyncSession, sender_id):
+    # entries of everything sender_id sent, which goes with them when they are deleted
+    try:
+        for item, kind in MAILBOX_KINDS.items():
+            removed = (await db.execute(delete(model.MailboxEntry)
+                                        .where(model.MailboxEntry.kind == kind,
+                                               model.MailboxEntry.ref_id.in_(select(item.id).where(item.sender_id == sender_id)))
+                                        .returning(model.MailboxEntry.user_id, model.MailboxEntry.box,
+                                                   model.MailboxEntry.status, model.MailboxEntry.read_at))).all()
+            await bump_counters(db=db, changes=[(user_id, kind, -1) for user_id, box, status, read_at in removed
+                                                if box == 'inbox' and user_id != sender_id and counts_towards_badge(kind, status, read_at)])
+            await touch_user_mailboxes(db=db, user_ids=[user_id for user_id, _, _, _ in removed if user_id != sender_id])
+    except Exception as e:
+        raise e
+
+async def add_recipients(db: AsyncSession, item, item_id, emails: List[str]):
+    # one lookup for every address and one insert for every row, users already
+    # on the form are skipped; returns the addresses that match no user and the
+    # ids of the users this added
+    try:
+        emails = list(dict.fromkeys(email.strip() for email in emails if email and email.strip()))
+        user_ids = await user_utils.get_user_ids_by_emails(db=db, emails=emails)
+        added = []
+        if user_ids:
+            table, column = RECIPIENT_TABLES[item]
+            added = (await db.execute(insert(table)
+                                      .values([{column: item_id, 'recipient_id': user_id} for user_id in user_ids.values()])
+                                      .on_conflict_do_nothing()
+                                      .returning(table.c.recipient_id))).scalars().all()
+            await add_mailbox_entries(db=db, item=item, item_id=item_id, user_ids=added, box='inbox')
+        # new recipients show up on the item, and a new item in its sender's outbox
+        await touch_mailboxes(db=db, item=item, item_id=item_id)
+        return [email for email in emails if email not in user_ids], added
+    except Exception as e:
+        raise e
+
+async def add_recipient(db: AsyncSession, item, item_id, email: str):
+    # the recipient_* fields of the workflows name one person, who has to exist
+    unknown, _ = await add_recipients(db=db, item=item, item_id=item_id, emails=[email])
+    if unknown:
+        raise ValueError(f'No user with email {unknown[0]}')
+
+async def is_recipient(db: AsyncSession, item, item_id, user_id):
+    table, column = RECIPIENT_TABLES[item]
+    query = select(exists().where(table.c[column] == item_id, table.c.recipient_id == user_id))
+    return (await db.execute(query)).scalar()
+
+# the columns a confirmed direct upload can be attached to, with whose step fills
+# each one: None for the form's sender, otherwise the offices allowed to make that
+# respond-* step (the check the endpoint itself makes), as a recipient of the form
+UPLOAD_TARGETS = {
+    'message': (model.Message, {'document': None}),
+    'evaluation': (model.Evaluation, {'supervisor_signature': None,
+                                      'head_teacher_signature': ('hos',),
+                                      'school_admin_signature': ('hr',),
+                                      'director_signature': ('admin',)}),
+    'early_closure': (model.EarlyClosure, {'teacher_signature': None,
+                                           'head_signature': ('hos',),
+                                           'hro_signature': ('hr',),
+                                           'director_signature': ('admin',),
+                                           'school_stamp': ('hr', 'admin')}),
+    'study_leave': (model.StudyLeave, {'applicant_signature': None,
+                                       'head_signature': ('hos',),
+                                       'accountant_signature': ('admin',),
+                                       'hr_signature': ('hr',),
+                                       'director_signature': ('admin',)}),
+}
+
+async def attach_upload(db: AsyncSession, target: str, item_id: int, field: str, url: str, user_id, role: str):
+    # a file goes only where its uploader could have put it through the form's own steps
+    try:
+        if target not in UPLOAD_TARGETS:
+            raise ValueError(f'Unknown upload target {target}')
+        item, fields = UPLOAD_TARGETS[target]
+        if field not in fields:
+            raise ValueError(f'{target} has no file field {field}')
+        db_item = await db.get(item, item_id)
+        if db_item is None:
+            raise ValueError(f'{target} not found')
+        roles = fields[field]
+        if roles is None:
+            if db_item.sender_id != user_id:
+                raise ValueError(f'Only the sender of this {target} can set {field}')
+        elif role not in roles or not await is_recipient(db=db, item=item, item_id=item_id, user_id=user_id):
+            raise ValueError(f'Not allowed to set {field} on this {target}')
+        setattr(db_item, field, url)
+        await touch_mailboxes(db=db, item=item, item_id=item_id)
+        await db.commit()
+        return db_item
+    except Exception as e:
+        raise e
+
+async def create_message(db: AsyncSession, recipients:List[str], message: schema.CreateMessage):
     try:
         result = model.Message(sender_id=message.sender_id, 
                             label=message.label, 
@@ -13,33 +296,54 @@ def create_message(db: Session, recipients:List[str], message: schema.CreateMess
                             document=message.document, 
                             type=message.type,
                             status=message.status)
-        
-        for recipient in recipients:
-            user = user_utils.get_user_by_email(email=recipient, db=db)
-            result.recipients.append(user)
         db.add(result)
-        db.commit()
-        db.refresh(result)
-        return result
+        await db.flush()
+        await add_mailbox_entries(db=db, item=model.Message, item_id=result.id, user_ids=[result.sender_id], box='outbox')
+        unknown, _ = await add_recipients(db=db, item=model.Message, item_id=result.id, emails=recipients)
+        await db.commit()
+        return result, unknown
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise e
     
-def get_message(db: Session, message_id):
+async def get_message(db: AsyncSession, message_id):
+    try:
+        result = await db.execute(select(model.Message).options(selectinload(model.Message.recipients)).where(model.Message.id == message_id))
+        return result.scalars().first()
+    except Exception as e:
+        raise e
+
+async def get_mailbox(db: AsyncSession, user_id, box: str, cursor: str = None, limit: int = pagination.DEFAULT_LIMIT):
+    # one page of mailbox_entries, newest first across every kind, then each
+    # kind's items by id; returns them split into the mailbox sections, the
+    # cursor of the next page and the (kind, id) of the items already read
     try:
-        message = db.query(model.Message).filter(model.Message.id == message_id).first()
-        return message
+        query = select(model.MailboxEntry).where(model.MailboxEntry.user_id == user_id, model.MailboxEntry.box == box)
+        query = pagination.keyset(query, model.MailboxEntry, pagination.decode_cursor(cursor).get('entries'), limit)
+        entries, position = pagination.split_page((await db.execute(query)).scalars().all(), limit)
+
+        sections = {}
+        for name, item in MAILBOX_SECTIONS.items():
+            ids = [entry.ref_id for entry in entries if entry.kind == name]
+            rows = {}
+            if ids:
+                result = await db.execute(select(item).where(item.id.in_(ids)).options(*MAILBOX_LOADS[item]))
+                rows = {row.id: row for row in result.scalars()}
+            sections[name] = [rows[id] for id in ids if id in rows]
+
+        read = {(entry.kind, entry.ref_id) for entry in entries if entry.read_at is not None}
+        return sections, pagination.encode_cursor({'entries': position} if position else None), read
     except Exception as e:
         raise e
 
-def get_all_messages(db: Session):
+async def get_all_messages(db: AsyncSession):
     try:
-        messages = db.query(model.Message).all()
-        return messages
+        result = await db.execute(select(model.Message))
+        return result.scalars().all()
     except Exception as e:
         raise e
 
-def create_comment(db: Session, comment: schema.CreateComment, sender_id):
+async def create_comment(db: AsyncSession, comment: schema.CreateComment, sender_id):
     
     try:
         if comment.type == 'message':
@@ -67,190 +371,210 @@ def create_comment(db: Session, comment: schema.CreateComment, sender_id):
                              "message", "evaluation", "study leave" or "early closure"')
         
         db.add(result)
-        db.commit()
-        db.refresh(result)
+        await touch_mailboxes(db=db, item=COMMENT_ITEMS[comment.type], item_id=comment.message_id)
+        await db.commit()
+        await db.refresh(result)
         return result
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise e
     
-def get_all_leave_requests(db: Session):
+async def get_all_leave_requests(db: AsyncSession, cursor: str = None, limit: int = pagination.DEFAULT_LIMIT):
     try:
-        leave_requests = db.query(model.StudyLeave).all()
-        return leave_requests
+        query = select(model.StudyLeave).options(*LIST_LOADS[model.StudyLeave])
+        query = pagination.keyset(query, model.StudyLeave, pagination.decode_cursor(cursor).get('items'), limit)
+        rows, position = pagination.split_page((await db.execute(query)).scalars().all(), limit)
+        return rows, pagination.encode_cursor({'items': position} if position else None)
     except Exception as e:
         raise e
     
-def get_all_early_closures(db: Session):
+async def get_all_early_closures(db: AsyncSession, cursor: str = None, limit: int = pagination.DEFAULT_LIMIT):
     try:
-        return db.query(model.EarlyClosure).all()
+        query = select(model.EarlyClosure).options(*LIST_LOADS[model.EarlyClosure])
+        query = pagination.keyset(query, model.EarlyClosure, pagination.decode_cursor(cursor).get('items'), limit)
+        rows, position = pagination.split_page((await db.execute(query)).scalars().all(), limit)
+        return rows, pagination.encode_cursor({'items': position} if position else None)
     except Exception as e:
         raise e
     
-def create_evaluation_with_grade(db: Session, evaluation: schema.EvaluationCreate, sender:int):
+async def create_evaluation_with_grade(db: AsyncSession, evaluation: schema.EvaluationCreate, sender:int):
     try:
         # Create Evaluation object
         eval = evaluation.model_dump()
         eval['sender_id'] = sender
         grade_data_dict = eval.pop('grades')
         recipient = eval.pop('recipient_hos')
-        user = user_utils.get_user_by_email(email=recipient, db=db)
         db_evaluation = model.Evaluation(**eval)
-        db_evaluation.recipients.append(user)
         db.add(db_evaluation)
-        db.commit()
-        db.refresh(db_evaluation)
+        await db.flush()
+        await add_mailbox_entries(db=db, item=model.Evaluation, item_id=db_evaluation.id, user_ids=[sender], box='outbox')
+        await add_recipient(db=db, item=model.Evaluation, item_id=db_evaluation.id, email=recipient)
+        await db.commit()
+        await db.refresh(db_evaluation)
 
         # Create Grade object and associate it with the Evaluation
         grade_data_dict["evaluation_id"] = db_evaluation.id
         db_grade = model.Grade(**grade_data_dict)
         db.add(db_grade)
-        db.commit()
-        db.refresh(db_grade)
+        await touch_mailboxes(db=db, item=model.Evaluation, item_id=db_evaluation.id)
+        await db.commit()
+        await db.refresh(db_grade)
         
         return db_evaluation
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
-def update_evaluation_hos_response(db:Session, evaluation_id: int, response_data:schema.EvaluationHeadTeacherResponse, user):
+async def update_evaluation_hos_response(db:AsyncSession, evaluation_id: int, response_data:schema.EvaluationHeadTeacherResponse, user):
     try:
-        db_evaluation = db.query(model.Evaluation).filter(model.Evaluation.id == evaluation_id).first()
-        if user not in db_evaluation.recipients:
+        query = select(model.Evaluation).where(model.Evaluation.id == evaluation_id)
+        db_evaluation = (await db.execute(query)).scalars().first()
+        if not await is_recipient(db=db, item=model.Evaluation, item_id=evaluation_id, user_id=user.id):
             raise AttributeError('Not a recipient of this evaluation')
+        await mark_responded(db=db, item=model.Evaluation, item_id=evaluation_id, user_id=user.id)
         db_evaluation.head_teacher_signature = response_data.head_teacher_signature
-        recipient = response_data.recipient_hr
-        user = user_utils.get_user_by_email(email=recipient, db=db)
-        db_evaluation.recipients.append(user)
-        db.commit()
+        await add_recipient(db=db, item=model.Evaluation, item_id=evaluation_id, email=response_data.recipient_hr)
+        await db.commit()
     except Exception as e:
         raise e
 
-def update_evaluation_hr_response(db:Session, evaluation_id: int, response_data:schema.EvaluationHRResponse, user):
+async def update_evaluation_hr_response(db:AsyncSession, evaluation_id: int, response_data:schema.EvaluationHRResponse, user):
     try:
-        db_evaluation = db.query(model.Evaluation).filter(model.Evaluation.id == evaluation_id).first()
-        if user not in db_evaluation.recipients:
+        query = select(model.Evaluation).where(model.Evaluation.id == evaluation_id)
+        db_evaluation = (await db.execute(query)).scalars().first()
+        if not await is_recipient(db=db, item=model.Evaluation, item_id=evaluation_id, user_id=user.id):
             raise AttributeError('Not a recipient of this evaluation')
+        await mark_responded(db=db, item=model.Evaluation, item_id=evaluation_id, user_id=user.id)
         db_evaluation.school_admin_signature = response_data.school_admin_signature
-        recipient = response_data.recipient_director
-        user = user_utils.get_user_by_email(email=recipient, db=db)
-        db_evaluation.recipients.append(user)
-        db.commit()
+        await add_recipient(db=db, item=model.Evaluation, item_id=evaluation_id, email=response_data.recipient_director)
+        await db.commit()
     except Exception as e:
         raise e
 
-def update_evaluation_director_response(db:Session, evaluation_id: int, response_data:schema.EvaluationDirectorResponse, user):
+async def update_evaluation_director_response(db:AsyncSession, evaluation_id: int, response_data:schema.EvaluationDirectorResponse, user):
     try:
-        db_evaluation = db.query(model.Evaluation).filter(model.Evaluation.id == evaluation_id).first()
-        if user not in db_evaluation.recipients:
+        query = select(model.Evaluation).where(model.Evaluation.id == evaluation_id)
+        db_evaluation = (await db.execute(query)).scalars().first()
+        if not await is_recipient(db=db, item=model.Evaluation, item_id=evaluation_id, user_id=user.id):
             raise AttributeError('Not a recipient of this evaluation')
+        await mark_responded(db=db, item=model.Evaluation, item_id=evaluation_id, user_id=user.id)
         db_evaluation.director_signature = response_data.director_signature
-        db.commit()
+        await db.commit()
     except Exception as e:
         raise e
 
 
-def get_all_evaluations(db: Session):
+async def get_all_evaluations(db: AsyncSession, cursor: str = None, limit: int = pagination.DEFAULT_LIMIT):
     try:
-        evaluations = db.query(model.Evaluation).all()
-        return evaluations
+        query = select(model.Evaluation).options(*LIST_LOADS[model.Evaluation])
+        query = pagination.keyset(query, model.Evaluation, pagination.decode_cursor(cursor).get('items'), limit)
+        rows, position = pagination.split_page((await db.execute(query)).scalars().all(), limit)
+        return rows, pagination.encode_cursor({'items': position} if position else None)
     except Exception as e:
         raise e
 
-def create_early_closure(db: Session, early_closure_data: schema.EarlyClosureCreate, sender:int):
+async def create_early_closure(db: AsyncSession, early_closure_data: schema.EarlyClosureCreate, sender:int):
     try:
         ecd = early_closure_data.model_dump()
         ecd['sender_id'] = sender
         recipient = ecd.pop('recipient_hos')
-        user = user_utils.get_user_by_email(email=recipient, db=db)
         db_early_closure = model.EarlyClosure(**ecd)
-        db_early_closure.recipients.append(user)
         db.add(db_early_closure)
-        db.commit()
-        db.refresh(db_early_closure)
+        await db.flush()
+        await add_mailbox_entries(db=db, item=model.EarlyClosure, item_id=db_early_closure.id, user_ids=[sender], box='outbox')
+        await add_recipient(db=db, item=model.EarlyClosure, item_id=db_early_closure.id, email=recipient)
+        await db.commit()
+        await db.refresh(db_early_closure)
         return db_early_closure
     except Exception as e:
         raise e
 
-def update_early_closure_hos_response(db: Session, early_closure_id: int, response_data: schema.EarlyClosureHOSResponse, user):
+async def update_early_closure_hos_response(db: AsyncSession, early_closure_id: int, response_data: schema.EarlyClosureHOSResponse, user):
     try:
-        db_early_closure = db.query(model.EarlyClosure).filter(model.EarlyClosure.id == early_closure_id).first()
+        query = select(model.EarlyClosure).where(model.EarlyClosure.id == early_closure_id)
+        db_early_closure = (await db.execute(query)).scalars().first()
         if db_early_closure:
-            if user not in db_early_closure.recipients:
+            if not await is_recipient(db=db, item=model.EarlyClosure, item_id=early_closure_id, user_id=user.id):
                 raise AttributeError('Not a recipient of this Early Closure')
+            await mark_responded(db=db, item=model.EarlyClosure, item_id=early_closure_id, user_id=user.id)
             db_early_closure.head_comment = response_data.head_comment
             db_early_closure.head_date = response_data.head_date
             db_early_closure.appraiser_name = response_data.appraiser_name
             db_early_closure.appraiser_post = response_data.appraiser_post
             db_early_closure.head_signature = response_data.head_signature
 
-            recipient = response_data.recipient_hr
-            db_early_closure.recipients.append(user_utils.get_user_by_email(email=recipient, db=db))
-            db.commit()
+            await add_recipient(db=db, item=model.EarlyClosure, item_id=early_closure_id, email=response_data.recipient_hr)
+            await db.commit()
         else:
             raise ValueError("Early closure not found")
     except Exception as e:
         raise e
 
-def update_early_closure_hr_response(db: Session, early_closure_id: int, response_data: schema.EarlyClosureHRResponse, user):
+async def update_early_closure_hr_response(db: AsyncSession, early_closure_id: int, response_data: schema.EarlyClosureHRResponse, user):
     try:
-        db_early_closure = db.query(model.EarlyClosure).filter(model.EarlyClosure.id == early_closure_id).first()
+        query = select(model.EarlyClosure).where(model.EarlyClosure.id == early_closure_id)
+        db_early_closure = (await db.execute(query)).scalars().first()
         if db_early_closure:
-            if user not in db_early_closure.recipients:
+            if not await is_recipient(db=db, item=model.EarlyClosure, item_id=early_closure_id, user_id=user.id):
                 raise AttributeError('Not a recipient of this Early Closure')
+            await mark_responded(db=db, item=model.EarlyClosure, item_id=early_closure_id, user_id=user.id)
             db_early_closure.hro_comment = response_data.hro_comment
             db_early_closure.hro_date = response_data.hro_date
             db_early_closure.hro_signature = response_data.hro_signature
             if response_data.school_stamp:
                 db_early_closure.school_stamp = response_data.school_stamp
             
-            recipient = response_data.recipient_director
-            db_early_closure.recipients.append(user_utils.get_user_by_email(email=recipient, db=db))
+            await add_recipient(db=db, item=model.EarlyClosure, item_id=early_closure_id, email=response_data.recipient_director)
 
-            db.commit()
+            await db.commit()
         else:
             raise ValueError("Early closure not found")
     except Exception as e:
         raise e
 
-def update_early_closure_director_response(db: Session, early_closure_id: int, response_data: schema.EarlyClosureDirectorResponse, user):
+async def update_early_closure_director_response(db: AsyncSession, early_closure_id: int, response_data: schema.EarlyClosureDirectorResponse, user):
     try:
-        db_early_closure = db.query(model.EarlyClosure).filter(model.EarlyClosure.id == early_closure_id).first()
+        query = select(model.EarlyClosure).where(model.EarlyClosure.id == early_closure_id)
+        db_early_closure = (await db.execute(query)).scalars().first()
         if db_early_closure:
-            if user not in db_early_closure.recipients:
+            if not await is_recipient(db=db, item=model.EarlyClosure, item_id=early_closure_id, user_id=user.id):
                 raise AttributeError('Not a recipient of this Early Closure')
+            await mark_responded(db=db, item=model.EarlyClosure, item_id=early_closure_id, user_id=user.id)
             db_early_closure.director_comment = response_data.director_comment
             db_early_closure.director_date = response_data.director_date
             db_early_closure.director_signature = response_data.director_signature
             if response_data.school_stamp:
                 db_early_closure.school_stamp = response_data.school_stamp
-            db.commit()
+            await db.commit()
         else:
             raise ValueError("Early closure not found")
     except Exception as e:
         raise e
 
-def create_study_leave(db: Session, study_leave_data: schema.StudyLeaveApplicant, sender: int):
+async def create_study_leave(db: AsyncSession, study_leave_data: schema.StudyLeaveApplicant, sender: int):
     try:
         sld = study_leave_data.model_dump()
         sld['sender_id']=sender
         recipient = sld.pop('recipient_hos')
-        user = user_utils.get_user_by_email(email=recipient, db=db)
         db_study_leave = model.StudyLeave(**sld)
-        db_study_leave.recipients.append(user)
         db.add(db_study_leave)
-        db.commit()
-        db.refresh(db_study_leave)
+        await db.flush()
+        await add_mailbox_entries(db=db, item=model.StudyLeave, item_id=db_study_leave.id, user_ids=[sender], box='outbox')
+        await add_recipient(db=db, item=model.StudyLeave, item_id=db_study_leave.id, email=recipient)
+        await db.commit()
+        await db.refresh(db_study_leave)
         return db_study_leave
     except Exception as e:
         raise e
 
-def update_study_leave_head_teacher_response(db: Session, study_leave_id: int, response_data: schema.StudyLeaveHeadTeacher, user):
+async def update_study_leave_head_teacher_response(db: AsyncSession, study_leave_id: int, response_data: schema.StudyLeaveHeadTeacher, user):
     try:
-        db_study_leave = db.query(model.StudyLeave).filter(model.StudyLeave.id == study_leave_id).first()
+        query = select(model.StudyLeave).where(model.StudyLeave.id == study_leave_id)
+        db_study_leave = (await db.execute(query)).scalars().first()
         if db_study_leave:
-            if user not in db_study_leave.recipients:
+            if not await is_recipient(db=db, item=model.StudyLeave, item_id=study_leave_id, user_id=user.id):
                 raise AttributeError('Not a recipient of this study leave')
+            await mark_responded(db=db, item=model.StudyLeave, item_id=study_leave_id, user_id=user.id)
             db_study_leave.study_relevance = response_data.study_relevance
             db_study_leave.applicant_job_desc = response_data.applicant_job_desc
             db_study_leave.duties_to_cover = response_data.duties_to_cover
@@ -260,37 +584,40 @@ def update_study_leave_head_teacher_response(db: Session, study_leave_id: int, r
             db_study_leave.head_date = response_data.head_date
             db_study_leave.head_signature = response_data.head_signature
             
-            recipient = response_data.recipient_hr
-            db_study_leave.recipients.append(user_utils.get_user_by_email(email=recipient, db=db))
-            db.commit()
+            await add_recipient(db=db, item=model.StudyLeave, item_id=study_leave_id, email=response_data.recipient_hr)
+            await db.commit()
         else:
             raise ValueError("Study leave not found")
     except Exception as e:
         raise e
 
-def update_study_leave_accountant_response(db: Session, study_leave_id: int, response_data: schema.StudyLeaveAccountant, user):
+async def update_study_leave_accountant_response(db: AsyncSession, study_leave_id: int, response_data: schema.StudyLeaveAccountant, user):
     try:
-        db_study_leave = db.query(model.StudyLeave).filter(model.StudyLeave.id == study_leave_id).first()
+        query = select(model.StudyLeave).where(model.StudyLeave.id == study_leave_id)
+        db_study_leave = (await db.execute(query)).scalars().first()
         if db_study_leave:
-            if user not in db_study_leave.recipients:
+            if not await is_recipient(db=db, item=model.StudyLeave, item_id=study_leave_id, user_id=user.id):
                 raise AttributeError('Not a recipient of this study leave')
+            await mark_responded(db=db, item=model.StudyLeave, item_id=study_leave_id, user_id=user.id)
             db_study_leave.salary_cost = response_data.salary_cost
             db_study_leave.accountant_name = response_data.accountant_name
             db_study_leave.accountant_post = response_data.accountant_post
             db_study_leave.account_date = response_data.account_date
             db_study_leave.accountant_signature = response_data.accountant_signature
-            db.commit()
+            await db.commit()
         else:
             raise ValueError("Study leave not found")
     except Exception as e:
         raise e
 
-def update_study_leave_hr_response(db: Session, study_leave_id: int, response_data: schema.StudyLeaveHR, user):
+async def update_study_leave_hr_response(db: AsyncSession, study_leave_id: int, response_data: schema.StudyLeaveHR, user):
     try:
-        db_study_leave = db.query(model.StudyLeave).filter(model.StudyLeave.id == study_leave_id).first()
+        query = select(model.StudyLeave).where(model.StudyLeave.id == study_leave_id)
+        db_study_leave = (await db.execute(query)).scalars().first()
         if db_study_leave:
-            if user not in db_study_leave.recipients:
+            if not await is_recipient(db=db, item=model.StudyLeave, item_id=study_leave_id, user_id=user.id):
                 raise AttributeError('Not a recipient of this study leave')
+            await mark_responded(db=db, item=model.StudyLeave, item_id=study_leave_id, user_id=user.id)
             db_study_leave.approval_grant = response_data.approval_grant
             db_study_leave.grant_with_pay = response_data.grant_with_pay
             db_study_leave.granted_program = response_data.granted_program
@@ -303,25 +630,27 @@ def update_study_leave_hr_response(db: Session, study_leave_id: int, response_da
             db_study_leave.hr_date = response_data.hr_date
             db_study_leave.hr_signature = response_data.hr_signature
             
-            recipient = response_data.recipient_accountant
-            db_study_leave.recipients.append(user_utils.get_user_by_email(email=recipient, db=db))
-            recipient = response_data.recipient_director
-            db_study_leave.recipients.append(user_utils.get_user_by_email(email=recipient, db=db))
+            await add_recipient(db=db, item=model.StudyLeave, item_id=study_leave_id, email=response_data.recipient_accountant)
+            await add_recipient(db=db, item=model.StudyLeave, item_id=study_leave_id, email=response_data.recipient_director)
             
-            db.commit()
+            await db.commit()
         else:
             raise ValueError("Study leave not found")
     except Exception as e:
         raise e
 
-def update_study_leave_director_response(db: Session, study_leave_id: int, response_data: schema.StudyLeaveDirector):
+async def update_study_leave_director_response(db: AsyncSession, study_leave_id: int, response_data: schema.StudyLeaveDirector, user):
     try:
-        db_study_leave = db.query(model.StudyLeave).filter(model.StudyLeave.id == study_leave_id).first()
+        query = select(model.StudyLeave).where(model.StudyLeave.id == study_leave_id)
+        db_study_leave = (await db.execute(query)).scalars().first()
         if db_study_leave:
+            if not await is_recipient(db=db, item=model.StudyLeave, item_id=study_leave_id, user_id=user.id):
+                raise AttributeError('Not a recipient of this study leave')
+            await mark_responded(db=db, item=model.StudyLeave, item_id=study_leave_id, user_id=user.id)
             db_study_leave.approval_status = response_data.approval_status
             db_study_leave.director_date = response_data.director_date
             db_study_leave.director_signature = response_data.director_signature
-            db.commit()
+            await db.commit()
         else:
             raise ValueError("Study leave not found")
     except Exception as e:
@@ -13,6 +13,7 @@ load_dotenv()
 from user.model import User
 from message.model import Message, Comment, message_recipients_association
 from office.model import Office, OfficeHead
+from jobs.model import Job, DeadJob
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,293 @@
+"""baseline schema
+
+Revision ID: 1e0c7a9d4b52
+Revises: 
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1e0c7a9d4b52'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the tables as they were before the first revision, so upgrading an empty
+    # database works; ones create_all already made on startup are left alone
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'offices' not in existing:
+        op.create_table('offices',
+                        sa.Column('id', sa.BigInteger(), nullable=False),
+                        sa.Column('name', sa.String(), nullable=True),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.PrimaryKeyConstraint('id'))
+        op.create_index(op.f('ix_offices_name'), 'offices', ['name'], unique=True)
+
+    if 'users' not in existing:
+        op.create_table('users',
+                        sa.Column('id', sa.BigInteger(), nullable=False),
+                        sa.Column('first_name', sa.String(), nullable=True),
+                        sa.Column('last_name', sa.String(), nullable=True),
+                        sa.Column('email', sa.String(), nullable=True),
+                        sa.Column('phone', sa.String(), nullable=True),
+                        sa.Column('password', sa.String(), nullable=False),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.Column('role_id', sa.BigInteger(), nullable=True),
+                        sa.Column('resumption_time', sa.Time(), nullable=True),
+                        sa.Column('closing_time', sa.Time(), nullable=True),
+                        sa.ForeignKeyConstraint(['role_id'], ['offices.id'], ondelete='CASCADE'),
+                        sa.PrimaryKeyConstraint('id'),
+                        sa.UniqueConstraint('phone'))
+        op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+
+    if 'early-closures' not in existing:
+        op.create_table('early-closures',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.Column('teacher', sa.String(), nullable=False),
+                        sa.Column('clas', sa.String(), nullable=False),
+                        sa.Column('section', sa.String(), nullable=False),
+                        sa.Column('permission', sa.String(), nullable=False),
+                        sa.Column('period', sa.String(), nullable=False),
+                        sa.Column('reason', sa.String(), nullable=False),
+                        sa.Column('teacher_date', sa.String(), nullable=False),
+                        sa.Column('head_comment', sa.String(), nullable=False),
+                        sa.Column('head_date', sa.String(), nullable=False),
+                        sa.Column('appraiser_name', sa.String(), nullable=False),
+                        sa.Column('appraiser_post', sa.String(), nullable=False),
+                        sa.Column('hro_comment', sa.String(), nullable=False),
+                        sa.Column('hro_date', sa.String(), nullable=False),
+                        sa.Column('director_comment', sa.String(), nullable=False),
+                        sa.Column('director_date', sa.String(), nullable=False),
+                        sa.Column('teacher_signature', sa.String(), nullable=False),
+                        sa.Column('head_signature', sa.String(), nullable=False),
+                        sa.Column('hro_signature', sa.String(), nullable=False),
+                        sa.Column('director_signature', sa.String(), nullable=False),
+                        sa.Column('school_stamp', sa.String(), nullable=False),
+                        sa.Column('sender_id', sa.Integer(), nullable=True),
+                        sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ),
+                        sa.PrimaryKeyConstraint('id'))
+
+    if 'evaluations' not in existing:
+        op.create_table('evaluations',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.Column('supervisor', sa.String(), nullable=False),
+                        sa.Column('supervisor_post', sa.String(), nullable=False),
+                        sa.Column('term', sa.String(), nullable=False),
+                        sa.Column('session', sa.String(), nullable=False),
+                        sa.Column('peer', sa.String(), nullable=False),
+                        sa.Column('peer_post', sa.String(), nullable=False),
+                        sa.Column('remark', sa.String(), nullable=False),
+                        sa.Column('date', sa.String(), nullable=False),
+                        sa.Column('supervisor_signature', sa.String(), nullable=False),
+                        sa.Column('school_admin_signature', sa.String(), nullable=True),
+                        sa.Column('head_teacher_signature', sa.String(), nullable=True),
+                        sa.Column('director_signature', sa.String(), nullable=True),
+                        sa.Column('sender_id', sa.Integer(), nullable=True),
+                        sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ondelete='CASCADE'),
+                        sa.PrimaryKeyConstraint('id'))
+
+    if 'messages' not in existing:
+        op.create_table('messages',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('sender_id', sa.Integer(), nullable=True),
+                        sa.Column('label', sa.String(), nullable=False),
+                        sa.Column('title', sa.String(), nullable=False),
+                        sa.Column('text', sa.String(), nullable=True),
+                        sa.Column('document', sa.String(), nullable=True),
+                        sa.Column('type', sa.String(), nullable=True),
+                        sa.Column('status', sa.String(), nullable=False),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ondelete='CASCADE'),
+                        sa.PrimaryKeyConstraint('id'))
+
+    if 'office_heads' not in existing:
+        op.create_table('office_heads',
+                        sa.Column('id', sa.BigInteger(), nullable=False),
+                        sa.Column('office_id', sa.BigInteger(), nullable=False),
+                        sa.Column('user_id', sa.BigInteger(), nullable=False),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.ForeignKeyConstraint(['office_id'], ['offices.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+                        sa.PrimaryKeyConstraint('id'),
+                        sa.UniqueConstraint('office_id'))
+
+    if 'study-leave' not in existing:
+        op.create_table('study-leave',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.Column('applicant_name', sa.String(), nullable=False),
+                        sa.Column('designation', sa.String(), nullable=False),
+                        sa.Column('years_served', sa.String(), nullable=False),
+                        sa.Column('institute_of_study', sa.String(), nullable=False),
+                        sa.Column('course_of_study', sa.String(), nullable=False),
+                        sa.Column('area_of_study', sa.String(), nullable=False),
+                        sa.Column('duration_of_study', sa.String(), nullable=False),
+                        sa.Column('purpose_of_study', sa.String(), nullable=False),
+                        sa.Column('start_date', sa.String(), nullable=False),
+                        sa.Column('end_date', sa.String(), nullable=False),
+                        sa.Column('education_status', sa.String(), nullable=False),
+                        sa.Column('year_obtained', sa.String(), nullable=False),
+                        sa.Column('last_study_period', sa.String(), nullable=False),
+                        sa.Column('pursue_indication', sa.String(), nullable=False),
+                        sa.Column('applicant_date', sa.String(), nullable=False),
+                        sa.Column('study_relevance', sa.String(), nullable=False),
+                        sa.Column('applicant_job_desc', sa.String(), nullable=False),
+                        sa.Column('duties_to_cover', sa.String(), nullable=False),
+                        sa.Column('remark', sa.String(), nullable=False),
+                        sa.Column('head_name', sa.String(), nullable=False),
+                        sa.Column('head_post', sa.String(), nullable=False),
+                        sa.Column('head_date', sa.String(), nullable=False),
+                        sa.Column('salary_cost', sa.String(), nullable=False),
+                        sa.Column('accountant_name', sa.String(), nullable=False),
+                        sa.Column('accountant_post', sa.String(), nullable=False),
+                        sa.Column('account_date', sa.String(), nullable=False),
+                        sa.Column('approval_grant', sa.String(), nullable=False),
+                        sa.Column('grant_with_pay', sa.String(), nullable=False),
+                        sa.Column('granted_program', sa.String(), nullable=False),
+                        sa.Column('years_after_resumption', sa.String(), nullable=False),
+                        sa.Column('certificate_upgrade', sa.String(), nullable=False),
+                        sa.Column('beneficiary_number', sa.String(), nullable=False),
+                        sa.Column('applicant_not_supported', sa.String(), nullable=False),
+                        sa.Column('hr_name', sa.String(), nullable=False),
+                        sa.Column('hr_post', sa.String(), nullable=False),
+                        sa.Column('hr_date', sa.String(), nullable=False),
+                        sa.Column('approval_status', sa.String(), nullable=False),
+                        sa.Column('director_date', sa.String(), nullable=False),
+                        sa.Column('applicant_signature', sa.String(), nullable=False),
+                        sa.Column('head_signature', sa.String(), nullable=False),
+                        sa.Column('accountant_signature', sa.String(), nullable=False),
+                        sa.Column('hr_signature', sa.String(), nullable=False),
+                        sa.Column('director_signature', sa.String(), nullable=False),
+                        sa.Column('sender_id', sa.Integer(), nullable=True),
+                        sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ),
+                        sa.PrimaryKeyConstraint('id'))
+
+    if 'comments' not in existing:
+        op.create_table('comments',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('text', sa.String(), nullable=False),
+                        sa.Column('message_id', sa.Integer(), nullable=True),
+                        sa.Column('evaluation_id', sa.Integer(), nullable=True),
+                        sa.Column('early_closure_id', sa.Integer(), nullable=True),
+                        sa.Column('study_leave_id', sa.Integer(), nullable=True),
+                        sa.Column('type', sa.String(), nullable=False),
+                        sa.Column('sender_id', sa.Integer(), nullable=True),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.ForeignKeyConstraint(['early_closure_id'], ['early-closures.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['evaluation_id'], ['evaluations.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['study_leave_id'], ['study-leave.id'], ondelete='CASCADE'),
+                        sa.PrimaryKeyConstraint('id'))
+
+    if 'early_closure_recipients_association' not in existing:
+        op.create_table('early_closure_recipients_association',
+                        sa.Column('early_closure_id', sa.Integer(), nullable=True),
+                        sa.Column('recipient_id', sa.Integer(), nullable=True),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.ForeignKeyConstraint(['early_closure_id'], ['early-closures.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['recipient_id'], ['users.id'], ondelete='CASCADE'))
+
+    if 'evaluation_recipients_association' not in existing:
+        op.create_table('evaluation_recipients_association',
+                        sa.Column('evaluation_id', sa.Integer(), nullable=True),
+                        sa.Column('recipient_id', sa.Integer(), nullable=True),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.ForeignKeyConstraint(['evaluation_id'], ['evaluations.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['recipient_id'], ['users.id'], ondelete='CASCADE'))
+
+    if 'grades' not in existing:
+        op.create_table('grades',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.Column('completes_task_on_time', sa.String(), nullable=False),
+                        sa.Column('attends_school_meetings_till_closure', sa.String(), nullable=False),
+                        sa.Column('makes_positive_contributions', sa.String(), nullable=False),
+                        sa.Column('handles_responsibilities_appropriately', sa.String(), nullable=False),
+                        sa.Column('displays_technical_competence', sa.String(), nullable=False),
+                        sa.Column('very_creative', sa.String(), nullable=False),
+                        sa.Column('easy_to_work_with', sa.String(), nullable=False),
+                        sa.Column('works_well_under_pressure', sa.String(), nullable=False),
+                        sa.Column('communicates_well_in_written_form', sa.String(), nullable=False),
+                        sa.Column('communicates_well_when_speaking', sa.String(), nullable=False),
+                        sa.Column('assists_other_teams_when_needed', sa.String(), nullable=False),
+                        sa.Column('demonstrates_good_problem_solving_skills', sa.String(), nullable=False),
+                        sa.Column('listens_well', sa.String(), nullable=False),
+                        sa.Column('works_well_with_parents', sa.String(), nullable=False),
+                        sa.Column('coaches_class_assistant_well', sa.String(), nullable=False),
+                        sa.Column('coaches_weak_students_well', sa.String(), nullable=False),
+                        sa.Column('learns_quickly', sa.String(), nullable=False),
+                        sa.Column('works_well_on_own', sa.String(), nullable=False),
+                        sa.Column('reliable', sa.String(), nullable=False),
+                        sa.Column('produces_high_quality_output', sa.String(), nullable=False),
+                        sa.Column('handles_pupils_conflicts_well', sa.String(), nullable=False),
+                        sa.Column('handles_cases_of_puppils_discipline_well', sa.String(), nullable=False),
+                        sa.Column('accepts_and_perfects_corrections_well', sa.String(), nullable=False),
+                        sa.Column('well_organized', sa.String(), nullable=False),
+                        sa.Column('look_forward_to_working_again', sa.String(), nullable=False),
+                        sa.Column('punctual_to_school', sa.String(), nullable=False),
+                        sa.Column('regular_in_school', sa.String(), nullable=False),
+                        sa.Column('does_well_on_duty', sa.String(), nullable=False),
+                        sa.Column('class_namagement', sa.String(), nullable=False),
+                        sa.Column('shows_concern_to_school_environment', sa.String(), nullable=False),
+                        sa.Column('enforces_school_rules_always', sa.String(), nullable=False),
+                        sa.Column('evaluation_id', sa.Integer(), nullable=True),
+                        sa.ForeignKeyConstraint(['evaluation_id'], ['evaluations.id'], ),
+                        sa.PrimaryKeyConstraint('id'))
+
+    if 'message_recipients_association' not in existing:
+        op.create_table('message_recipients_association',
+                        sa.Column('message_id', sa.Integer(), nullable=True),
+                        sa.Column('recipient_id', sa.Integer(), nullable=True),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['recipient_id'], ['users.id'], ondelete='CASCADE'))
+
+    if 'study_leave_recipients_association' not in existing:
+        op.create_table('study_leave_recipients_association',
+                        sa.Column('early_leave_id', sa.Integer(), nullable=True),
+                        sa.Column('recipient_id', sa.Integer(), nullable=True),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('updated_at', sa.DateTime(), nullable=False),
+                        sa.ForeignKeyConstraint(['early_leave_id'], ['study-leave.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['recipient_id'], ['users.id'], ondelete='CASCADE'))
+
+
+def downgrade() -> None:
+    op.drop_table('study_leave_recipients_association')
+    op.drop_table('message_recipients_association')
+    op.drop_table('grades')
+    op.drop_table('evaluation_recipients_association')
+    op.drop_table('early_closure_recipients_association')
+    op.drop_table('comments')
+    op.drop_table('study-leave')
+    op.drop_table('office_heads')
+    op.drop_table('messages')
+    op.drop_table('evaluations')
+    op.drop_table('early-closures')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_table('users')
+    op.drop_index(op.f('ix_offices_name'), table_name='offices')
+    op.drop_table('offices')
@@ -0,0 +1,68 @@
+"""key and index recipient tables
+
+Revision ID: 3c1d8e2f9a47
+Revises: 1e0c7a9d4b52
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1d8e2f9a47'
+down_revision: Union[str, None] = '1e0c7a9d4b52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# association table -> column pointing at the form
+ASSOCIATIONS = {
+    'message_recipients_association': 'message_id',
+    'evaluation_recipients_association': 'evaluation_id',
+    'early_closure_recipients_association': 'early_closure_id',
+    'study_leave_recipients_association': 'early_leave_id',
+}
+FORMS = ('messages', 'evaluations', 'early-closures', 'study-leave')
+COMMENT_PARENTS = ('message_id', 'evaluation_id', 'early_closure_id', 'study_leave_id')
+
+
+def upgrade() -> None:
+    # tables are created by the app on startup (create_all), which on a fresh
+    # database already includes everything below, so each step checks first
+    inspector = sa.inspect(op.get_bind())
+
+    for table, parent in ASSOCIATIONS.items():
+        if not inspector.has_table(table):
+            continue
+        if not inspector.get_pk_constraint(table)['constrained_columns']:
+            # rows that can't be part of the key, then duplicates, keeping the first copy
+            op.execute(f'DELETE FROM {table} WHERE {parent} IS NULL OR recipient_id IS NULL')
+            op.execute(f'DELETE FROM {table} a USING {table} b '
+                       f'WHERE a.ctid > b.ctid AND a.{parent} = b.{parent} AND a.recipient_id = b.recipient_id')
+            op.create_primary_key(f'{table}_pkey', table, [parent, 'recipient_id'])
+        op.create_index(f'ix_{table}_recipient', table, ['recipient_id', parent], if_not_exists=True)
+
+    for table in FORMS:
+        if not inspector.has_table(table):
+            continue
+        op.create_index(f'ix_{table}_created_at', table, ['created_at'], if_not_exists=True)
+        op.create_index(f'ix_{table}_sender_id', table, ['sender_id'], if_not_exists=True)
+
+    if inspector.has_table('comments'):
+        for parent in COMMENT_PARENTS:
+            op.create_index(f'ix_comments_{parent}', 'comments', [parent], if_not_exists=True)
+
+
+def downgrade() -> None:
+    for parent in COMMENT_PARENTS:
+        op.drop_index(f'ix_comments_{parent}', table_name='comments', if_exists=True)
+
+    for table in FORMS:
+        op.drop_index(f'ix_{table}_sender_id', table_name=table, if_exists=True)
+        op.drop_index(f'ix_{table}_created_at', table_name=table, if_exists=True)
+
+    for table, parent in ASSOCIATIONS.items():
+        op.drop_index(f'ix_{table}_recipient', table_name=table, if_exists=True)
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
@@ -0,0 +1,38 @@
+"""add stored objects
+
+Revision ID: 5f2a9c7e1b38
+Revises: 8b5e0f6d2c91
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f2a9c7e1b38'
+down_revision: Union[str, None] = '8b5e0f6d2c91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all on startup may have made it already
+    if sa.inspect(op.get_bind()).has_table('stored_objects'):
+        return
+
+    op.create_table('stored_objects',
+                    sa.Column('key', sa.String(), nullable=False),
+                    sa.Column('sha256', sa.String(length=64), nullable=False),
+                    sa.Column('size', sa.BigInteger(), nullable=False),
+                    sa.Column('content_type', sa.String(), nullable=True),
+                    sa.Column('ref_count', sa.Integer(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(), nullable=False),
+                    sa.Column('updated_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('key'))
+
+
+def downgrade() -> None:
+    op.drop_table('stored_objects')
@@ -0,0 +1,72 @@
+"""add mailbox entries
+
+Revision ID: a4d7e3b9c215
+Revises: 5f2a9c7e1b38
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d7e3b9c215'
+down_revision: Union[str, None] = '5f2a9c7e1b38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# kind, form table, recipient table, its column pointing at the form, and the
+# column the form's last step (the director's) fills in
+FORMS = [
+    ('messages', 'messages', 'message_recipients_association', 'message_id', None),
+    ('evaluations', 'evaluations', 'evaluation_recipients_association', 'evaluation_id', 'director_signature'),
+    ('early_closures', 'early-closures', 'early_closure_recipients_association', 'early_closure_id', 'director_signature'),
+    ('study_leaves', 'study-leave', 'study_leave_recipients_association', 'early_leave_id', 'director_signature'),
+]
+
+
+def upgrade() -> None:
+    # create_all on startup may have made it already
+    if not sa.inspect(op.get_bind()).has_table('mailbox_entries'):
+        op.create_table('mailbox_entries',
+                        sa.Column('id', sa.BigInteger(), nullable=False),
+                        sa.Column('user_id', sa.BigInteger(), nullable=False),
+                        sa.Column('box', sa.String(), nullable=False),
+                        sa.Column('kind', sa.String(), nullable=False),
+                        sa.Column('ref_id', sa.Integer(), nullable=False),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('status', sa.String(), nullable=True),
+                        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+                        sa.PrimaryKeyConstraint('id'),
+                        sa.UniqueConstraint('user_id', 'box', 'kind', 'ref_id', name='uq_mailbox_entries_item'))
+        op.create_index('ix_mailbox_entries_page', 'mailbox_entries', ['user_id', 'box', 'created_at', 'id'], unique=False)
+
+    # backfill from the existing forms and recipients. Which step a form is at was
+    # never recorded: on a form whose last step is done everyone responded, on one
+    # still open the recipients added last (the ones holding it now) start out
+    # pending and everyone before them responded
+    for kind, table, association, column, final_step in FORMS:
+        message_status = 'f.status' if kind == 'messages' else None
+        form_status = (f"CASE WHEN coalesce(f.{final_step}, 'no response') <> 'no response' THEN 'responded' "
+                       f"WHEN a.created_at = max(a.created_at) OVER (PARTITION BY a.{column}) THEN 'pending' ELSE 'responded' END"
+                       if final_step else None)
+        op.execute(f"""
+            INSERT INTO mailbox_entries (user_id, box, kind, ref_id, created_at, status)
+            SELECT f.sender_id, 'outbox', '{kind}', f.id, f.created_at, {message_status or "'sent'"}
+            FROM "{table}" f WHERE f.sender_id IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """)
+        op.execute(f"""
+            INSERT INTO mailbox_entries (user_id, box, kind, ref_id, created_at, status)
+            SELECT a.recipient_id, 'inbox', '{kind}', f.id, f.created_at,
+                   {message_status or form_status}
+            FROM {association} a JOIN "{table}" f ON f.id = a.{column}
+            ON CONFLICT DO NOTHING
+        """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_mailbox_entries_page', table_name='mailbox_entries')
+    op.drop_table('mailbox_entries')
@@ -0,0 +1,28 @@
+"""drop stored object ref count
+
+Revision ID: b7e2d4c9a160
+Revises: f3c9a1d7b582
+Create Date: 2026-10-17 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d4c9a160'
+down_revision: Union[str, None] = 'f3c9a1d7b582'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # nothing ever released a reference, the reaper goes by what the forms point at
+    if 'ref_count' in {column['name'] for column in sa.inspect(op.get_bind()).get_columns('stored_objects')}:
+        op.drop_column('stored_objects', 'ref_count')
+
+
+def downgrade() -> None:
+    op.add_column('stored_objects', sa.Column('ref_count', sa.Integer(), nullable=False, server_default='1'))
@@ -0,0 +1,62 @@
+"""add mailbox read state and counters
+
+Revision ID: c6e1f4a8d302
+Revises: a4d7e3b9c215
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6e1f4a8d302'
+down_revision: Union[str, None] = 'a4d7e3b9c215'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # create_all on startup may have made them already
+    if 'read_at' not in {column['name'] for column in inspector.get_columns('mailbox_entries')}:
+        op.add_column('mailbox_entries', sa.Column('read_at', sa.DateTime(), nullable=True))
+    # nothing recorded reads before, everything already delivered counts as read;
+    # also when create_all added the column first, entries delivered since then included
+    op.execute("UPDATE mailbox_entries SET read_at = created_at WHERE box = 'inbox' AND read_at IS NULL")
+
+    if not inspector.has_table('mailbox_counters'):
+        op.create_table('mailbox_counters',
+                        sa.Column('user_id', sa.BigInteger(), nullable=False),
+                        sa.Column('unread_messages', sa.Integer(), nullable=False, server_default='0'),
+                        sa.Column('pending_evaluations', sa.Integer(), nullable=False, server_default='0'),
+                        sa.Column('pending_early_closures', sa.Integer(), nullable=False, server_default='0'),
+                        sa.Column('pending_study_leaves', sa.Integer(), nullable=False, server_default='0'),
+                        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+                        sa.PrimaryKeyConstraint('user_id'))
+    elif 'version' in {column['name'] for column in inspector.get_columns('mailbox_counters')}:
+        # create_all made the table with the version column of d2b8a6f1e947, which
+        # had no database default before; the backfill below leaves it out
+        op.alter_column('mailbox_counters', 'version', server_default='0')
+
+    op.execute("""
+        INSERT INTO mailbox_counters (user_id, unread_messages, pending_evaluations, pending_early_closures, pending_study_leaves)
+        SELECT user_id,
+               count(*) FILTER (WHERE kind = 'messages' AND read_at IS NULL),
+               count(*) FILTER (WHERE kind = 'evaluations' AND status = 'pending'),
+               count(*) FILTER (WHERE kind = 'early_closures' AND status = 'pending'),
+               count(*) FILTER (WHERE kind = 'study_leaves' AND status = 'pending')
+        FROM mailbox_entries WHERE box = 'inbox'
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET unread_messages = excluded.unread_messages,
+                                            pending_evaluations = excluded.pending_evaluations,
+                                            pending_early_closures = excluded.pending_early_closures,
+                                            pending_study_leaves = excluded.pending_study_leaves
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('mailbox_counters')
+    op.drop_column('mailbox_entries', 'read_at')
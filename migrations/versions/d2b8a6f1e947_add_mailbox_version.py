@@ -0,0 +1,30 @@
+"""add mailbox version
+
+Revision ID: d2b8a6f1e947
+Revises: c6e1f4a8d302
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b8a6f1e947'
+down_revision: Union[str, None] = 'c6e1f4a8d302'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all on startup may have made it already
+    if 'version' in {column['name'] for column in sa.inspect(op.get_bind()).get_columns('mailbox_counters')}:
+        return
+
+    op.add_column('mailbox_counters', sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('mailbox_counters', 'version')
@@ -0,0 +1,31 @@
+"""add directory version
+
+Revision ID: e5a1c8f3d724
+Revises: b7e2d4c9a160
+Create Date: 2026-10-17 23:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a1c8f3d724'
+down_revision: Union[str, None] = 'b7e2d4c9a160'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all on startup may have made it already
+    if not sa.inspect(op.get_bind()).has_table('directory_version'):
+        op.create_table('directory_version',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('version', sa.BigInteger(), nullable=False),
+                        sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade() -> None:
+    op.drop_table('directory_version')
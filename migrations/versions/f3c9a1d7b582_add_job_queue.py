@@ -0,0 +1,53 @@
+"""add job queue
+
+Revision ID: f3c9a1d7b582
+Revises: d2b8a6f1e947
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c9a1d7b582'
+down_revision: Union[str, None] = 'd2b8a6f1e947'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all on startup may have made them already
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('jobs'):
+        op.create_table('jobs',
+                        sa.Column('id', sa.BigInteger(), nullable=False),
+                        sa.Column('kind', sa.String(), nullable=False),
+                        sa.Column('payload', sa.JSON(), nullable=False),
+                        sa.Column('run_at', sa.DateTime(), nullable=False),
+                        sa.Column('attempts', sa.Integer(), nullable=False),
+                        sa.Column('max_attempts', sa.Integer(), nullable=False),
+                        sa.Column('locked_until', sa.DateTime(), nullable=True),
+                        sa.Column('last_error', sa.Text(), nullable=True),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.PrimaryKeyConstraint('id'))
+        op.create_index('ix_jobs_due', 'jobs', ['run_at', 'id'])
+
+    if not inspector.has_table('dead_jobs'):
+        op.create_table('dead_jobs',
+                        sa.Column('id', sa.BigInteger(), nullable=False),
+                        sa.Column('kind', sa.String(), nullable=False),
+                        sa.Column('payload', sa.JSON(), nullable=False),
+                        sa.Column('attempts', sa.Integer(), nullable=False),
+                        sa.Column('last_error', sa.Text(), nullable=True),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.Column('failed_at', sa.DateTime(), nullable=False),
+                        sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade() -> None:
+    op.drop_table('dead_jobs')
+    op.drop_index('ix_jobs_due', table_name='jobs')
+    op.drop_table('jobs')
@@ -1,33 +1,89 @@
-from sqlalchemy.orm import Session
+import os
+import time
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from office import model, schema
 from user import utils as user_utils
 from config import security
 
-def get_office_by_name(db: Session, name: str):
+# every office, per worker. The table is tiny and only changes through register-office,
+# which reloads it once it commits; other workers catch up when their copy is this old,
+# or on a name they don't know, at most once every OFFICE_REGISTRY_MISS_RELOAD_SECONDS
+OFFICE_REGISTRY_TTL_SECONDS = float(os.environ.get('OFFICE_REGISTRY_TTL_SECONDS', 300))
+OFFICE_REGISTRY_MISS_RELOAD_SECONDS = float(os.environ.get('OFFICE_REGISTRY_MISS_RELOAD_SECONDS', 5))
+
+# Office objects by id and by name, copies not tied to any session;
+# writes reference an office by id, never by attaching these to a session
+offices_by_id = {}
+offices_by_name = {}
+offices_loaded_at = None
+_offices_lock = asyncio.Lock()
+
+async def load_offices(db: AsyncSession):
+    # through the caller's session: the callers waiting on the lock already hold a
+    # connection each, asking the pool for another could deadlock it when it is full
+    global offices_by_id, offices_by_name, offices_loaded_at
+    try:
+        rows = (await db.execute(select(model.Office.id, model.Office.name))).all()
+        offices = [model.Office(id=id, name=name) for id, name in rows]
+        offices_by_id = {office.id: office for office in offices}
+        offices_by_name = {office.name: office for office in offices}
+        offices_loaded_at = time.monotonic()
+    except Exception as e:
+        raise e
+
+async def ensure_offices(db: AsyncSession, max_age: float = OFFICE_REGISTRY_TTL_SECONDS):
+    # concurrent callers wait for one reload instead of each running their own
+    if offices_loaded_at is not None and time.monotonic() - offices_loaded_at < max_age:
+        return
+    async with _offices_lock:
+        if offices_loaded_at is None or time.monotonic() - offices_loaded_at >= max_age:
+            await load_offices(db=db)
+
+def role_name(user):
+    # name of the user's office, what the authorization checks compare against
+    office = offices_by_id.get(user.role_id)
+    return office.name if office is not None else None
+
+def registry_stats():
+    return {'offices': len(offices_by_id),
+            'age_seconds': round(time.monotonic() - offices_loaded_at, 1) if offices_loaded_at is not None else None}
+
+async def get_office_by_name(db: AsyncSession, name: str):
     try:
-        office = db.query(model.Office).filter(model.Office.name == name).first()
+        await ensure_offices(db=db)
+        office = offices_by_name.get(name)
+        if office is None:
+            # may have been registered on another worker since the last load
+            await ensure_offices(db=db, max_age=OFFICE_REGISTRY_MISS_RELOAD_SECONDS)
+            office = offices_by_name.get(name)
         return office
     except Exception as e:
         raise e
 
-def create_office(db: Session, office: schema.Office):
+async def create_office(db: AsyncSession, office: schema.Office):
     try:
         result = model.Office(name=office.name)
         db.add(result)
-        db.commit()
-        db.refresh(result)
+        await db.commit()
+        await db.refresh(result)
+        await load_offices(db=db)
         return result
     except Exception as e:
         raise e
 
-def assign_hofo(db: Session, assignhofo: schema.CreateHofoO):
+async def assign_hofo(db: AsyncSession, assignhofo: schema.CreateHofoO):
     try:
-        result = model.OfficeHead(office_id=get_office_by_name(db=db, name=assignhofo.office_name).id,
-                                  user_id=user_utils.get_user_by_email(db=db, email=assignhofo.email).id)
+        office = await get_office_by_name(db=db, name=assignhofo.office_name)
+        user = await user_utils.get_user_by_email(db=db, email=assignhofo.email)
+        result = model.OfficeHead(office_id=office.id,
+                                  user_id=user.id)
         db.add(result)
-        db.commit()
-        db.refresh(result)
-        return result
+        await db.commit()
+
+        query = select(model.OfficeHead).options(joinedload(model.OfficeHead.office), joinedload(model.OfficeHead.user)).where(model.OfficeHead.id == result.id)
+        return (await db.execute(query)).scalars().first()
     except Exception as e:
         raise e
-
@@ -1,41 +1,34 @@
 from fastapi import APIRouter
-from fastapi import HTTPException, Depends, Response
+from fastapi import HTTPException, Depends, Response, Query, Request
 from user import utils, schema, model
 from config import security
-from sqlalchemy.orm import Session
-from config.database import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.config import get_db, get_read_db
 import json
 from datetime import time
 from office import utils as office_utils
+from message import utils as message_utils
 from sqlalchemy import func
+from typing import Optional
+from helpers import pagination, etags
+from jobs import utils as jobs_utils
 
 router = APIRouter()
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.post('/signup/')
-async def signup(user: schema.CreateUser, db: Session = Depends(get_db), current_user_id = Depends(security.get_current_user)):
+async def signup(user: schema.CreateUser, db: AsyncSession = Depends(get_db), current_user = Depends(security.get_authenticated_user)):
     try:
-        current_user = utils.get_user(db=db, user_id=current_user_id.id)
-        
-        if (current_user.role.name == 'admin') or (current_user.role.name == 'hr'):
+        if (office_utils.role_name(current_user) == 'admin') or (office_utils.role_name(current_user) == 'hr'):
 
-            if utils.get_user_by_email(email=user.email, db=db) is not None:
+            if await utils.get_user_by_email(email=user.email, db=db) is not None:
                 raise HTTPException(status_code=400, detail="email already registered")
             
             if user.resumption_time and user.closing_time:
                 user.resumption_time = time(hour=int(user.resumption_time.split(':')[0]), minute=int(user.resumption_time.split(':')[1]))
                 user.closing_time = time(hour=int(user.closing_time.split(':')[0]), minute=int(user.closing_time.split(':')[1]))
 
-                print(user.closing_time, type(user.closing_time))
-
-            db_user = utils.create_user(user=user, db=db)
+            db_user = await utils.create_user(user=user, db=db)
         
             user_dict = schema.BaseUser.to_dict(db_user).model_dump()
             return Response(status_code=201, content=json.dumps({'message':'user created successfully', 'details':user_dict}))
@@ -45,29 +38,85 @@ async def signup(user: schema.CreateUser, db: Session = Depends(get_db), current
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
 
+@router.post('/bulk-signup/')
+async def bulk_signup(request: Request, db: AsyncSession = Depends(get_db), current_user = Depends(security.get_authenticated_user)):
+    try:
+        if (office_utils.role_name(current_user) == 'admin') or (office_utils.role_name(current_user) == 'hr'):
+
+            content_type = request.headers.get('content-type', '')
+            if content_type.startswith('multipart/form-data'):
+                # a csv picked in a file input
+                document = (await request.form()).get('file')
+                if document is None:
+                    raise HTTPException(status_code=400, detail="a csv file is needed in the 'file' field")
+                rows = utils.read_bulk_rows(content_type='text/csv', body=await document.read())
+            else:
+                rows = utils.read_bulk_rows(content_type=content_type, body=await request.body())
+
+            results, created = await utils.create_users(db=db, rows=rows)
+            if not created:
+                return Response(status_code=400, content=json.dumps({'message':'No user created, fix the rows with errors and try again', 'results':results}))
+
+            return Response(status_code=201, content=json.dumps({'message':f'{len(results)} users created successfully', 'results':results}))
+
+        else:
+            raise HTTPException(status_code=401, detail="Not authorized to create a user. must be an admin or hr staff")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
 @router.post('/login/')
-async def login(creds: schema.Login, db: Session = Depends(get_db)):
+async def login(creds: schema.Login, db: AsyncSession = Depends(get_db)):
     try:
-        user = utils.get_user_by_email(email=creds.email, db=db)
+        user = await utils.get_user_by_email(email=creds.email, db=db)
         
         if not user:
             raise HTTPException(status_code=400, detail="User does not exist")
         
-        if not security.verify_hash(plain_text=creds.password, hashed_password=user.password):
+        verified, new_hash = await security.verify_password(plain_text=creds.password, hashed_password=user.password)
+        if not verified:
             raise HTTPException(status_code=400, detail="Invalid Credentials")
+
+        if new_hash:
+            await utils.update_password_hash(db=db, id=user.id, hashed_password=new_hash)
         
         token = security.generate_access_token(data={'user_id': user.id})
+        refresh_token = await utils.create_refresh_token(db=db, user_id=user.id)
         
-        return {'status': True, 'user_details':schema.User.to_dict(user).model_dump(), 'access_token': token, 'token_type': 'bearer'}
+        return {'status': True, 'user_details':schema.User.to_dict(user).model_dump(), 'access_token': token, 'refresh_token': refresh_token, 'token_type': 'bearer'}
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+@router.post('/refresh-token/')
+async def refresh_token(token: schema.RefreshToken, db: AsyncSession = Depends(get_db)):
+    # a new access token without checking the password again; the refresh token is
+    # spent and replaced, so the client must keep the one returned here
+    try:
+        rotated = await utils.rotate_refresh_token(db=db, token=token.refresh_token)
+        if rotated is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+
+        user_id, new_refresh_token = rotated
+        access_token = security.generate_access_token(data={'user_id': user_id})
+
+        return {'status': True, 'access_token': access_token, 'refresh_token': new_refresh_token, 'token_type': 'bearer'}
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
+
+@router.post('/logout/')
+async def logout(token: schema.RefreshToken, db: AsyncSession = Depends(get_db)):
+    try:
+        await utils.revoke_refresh_token(db=db, token=token.refresh_token)
+        return {'status': True}
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
     
 @router.post('/reset-password/')
 async def reset_password(password_change: schema.PasswordChange, 
-                         db: Session = Depends(get_db), 
-                         current_user_id = Depends(security.get_current_user)):
-    user = utils.get_user(db=db, user_id=current_user_id.id)
+                         db: AsyncSession = Depends(get_db), 
+                         user = Depends(security.get_authenticated_user)):
 
     #TODO:This
     return {'message': 'will implement later'}
@@ -75,21 +124,21 @@ async def reset_password(password_change: schema.PasswordChange,
 
 @router.put('/set-working-period')
 async def set_working_period(work_period: schema.WorkPeriod, 
-                             db: Session = Depends(get_db), 
-                             current_user_id = Depends(security.get_current_user)):
+                             db: AsyncSession = Depends(get_db), 
+                             current_user = Depends(security.get_authenticated_user)):
     try:
-        current_user = utils.get_user(db=db, user_id=current_user_id.id)
-        
-        if (current_user.role.name == 'admin') or (current_user.role.name == 'hr'):
-            user = utils.get_user(db=db, user_id=work_period.user_id)
+        if (office_utils.role_name(current_user) == 'admin') or (office_utils.role_name(current_user) == 'hr'):
+            user = await utils.get_user(db=db, user_id=work_period.user_id)
             start_time = work_period.start_time
             end_time = work_period.end_time
 
             user.resumption_time = time(hour=int(start_time.split(':')[0]), minute=int(start_time.split(':')[1]))
             user.closing_time = time(hour=int(end_time.split(':')[0]), minute=int(end_time.split(':')[1]))
+            await utils.touch_directory(db=db)
 
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
+            utils.user_cache.pop(user.id)
 
             user_dict = schema.BaseUser.to_dict(user).model_dump()
             return Response(status_code=201, content=json.dumps({'message':'user working period updated successfully', 'details':user_dict}))
@@ -100,33 +149,47 @@ async def set_working_period(work_period: schema.WorkPeriod,
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
 
 @router.get('/get-users')
-async def get_users(db: Session = Depends(get_db),
+async def get_users(request: Request,
+                    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+                    cursor: Optional[str] = None,
+                    db: AsyncSession = Depends(get_read_db),
                     current_user_id = Depends(security.get_current_user)):
     try:
-        db_users = utils.get_users(db=db, user_id=current_user_id.id)
+        tag = etags.etag('users', current_user_id.id, await utils.get_directory_version(db=db), limit, cursor)
+        if etags.not_modified(request, tag):
+            return Response(status_code=304, headers=etags.etag_header(tag))
+
+        db_users, next_cursor = await utils.get_users(db=db, user_id=current_user_id.id, cursor=cursor, limit=limit)
         users = [schema.User.to_dict(db_item=user).model_dump() for user in db_users]
         
-        return Response(status_code=200, content=json.dumps(users))
+        return Response(status_code=200, content=json.dumps(users), headers=etags.etag_header(tag, pagination.next_cursor_header(next_cursor)))
     except Exception as e:
         raise HTTPException(status_code=400, detail=json.dumps({'message':'An Error Occured', 'error': str(e)}))
 
 @router.patch('/edit-user-role')
 async def edit_role(data: schema.EditUserRole,
-                    db:Session = Depends(get_db),
-                    current_user_id = Depends(security.get_current_user)
+                    db:AsyncSession = Depends(get_db),
+                    user = Depends(security.get_authenticated_user)
 ):
     try:
-        user = utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name not in ['admin', 'hr']:
+        if office_utils.role_name(user) not in ['admin', 'hr']:
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
 
-        edit_user = utils.get_user(db=db, user_id=data.user_id)
-        edit_user.role = office_utils.get_office_by_name(db=db, name=data.role)
+        edit_user = await utils.get_user(db=db, user_id=data.user_id)
+        if edit_user is None:
+            raise ValueError('User not found')
+        office = await office_utils.get_office_by_name(db=db, name=data.role)
+        if office is None:
+            raise ValueError(f'No office named {data.role}')
+        edit_user.role_id = office.id
         
-        user.updated_at = func.now()
-        db.commit()
+        edit_user.updated_at = func.now()
+        await utils.touch_directory(db=db)
+        await jobs_utils.notify(db=db, user_ids=[edit_user.id], subject='Your role has changed',
+                                text=f'Your role is now {data.role}.')
+        await db.commit()
+        utils.user_cache.pop(edit_user.id)
 
-        # TODO: Notify user or take any other necessary action
         return Response(status_code=200, content=json.dumps({'message':'User Data Updated Successfully'}))
 
     except Exception as e:
@@ -134,14 +197,15 @@ async def edit_role(data: schema.EditUserRole,
 
 @router.patch('/edit-user-details')
 async def edit_data(edit_user: schema.EditUser,
-                    db:Session = Depends(get_db),
-                    current_user_id = Depends(security.get_current_user)):
+                    db:AsyncSession = Depends(get_db),
+                    l_user = Depends(security.get_authenticated_user)):
     try:
-        l_user = utils.get_user(db=db, user_id=current_user_id.id)
-        if l_user.role.name not in ['admin', 'hr']:
+        if office_utils.role_name(l_user) not in ['admin', 'hr']:
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
 
-        user = utils.get_user(db=db, user_id=edit_user.user_id)
+        user = await utils.get_user(db=db, user_id=edit_user.user_id)
+        if user is None:
+            raise ValueError('User not found')
         if edit_user.first_name is not None:
             user.first_name = edit_user.first_name
         if edit_user.last_name is not None:
@@ -151,13 +215,19 @@ async def edit_data(edit_user: schema.EditUser,
         if edit_user.phone is not None:
             user.phone = edit_user.phone
         if edit_user.role is not None:
-            user.role_id = office_utils.get_office_by_name(db=db, name=edit_user.role).id
+            office = await office_utils.get_office_by_name(db=db, name=edit_user.role)
+            if office is None:
+                raise ValueError(f'No office named {edit_user.role}')
+            user.role_id = office.id
         
         user.updated_at = func.now()
+        await utils.touch_directory(db=db)
+        await jobs_utils.notify(db=db, user_ids=[user.id], subject='Your details have been updated',
+                                text='Your account details were updated by an administrator.')
 
-        db.commit()
+        await db.commit()
+        utils.user_cache.pop(user.id)
 
-        # TODO: Notify user or take any other necessary action
         return Response(status_code=200, content=json.dumps({'message':'User Role Updated Successfully'}))
 
     except Exception as e:
@@ -165,19 +235,23 @@ async def edit_data(edit_user: schema.EditUser,
 
 @router.delete('/user')
 async def delete_user(data: schema.DeleteUser,
-                    db:Session = Depends(get_db),
-                    current_user_id = Depends(security.get_current_user)):
+                    db:AsyncSession = Depends(get_db),
+                    user = Depends(security.get_authenticated_user)):
     try:
-        user = utils.get_user(db=db, user_id=current_user_id.id)
-        if user.role.name not in ['admin', 'hr']:
+        if office_utils.role_name(user) not in ['admin', 'hr']:
             raise HTTPException(status_code=401, detail=json.dumps({'message':'Unauthorized. Must be Hr or Admin'}))
 
-        del_user = db.query(model.User).filter(model.User.id == data.user_id).first()
+        del_user = await db.get(model.User, data.user_id)
 
-        db.delete(del_user)
-        db.commit()
+        # their own mailbox entries cascade, the copies in their recipients' mailboxes don't
+        await message_utils.remove_sent_from_mailboxes(db=db, sender_id=data.user_id)
+        await db.delete(del_user)
+        await utils.touch_directory(db=db)
+        # their documents went with them, a job removes the files once this commits
+        await jobs_utils.enqueue(db=db, kind='reap_uploads')
+        await db.commit()
+        utils.user_cache.pop(data.user_id)
 
-        # TODO: Notify user or take any other necessary action
         return Response(status_code=200, content=json.dumps({'message':'User Deleted Successfully'}))
 
     except Exception as e:
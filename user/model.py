@@ -1,4 +1,4 @@
-from sqlalchemy import String, Column, DateTime, func, BigInteger, Time, ForeignKey
+from sqlalchemy import String, Column, DateTime, func, Integer, BigInteger, Time, ForeignKey
 from sqlalchemy.orm import relationship
 from config.database import Base
 from message.model import (message_recipients_association, 
@@ -16,7 +16,7 @@ class User(Base):
     phone = Column(String, unique=True, nullable=True)
     password = Column(String, nullable=False)
     created_at = Column(DateTime, nullable=False, default=func.now())
-    updated_at = Column(DateTime, nullable=False, default=func.now())
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
     role_id = Column(BigInteger, ForeignKey('offices.id', ondelete='CASCADE'))
     resumption_time = Column(Time, nullable=True)
     closing_time = Column(Time, nullable=True)
@@ -34,3 +34,22 @@ class User(Base):
     role = relationship("Office", back_populates="staff")
     department_head = relationship('OfficeHead', back_populates='user', cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="sender", foreign_keys="[Comment.sender_id]", cascade="all, delete-orphan")
+
+class DirectoryVersion(Base):
+    # a single row, bumped in the same transaction as every change to what the
+    # user directory shows (user.utils.touch_directory); the ETags of
+    # /user/get-users and of the mailboxes, which show names, depend on it
+    __tablename__ = 'directory_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+class RefreshToken(Base):
+    __tablename__ = 'refresh_tokens'
+
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    # sha256 of the token handed to the client, the token itself is never stored
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.now())
@@ -53,6 +53,9 @@ class Login(BaseModel):
     email: str
     password: str
 
+class RefreshToken(BaseModel):
+    refresh_token: str
+
 class PasswordChange(BaseModel):
     old_password: str
     new_password: str
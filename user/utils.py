@@ -1,58 +1,262 @@
-from sqlalchemy.orm import Session
+import os
+import io
+import hashlib
+import secrets
+import csv
+import json
+from datetime import time, datetime, timedelta
+from pydantic import ValidationError
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from user import model
 from user import schema
 from config import security
 from office import utils as office_utils
+from helpers.cache import TTLCache
+from helpers import pagination
 
+# authenticated users, shared by the requests of one worker; their role name
+# comes from the office registry (office_utils.role_name), not a join
+user_cache = TTLCache(maxsize=int(os.environ.get('USER_CACHE_SIZE', 1024)),
+                      ttl=float(os.environ.get('USER_CACHE_TTL_SECONDS', 30)))
 
-def get_user(db: Session, user_id):
+
+async def get_user(db: AsyncSession, user_id):
     try:
-        user = db.query(model.User).filter(model.User.id == user_id).first()
-        return user
+        result = await db.execute(select(model.User).options(joinedload(model.User.role)).where(model.User.id == user_id))
+        return result.scalars().first()
     except Exception as e:
         raise e
 
-def create_user(db: Session, user: schema.CreateUser):
+async def get_cached_user(db: AsyncSession, user_id):
     try:
-        hash_password = security.hash_string(user.password)
-        result = model.User(first_name = user.first_name, 
-                            last_name = user.last_name, 
-                            email = user.email, 
-                            password = hash_password, 
-                            phone = user.phone, 
-                            role_id=office_utils.get_office_by_name(db=db, name=user.role).id,
+        await office_utils.ensure_offices(db=db)
+        user = user_cache.get(user_id)
+        if user is None:
+            user = (await db.execute(select(model.User).where(model.User.id == user_id))).scalars().first()
+            if user is None:
+                return None
+            # the cache keeps a detached copy, every request works on its own merged one
+            db.expunge(user)
+            user_cache.set(user_id, user)
+
+        return await db.merge(user, load=False)
+    except Exception as e:
+        raise e
+
+async def create_user(db: AsyncSession, user: schema.CreateUser):
+    try:
+        hash_password = await security.hash_password(user.password)
+        office = await office_utils.get_office_by_name(db=db, name=user.role)
+        if office is None:
+            raise ValueError(f'No office named {user.role}')
+        result = model.User(first_name = user.first_name,
+                            last_name = user.last_name,
+                            email = user.email,
+                            password = hash_password,
+                            phone = user.phone,
+                            role_id=office.id,
                             resumption_time=user.resumption_time,
                             closing_time=user.closing_time)
         db.add(result)
-        db.commit()
-        db.refresh(result)
-        
-        return result
+        await touch_directory(db=db)
+        await db.commit()
+
+        return await get_user(db=db, user_id=result.id)
     except Exception as e:
         raise e
 
-def get_user_by_email(db: Session, email: str):
+async def get_user_by_email(db: AsyncSession, email: str):
     try:
-        db_user = db.query(model.User).filter(model.User.email == email).first()
-        
-        return db_user
+        result = await db.execute(select(model.User).options(joinedload(model.User.role)).where(model.User.email == email))
+
+        return result.scalars().first()
+    except Exception as e:
+        raise e
+
+async def get_user_ids_by_emails(db: AsyncSession, emails):
+    # email -> id for every address that belongs to a user, in one query
+    try:
+        if not emails:
+            return {}
+        result = await db.execute(select(model.User.email, model.User.id).where(model.User.email.in_(emails)))
+        return dict(result.all())
     except Exception as e:
         raise e
 
-def change_password(db: Session, password: str, id):
+async def change_password(db: AsyncSession, password: str, id):
     try:
-        hash_password = security.hash_string(password)
-        result = db.query(model.User).filter(model.User.id == id)
-        result.update({'password': hash_password}, synchronize_session = False)
-        db.commit()
-        result.first()
+        hash_password = await security.hash_password(password)
+        await db.execute(update(model.User).where(model.User.id == id).values(password=hash_password))
+        # signed in devices have to log in again with the new password
+        await db.execute(delete(model.RefreshToken).where(model.RefreshToken.user_id == id))
+        await db.commit()
         return True
     except Exception as e:
         raise e
 
-def get_users(db: Session, user_id):
+async def update_password_hash(db: AsyncSession, id, hashed_password: str):
+    # stores a rehash of the same password, made with the current hash settings
+    try:
+        await db.execute(update(model.User).where(model.User.id == id).values(password=hashed_password))
+        await db.commit()
+    except Exception as e:
+        raise e
+
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def create_refresh_token(db: AsyncSession, user_id):
+    try:
+        token = secrets.token_urlsafe(32)
+        # a login is a good time to forget the user's expired tokens
+        await db.execute(delete(model.RefreshToken).where(model.RefreshToken.user_id == user_id,
+                                                          model.RefreshToken.expires_at <= datetime.now()))
+        db.add(model.RefreshToken(user_id=user_id,
+                                  token_hash=hash_refresh_token(token),
+                                  expires_at=datetime.now() + timedelta(days=security.REFRESH_TOKEN_EXPIRE_DAYS)))
+        await db.commit()
+        return token
+    except Exception as e:
+        raise e
+
+async def rotate_refresh_token(db: AsyncSession, token: str):
+    # spends the token in one indexed delete, so it works once even under concurrent use,
+    # and hands out its replacement; returns (user id, new token) or None
+    try:
+        query = (delete(model.RefreshToken)
+                 .where(model.RefreshToken.token_hash == hash_refresh_token(token), model.RefreshToken.expires_at > datetime.now())
+                 .returning(model.RefreshToken.user_id))
+        user_id = (await db.execute(query)).scalar()
+        if user_id is None:
+            await db.rollback()
+            return None
+
+        new_token = secrets.token_urlsafe(32)
+        db.add(model.RefreshToken(user_id=user_id,
+                                  token_hash=hash_refresh_token(new_token),
+                                  expires_at=datetime.now() + timedelta(days=security.REFRESH_TOKEN_EXPIRE_DAYS)))
+        await db.commit()
+        return user_id, new_token
+    except Exception as e:
+        raise e
+
+async def revoke_refresh_token(db: AsyncSession, token: str):
     try:
-        users = db.query(model.User).filter(model.User.id != user_id).all()
-        return users
+        await db.execute(delete(model.RefreshToken).where(model.RefreshToken.token_hash == hash_refresh_token(token)))
+        await db.commit()
     except Exception as e:
-        raise e
\ No newline at end of file
+        raise e
+
+async def get_users(db: AsyncSession, user_id, cursor: str = None, limit: int = pagination.DEFAULT_LIMIT):
+    try:
+        query = select(model.User).options(joinedload(model.User.role)).where(model.User.id != user_id)
+        query = pagination.keyset(query, model.User, pagination.decode_cursor(cursor).get('items'), limit)
+        rows, position = pagination.split_page((await db.execute(query)).scalars().all(), limit)
+        return rows, pagination.encode_cursor({'items': position} if position else None)
+    except Exception as e:
+        raise e
+
+async def touch_directory(db: AsyncSession):
+    # part of the caller's transaction, whenever a user is added, edited or removed;
+    # the row stays locked until it commits, so these writes take turns, they are rare
+    try:
+        await db.execute(insert(model.DirectoryVersion).values(id=1, version=1)
+                         .on_conflict_do_update(index_elements=[model.DirectoryVersion.id],
+                                                set_={'version': model.DirectoryVersion.version + 1}))
+    except Exception as e:
+        raise e
+
+async def get_directory_version(db: AsyncSession):
+    try:
+        return (await db.execute(select(model.DirectoryVersion.version))).scalar() or 0
+    except Exception as e:
+        raise e
+
+def read_bulk_rows(content_type: str, body: bytes):
+    # a csv with a header row named like the signup fields, or a json list of signup objects
+    if 'csv' in content_type:
+        return list(csv.DictReader(io.StringIO(body.decode('utf-8-sig'))))
+
+    rows = json.loads(body)
+    if not isinstance(rows, list):
+        raise ValueError('Expected a list of users')
+    return rows
+
+def parse_work_time(value):
+    if value is None or isinstance(value, time):
+        return value
+    return time(hour=int(value.split(':')[0]), minute=int(value.split(':')[1]))
+
+async def create_users(db: AsyncSession, rows: list):
+    # validates every row first and only inserts when all of them are valid;
+    # returns one result per row and whether the users were created
+    try:
+        results, users = [], []
+        for number, row in enumerate(rows, start=1):
+            result = {'row': number, 'email': row.get('email') if isinstance(row, dict) else None, 'errors': []}
+            user = None
+            try:
+                # empty csv cells count as missing
+                user = schema.CreateUser(**{key: value for key, value in row.items() if value not in ('', None)})
+                user.resumption_time = parse_work_time(user.resumption_time)
+                user.closing_time = parse_work_time(user.closing_time)
+            except ValidationError as e:
+                result['errors'] += [f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()]
+                user = None
+            except (AttributeError, TypeError, ValueError, IndexError) as e:
+                result['errors'].append(f'invalid row: {e}' if user is None else 'resumption_time and closing_time must be HH:MM')
+                user = None
+            results.append(result)
+            users.append(user)
+
+        valid = [(result, user) for result, user in zip(results, users) if user is not None]
+
+        # batch wide checks, one query each, offices come from the registry
+        emails = [user.email for _, user in valid]
+        phones = [user.phone for _, user in valid]
+        taken_emails = set(await get_user_ids_by_emails(db=db, emails=emails))
+        taken_phones = set((await db.execute(select(model.User.phone).where(model.User.phone.in_(phones)))).scalars().all()) if phones else set()
+        offices = {}
+        for name in {user.role for _, user in valid}:
+            office = await office_utils.get_office_by_name(db=db, name=name)
+            if office is not None:
+                offices[name] = office.id
+
+        seen_emails, seen_phones = set(), set()
+        for result, user in valid:
+            if user.email in taken_emails:
+                result['errors'].append('email already registered')
+            elif user.email in seen_emails:
+                result['errors'].append('email repeated in this batch')
+            if user.phone in taken_phones:
+                result['errors'].append('phone already registered')
+            elif user.phone in seen_phones:
+                result['errors'].append('phone repeated in this batch')
+            if user.role not in offices:
+                result['errors'].append(f'no office named {user.role}')
+            seen_emails.add(user.email)
+            seen_phones.add(user.phone)
+
+        if not rows or any(result['errors'] for result in results):
+            return results, False
+
+        passwords = await security.hash_strings([user.password for user in users])
+        created = await db.execute(insert(model.User).returning(model.User.id, sort_by_parameter_order=True),
+                                   [{'first_name': user.first_name,
+                                     'last_name': user.last_name,
+                                     'email': user.email,
+                                     'password': password,
+                                     'phone': user.phone,
+                                     'role_id': offices[user.role],
+                                     'resumption_time': user.resumption_time,
+                                     'closing_time': user.closing_time} for user, password in zip(users, passwords)])
+        for result, user_id in zip(results, created.scalars().all()):
+            result['id'] = user_id
+        await touch_directory(db=db)
+        await db.commit()
+        return results, True
+    except Exception as e:
+        raise e